@@ -0,0 +1,146 @@
+import json
+import datetime
+from contextlib import closing
+# pandas solo alle letture per i grafici: l'aggiornamento incrementale usa solo sqlite
+
+# Granularità degli aggregati e chiave del periodo per una data
+PERIODI = {
+    "giorno": lambda g: g.isoformat(),
+    "settimana": lambda g: "{0}-W{1:02d}".format(*g.isocalendar()),
+    "mese": lambda g: f"{g:%Y-%m}",
+}
+MISURE_ATTIVITA = ("attivita", "distanza", "durata", "calorie", "somma_fc", "attivita_fc")
+MISURE_SONNO = ("notti_voto", "somma_voto", "notti_ore", "somma_ore", "notti_bb", "somma_bb")
+
+def prepara_tabelle(conn):
+    """Tabelle degli aggregati nel magazzino locale. Si tengono somme e conteggi (non medie)
+    così che ogni riga si possa aggiungere o stornare senza rileggere lo storico."""
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS _aggregati_attivita (
+        periodo TEXT, chiave TEXT, tipo TEXT, {", ".join(m + " REAL DEFAULT 0" for m in MISURE_ATTIVITA)},
+        PRIMARY KEY (periodo, chiave, tipo))""")
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS _aggregati_sonno (
+        periodo TEXT, chiave TEXT, {", ".join(m + " REAL DEFAULT 0" for m in MISURE_SONNO)},
+        PRIMARY KEY (periodo, chiave))""")
+    # Ultimo contributo registrato per ogni riga sorgente (ID attività o giornata di sonno)
+    conn.execute("""CREATE TABLE IF NOT EXISTS _aggregati_registro (
+        foglio TEXT, chiave TEXT, contributo TEXT, PRIMARY KEY (foglio, chiave))""")
+
+def _numero(valore):
+    try:
+        numero = float(valore)
+    except (TypeError, ValueError):
+        return None
+    return numero if numero == numero else None
+
+def _giorno(valore):
+    try:
+        return datetime.date.fromisoformat(str(valore)[:10])
+    except ValueError:
+        return None
+
+def _contributo_attivita(record):
+    giorno = _giorno(record.get("Data_Ora"))
+    if giorno is None:
+        return None
+    fc = _numero(record.get("FC_Media")) or 0
+    return [giorno.isoformat(), str(record.get("Tipo") or "Sconosciuto"), [
+        1, _numero(record.get("Distanza_km")) or 0, _numero(record.get("Durata_min")) or 0,
+        _numero(record.get("Calorie")) or 0, fc, 1 if fc > 0 else 0]]
+
+def _contributo_sonno(record):
+    giorno = _giorno(record.get("Data"))
+    if giorno is None:
+        return None
+    misure = []
+    for colonna, minimo in (("Voto_Sonno", 0), ("Ore_Totali", 0), ("Body_Battery", 1)):
+        valore = _numero(record.get(colonna))
+        # Body Battery a 0 equivale a dato mancante (come nella dashboard)
+        misure += [1, valore] if valore is not None and valore >= minimo else [0, 0]
+    return [giorno.isoformat(), None, misure]
+
+def _applica(conn, foglio, contributo, segno):
+    giorno, tipo, misure = contributo
+    giorno = datetime.date.fromisoformat(giorno)
+    tabella, nomi = (("_aggregati_attivita", MISURE_ATTIVITA) if foglio == "Attivita"
+                     else ("_aggregati_sonno", MISURE_SONNO))
+    chiavi = ["periodo", "chiave"] + (["tipo"] if foglio == "Attivita" else [])
+    aggiornamento = ", ".join(f"{m} = {m} + excluded.{m}" for m in nomi)
+    sql = (f"INSERT INTO {tabella} ({', '.join(chiavi + list(nomi))}) "
+           f"VALUES ({', '.join('?' * (len(chiavi) + len(nomi)))}) "
+           f"ON CONFLICT ({', '.join(chiavi)}) DO UPDATE SET {aggiornamento}")
+    for periodo, formato in PERIODI.items():
+        identificativo = [periodo, formato(giorno)] + ([tipo] if foglio == "Attivita" else [])
+        conn.execute(sql, identificativo + [segno * m for m in misure])
+
+def aggiorna_aggregati(conn, foglio, record):
+    """Integra righe nuove o modificate del foglio ('Attivita' o 'Sonno') negli aggregati:
+    per ciascuna si storna il contributo precedente e si somma quello nuovo.
+    Righe identiche a quelle già registrate non toccano le tabelle. Ritorna le righe applicate."""
+    if foglio == "Attivita":
+        calcola, chiave = _contributo_attivita, lambda r: str(r.get("ID_Attivita", ""))
+    elif foglio == "Sonno":
+        # Più righe per la stessa giornata (ricaricamenti): vale l'ultima
+        calcola, chiave = _contributo_sonno, lambda r: str(r.get("Data", ""))[:10]
+    else:
+        return 0
+
+    prepara_tabelle(conn)
+    applicate = 0
+    for riga in record:
+        contributo = calcola(riga)
+        if contributo is None or not chiave(riga):
+            continue
+        precedente = conn.execute("SELECT contributo FROM _aggregati_registro WHERE foglio = ? AND chiave = ?",
+                                  (foglio, chiave(riga))).fetchone()
+        precedente = json.loads(precedente[0]) if precedente else None
+        if precedente == contributo:
+            continue
+        if precedente:
+            _applica(conn, foglio, precedente, -1)
+        _applica(conn, foglio, contributo, 1)
+        conn.execute("INSERT OR REPLACE INTO _aggregati_registro VALUES (?, ?, ?)",
+                     (foglio, chiave(riga), json.dumps(contributo)))
+        applicate += 1
+    conn.commit()
+    return applicate
+
+def azzera_aggregati(conn, foglio):
+    """Svuota gli aggregati del foglio (prima di una ricostruzione completa)."""
+    if foglio not in ("Attivita", "Sonno"):
+        return
+    prepara_tabelle(conn)
+    conn.execute("DELETE FROM _aggregati_registro WHERE foglio = ?", (foglio,))
+    conn.execute("DELETE FROM _aggregati_attivita" if foglio == "Attivita" else "DELETE FROM _aggregati_sonno")
+    conn.commit()
+
+def leggi_aggregati_attivita(periodo, filtro_tipo=None, percorso=None):
+    """Volumi per periodo ('giorno', 'settimana', 'mese'), opzionalmente sommati sui tipi
+    che contengono filtro_tipo (es. 'running'). Poche centinaia di righe pronte per i grafici."""
+    import pandas as pd
+    from magazzino_locale import apri_magazzino, FILE_MAGAZZINO
+    with closing(apri_magazzino(percorso or FILE_MAGAZZINO)) as conn:
+        prepara_tabelle(conn)
+        raggruppa = "'" + filtro_tipo.replace("'", "''") + "'" if filtro_tipo else "tipo"
+        filtro = "AND tipo LIKE ?" if filtro_tipo else ""
+        parametri = [periodo] + ([f"%{filtro_tipo}%"] if filtro_tipo else [])
+        return pd.read_sql_query(f"""
+            SELECT chiave AS Periodo, {raggruppa} AS Tipo, SUM(attivita) AS Attivita,
+                   ROUND(SUM(distanza), 2) AS Distanza_km, ROUND(SUM(durata), 1) AS Durata_min,
+                   SUM(calorie) AS Calorie,
+                   ROUND(SUM(somma_fc) / NULLIF(SUM(attivita_fc), 0), 1) AS FC_Media
+            FROM _aggregati_attivita WHERE periodo = ? {filtro}
+            GROUP BY chiave, {raggruppa} HAVING SUM(attivita) > 0 ORDER BY chiave""", conn, params=parametri)
+
+def leggi_aggregati_sonno(periodo, percorso=None):
+    """Medie di voto sonno, ore e Body Battery per periodo."""
+    import pandas as pd
+    from magazzino_locale import apri_magazzino, FILE_MAGAZZINO
+    with closing(apri_magazzino(percorso or FILE_MAGAZZINO)) as conn:
+        prepara_tabelle(conn)
+        return pd.read_sql_query("""
+            SELECT chiave AS Periodo,
+                   ROUND(somma_voto / NULLIF(notti_voto, 0), 1) AS Voto_Sonno_Medio,
+                   ROUND(somma_ore / NULLIF(notti_ore, 0), 2) AS Ore_Medie,
+                   ROUND(somma_bb / NULLIF(notti_bb, 0), 1) AS Body_Battery_Media
+            FROM _aggregati_sonno WHERE periodo = ? AND (notti_voto + notti_ore + notti_bb) > 0
+            ORDER BY chiave""", conn, params=[periodo])
@@ -0,0 +1,157 @@
+import os
+import re
+import sys
+import gzip
+import json
+import hashlib
+import datetime
+import threading
+
+CARTELLA_STAGING = "dati_grezzi"
+# File piatti della versione precedente: sonno_2024-01-31.json, body_battery_..., attivita_...
+FORMATO_LEGACY = re.compile(r"^(?P<metrica>[a-z_]+)_(?P<giorno>\d{4}-\d{2}-\d{2})\.json$")
+
+_lock = threading.Lock()
+_lock_partizioni = {}
+# percorso -> (firma del file, hash noti, ultimo hash per giorno). La firma (mtime, dimensione)
+# fa rileggere la partizione se un altro processo l'ha modificata nel frattempo
+_hash_noti = {}
+
+def _percorso(metrica, giorno):
+    """Partizione mensile per metrica: dati_grezzi/<metrica>/<anno>/<anno-mese>.ndjson.gz"""
+    return os.path.join(CARTELLA_STAGING, metrica, f"{giorno:%Y}", f"{giorno:%Y-%m}.ndjson.gz")
+
+def _lock_partizione(percorso):
+    with _lock:
+        return _lock_partizioni.setdefault(percorso, threading.Lock())
+
+def _righe(percorso):
+    """Lettura in streaming di una partizione (gzip multi-membro, un record JSON per riga)."""
+    if not os.path.exists(percorso):
+        return
+    with gzip.open(percorso, 'rt', encoding='utf-8') as f:
+        for riga in f:
+            if riga.strip():
+                yield json.loads(riga)
+
+def _firma(percorso):
+    try:
+        stat = os.stat(percorso)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def _impronta(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:32]
+
+def salva_grezzo(metrica, giorno, payload):
+    """Accoda il payload della giornata alla partizione compressa. Un payload identico a uno già
+    presente nella partizione viene salvato come semplice riferimento al suo hash.
+    Ritorna False se per quella giornata era già registrata la stessa versione."""
+    if isinstance(giorno, str):
+        giorno = datetime.date.fromisoformat(giorno)
+    percorso = _percorso(metrica, giorno)
+    impronta = _impronta(payload)
+
+    with _lock_partizione(percorso):
+        firma = _firma(percorso)
+        if percorso not in _hash_noti or _hash_noti[percorso][0] != firma:
+            noti, ultimo_per_giorno = set(), {}
+            for record in _righe(percorso):
+                noti.add(record["hash"])
+                ultimo_per_giorno[record["giorno"]] = record["hash"]
+            _hash_noti[percorso] = (firma, noti, ultimo_per_giorno)
+        _, noti, ultimo_per_giorno = _hash_noti[percorso]
+
+        if ultimo_per_giorno.get(giorno.isoformat()) == impronta:
+            return False
+
+        record = {"giorno": giorno.isoformat(), "hash": impronta}
+        if impronta not in noti:
+            record["payload"] = payload
+        os.makedirs(os.path.dirname(percorso), exist_ok=True)
+        # Ogni append diventa un nuovo membro gzip: il file resta leggibile come stream unico
+        with gzip.open(percorso, 'at', encoding='utf-8', compresslevel=6) as f:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        noti.add(impronta)
+        ultimo_per_giorno[giorno.isoformat()] = impronta
+        _hash_noti[percorso] = (_firma(percorso), noti, ultimo_per_giorno)
+    return True
+
+def _mesi(dal, al):
+    mese = dal.replace(day=1)
+    while mese <= al:
+        yield mese
+        mese = (mese + datetime.timedelta(days=32)).replace(day=1)
+
+def itera(metrica, dal, al):
+    """Genera (giorno, payload) in ordine di data per [dal, al], una partizione alla volta:
+    in memoria resta al più un mese. Per ogni giornata vale l'ultima versione salvata."""
+    for mese in _mesi(dal, al):
+        payload_per_hash, ultimo_per_giorno = {}, {}
+        for record in _righe(_percorso(metrica, mese)):
+            if "payload" in record:
+                payload_per_hash[record["hash"]] = record["payload"]
+            giorno = datetime.date.fromisoformat(record["giorno"])
+            if dal <= giorno <= al:
+                ultimo_per_giorno[giorno] = record["hash"]
+        for giorno in sorted(ultimo_per_giorno):
+            yield giorno, payload_per_hash.get(ultimo_per_giorno[giorno])
+
+def leggi_giorno(metrica, giorno):
+    """Ultima versione del payload di una giornata, oppure None."""
+    for _, payload in itera(metrica, giorno, giorno):
+        return payload
+    return None
+
+def compatta(metrica):
+    """Riscrive ogni partizione della metrica come unico membro gzip, tenendo solo l'ultima
+    versione di ciascuna giornata (i molti piccoli append comprimono male singolarmente)."""
+    cartella = os.path.join(CARTELLA_STAGING, metrica)
+    for radice, _, file in os.walk(cartella):
+        for nome in file:
+            if not nome.endswith(".ndjson.gz"):
+                continue
+            percorso = os.path.join(radice, nome)
+            with _lock_partizione(percorso):
+                payload_per_hash, ultimo_per_giorno = {}, {}
+                for record in _righe(percorso):
+                    if "payload" in record:
+                        payload_per_hash[record["hash"]] = record["payload"]
+                    ultimo_per_giorno[record["giorno"]] = record["hash"]
+                scritti = set()
+                temporaneo = percorso + ".tmp"
+                with gzip.open(temporaneo, 'wt', encoding='utf-8', compresslevel=9) as f:
+                    for giorno in sorted(ultimo_per_giorno):
+                        impronta = ultimo_per_giorno[giorno]
+                        record = {"giorno": giorno, "hash": impronta}
+                        if impronta not in scritti:
+                            record["payload"] = payload_per_hash.get(impronta)
+                            scritti.add(impronta)
+                        f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+                os.replace(temporaneo, percorso)
+                _hash_noti.pop(percorso, None)
+
+def migra_legacy(cartella=CARTELLA_STAGING):
+    """Importa i vecchi file JSON piatti nell'archivio partizionato e li rimuove."""
+    migrati = 0
+    for nome in sorted(os.listdir(cartella)) if os.path.isdir(cartella) else []:
+        corrispondenza = FORMATO_LEGACY.match(nome)
+        if not corrispondenza:
+            continue
+        percorso = os.path.join(cartella, nome)
+        with open(percorso, 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+        salva_grezzo(corrispondenza["metrica"], corrispondenza["giorno"], payload)
+        os.remove(percorso)
+        migrati += 1
+    return migrati
+
+if __name__ == "__main__":
+    if "--migra" in sys.argv[1:]:
+        print(f"[SUCCESSO] {migra_legacy()} file JSON legacy migrati nell'archivio compresso.")
+    if "--compatta" in sys.argv[1:]:
+        for metrica in sorted(os.listdir(CARTELLA_STAGING)):
+            if os.path.isdir(os.path.join(CARTELLA_STAGING, metrica)):
+                compatta(metrica)
+        print("[SUCCESSO] Partizioni compattate.")
@@ -0,0 +1,176 @@
+import os
+import sys
+import json
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from estrattore import init_garmin, limitatore_garmin, e_throttling_garmin, contata
+from trasformatore import leggi_json
+from archivio_grezzi import salva_grezzo, itera
+from limitatore import con_ritentativi
+
+CARTELLA_STAGING = "dati_grezzi"
+# Log dei chunk completati, un chunk per riga: ogni completamento è un append, non una riscrittura
+FILE_CHECKPOINT = os.path.join(CARTELLA_STAGING, "backfill_checkpoint.jsonl")
+# Formato precedente (un unico JSON riscritto a ogni chunk): letto e assorbito alla compattazione
+FILE_CHECKPOINT_LEGACY = os.path.join(CARTELLA_STAGING, "backfill_checkpoint.json")
+
+def genera_chunk(dal, al):
+    """Suddivide l'intervallo in chunk giornalieri (sonno, body battery) e mensili (attività, paginate)."""
+    chunk = []
+    giorno = dal
+    while giorno <= al:
+        chunk.append(("sonno", giorno.isoformat(), giorno.isoformat()))
+        chunk.append(("body_battery", giorno.isoformat(), giorno.isoformat()))
+        giorno += datetime.timedelta(days=1)
+
+    inizio_mese = dal
+    while inizio_mese <= al:
+        mese_successivo = (inizio_mese.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        fine_mese = min(al, mese_successivo - datetime.timedelta(days=1))
+        chunk.append(("attivita", inizio_mese.isoformat(), fine_mese.isoformat()))
+        inizio_mese = mese_successivo
+    return chunk
+
+def chiave_chunk(chunk):
+    metrica, dal, al = chunk
+    return f"{metrica}:{dal}:{al}"
+
+def leggi_checkpoint():
+    dati = leggi_json(FILE_CHECKPOINT_LEGACY)
+    completati = set(dati.get("completati", [])) if dati else set()
+    try:
+        with open(FILE_CHECKPOINT, 'r', encoding='utf-8') as f:
+            for riga in f:
+                try:
+                    completati.add(json.loads(riga))
+                except json.JSONDecodeError:
+                    continue  # riga troncata da un'interruzione: quel chunk verrà riscaricato
+    except FileNotFoundError:
+        pass
+    return completati
+
+def apri_checkpoint():
+    """Log del checkpoint in append. Se l'ultima riga è rimasta troncata la si chiude,
+    così il prossimo chunk registrato non le si attacca."""
+    os.makedirs(CARTELLA_STAGING, exist_ok=True)
+    try:
+        with open(FILE_CHECKPOINT, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            troncato = f.read(1) != b"\n"
+    except OSError:
+        troncato = False  # file assente o vuoto
+    log = open(FILE_CHECKPOINT, 'a', encoding='utf-8')
+    if troncato:
+        log.write("\n")
+    return log
+
+def registra_chunk(log, chunk):
+    log.write(json.dumps(chiave_chunk(chunk)) + "\n")
+    log.flush()
+
+def compatta_checkpoint(completati):
+    """Riscrive il log senza duplicati né righe troncate e rimuove il checkpoint legacy.
+    Scrittura atomica: un'interruzione a metà non corrompe il checkpoint."""
+    os.makedirs(CARTELLA_STAGING, exist_ok=True)
+    temporaneo = FILE_CHECKPOINT + ".tmp"
+    with open(temporaneo, 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(chiave) + "\n" for chiave in sorted(completati))
+    os.replace(temporaneo, FILE_CHECKPOINT)
+    if os.path.exists(FILE_CHECKPOINT_LEGACY):
+        os.remove(FILE_CHECKPOINT_LEGACY)
+
+_lock_attivita = threading.Lock()
+
+def unisci_attivita_giornaliere(attivita):
+    """Archivia le attività per giornata, fondendole per activityId con quelle già in staging."""
+    per_giorno = {}
+    for act in attivita:
+        giorno = str(act.get("startTimeLocal", ""))[:10]
+        if giorno:
+            per_giorno.setdefault(giorno, []).append(act)
+
+    if not per_giorno:
+        return
+    with _lock_attivita:
+        # Una sola lettura delle partizioni mensili del chunk, non una per giornata
+        giorni = [datetime.date.fromisoformat(giorno) for giorno in per_giorno]
+        gia_archiviate = {g.isoformat(): payload for g, payload in itera("attivita", min(giorni), max(giorni))
+                          if g.isoformat() in per_giorno}
+        for giorno, nuove in per_giorno.items():
+            esistenti = {act.get("activityId"): act for act in (gia_archiviate.get(giorno) or [])}
+            esistenti.update({act.get("activityId"): act for act in nuove})
+            # Ordine Garmin: dalla più recente alla più vecchia
+            unite = sorted(esistenti.values(), key=lambda a: str(a.get("startTimeLocal", "")), reverse=True)
+            salva_grezzo("attivita", giorno, unite)
+
+def scarica_chunk(client, chunk):
+    metrica, dal, al = chunk
+    if metrica == "sonno":
+        dati = con_ritentativi(contata(lambda: client.get_sleep_data(dal)), e_throttling_garmin, limitatore=limitatore_garmin)
+        salva_grezzo("sonno", dal, dati)
+    elif metrica == "body_battery":
+        dati = con_ritentativi(contata(lambda: client.get_body_battery(dal)), e_throttling_garmin, limitatore=limitatore_garmin)
+        salva_grezzo("body_battery", dal, dati)
+    elif metrica == "attivita":
+        # Finestre per data invece che per offset: le pagine restano stabili tra un'esecuzione e l'altra
+        dati = con_ritentativi(contata(lambda: client.get_activities_by_date(dal, al)), e_throttling_garmin, limitatore=limitatore_garmin)
+        unisci_attivita_giornaliere(dati or [])
+
+def esegui_backfill(dal, al, max_workers=4, client=None):
+    """Importa lo storico [dal, al] in dati_grezzi, riprendendo dal checkpoint se presente."""
+    client = client or init_garmin()
+    if client is None:
+        return False
+
+    completati = leggi_checkpoint()
+    da_fare = [c for c in genera_chunk(dal, al) if chiave_chunk(c) not in completati]
+    print(f"--- Backfill {dal} -> {al}: {len(da_fare)} chunk da scaricare ({len(completati)} già completati) ---")
+
+    lock_checkpoint = threading.Lock()
+    falliti = 0
+    with apri_checkpoint() as log:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = {}
+        try:
+            futures = {executor.submit(scarica_chunk, client, c): c for c in da_fare}
+            for i, future in enumerate(as_completed(futures), 1):
+                chunk = futures[future]
+                try:
+                    future.result()
+                    with lock_checkpoint:
+                        completati.add(chiave_chunk(chunk))
+                        registra_chunk(log, chunk)
+                except Exception as e:
+                    falliti += 1
+                    print(f"[ERRORE CHUNK] {chiave_chunk(chunk)}: {e}")
+                if i % 50 == 0:
+                    print(f"... {i}/{len(da_fare)} chunk elaborati")
+        except BaseException:
+            # Ctrl+C o errore nel thread principale: i chunk in coda si annullano, si attendono
+            # solo quelli già avviati e quelli andati a buon fine restano nel checkpoint
+            print("\n[INTERRUZIONE] Backfill interrotto: annullo i chunk in coda...")
+            executor.shutdown(wait=True, cancel_futures=True)
+            for future, chunk in futures.items():
+                if (future.done() and not future.cancelled() and future.exception() is None
+                        and chiave_chunk(chunk) not in completati):
+                    completati.add(chiave_chunk(chunk))
+                    registra_chunk(log, chunk)
+            raise
+        executor.shutdown(wait=True)
+    compatta_checkpoint(completati)
+
+    if falliti:
+        print(f"\n[ATTENZIONE] {falliti} chunk falliti: rilanciare il backfill per riprendere dal checkpoint.")
+        return False
+    print("\n[SUCCESSO] Backfill completato!")
+    return True
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Uso: python backfill.py AAAA-MM-GG AAAA-MM-GG [worker]")
+        sys.exit(1)
+    dal = datetime.date.fromisoformat(sys.argv[1])
+    al = datetime.date.fromisoformat(sys.argv[2])
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    sys.exit(0 if esegui_backfill(dal, al, workers) else 1)
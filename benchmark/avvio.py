@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+import statistics
+import subprocess
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILE_BUDGET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "budget_avvio.json")
+RIPETIZIONI = 5
+# Margine oltre il budget prima di segnalare una regressione (rumore tra macchine ed esecuzioni)
+TOLLERANZA = 1.25
+
+# Scenari di avvio a freddo: ciascuno gira in un interprete nuovo, senza cache di moduli
+SCENARI = {
+    "import_cervello": "import cervello",
+    "import_orchestratore": "import orchestratore",
+    "import_estrattore": "import estrattore",
+    "import_trasformatore": "import trasformatore",
+    "import_caricatore": "import caricatore",
+    "import_connessione_sheets": "import connessione_sheets",
+    # Moduli di dati della dashboard: letture dal mirror senza gspread
+    "import_magazzino_locale": "import magazzino_locale",
+    # Avvio del cron: import più costruzione del grafo (senza eseguire le fasi)
+    "avvio_pipeline": "import datetime, orchestratore; orchestratore.costruisci_pipeline(datetime.date.today())",
+}
+
+def misura_scenario(codice, ripetizioni=RIPETIZIONI):
+    """Mediana in millisecondi del tempo di 'codice' in processi Python separati."""
+    sonda = ("import time; _t = time.perf_counter()\n" + codice +
+             "\nprint((time.perf_counter() - _t) * 1000)")
+    tempi = []
+    for _ in range(ripetizioni):
+        esito = subprocess.run([sys.executable, "-c", sonda], cwd=RADICE, capture_output=True, text=True, check=True)
+        tempi.append(float(esito.stdout.strip().splitlines()[-1]))
+    return statistics.median(tempi)
+
+def leggi_budget(percorso=FILE_BUDGET):
+    try:
+        with open(percorso, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def esegui(aggiorna_budget=False):
+    """Misura tutti gli scenari e li confronta col budget. Ritorna il numero di regressioni."""
+    budget = leggi_budget()
+    misure = {}
+    regressioni = 0
+    print(f"{'Scenario':<28}{'Mediana ms':>12}{'Budget ms':>12}  Esito")
+    for nome, codice in SCENARI.items():
+        misure[nome] = round(misura_scenario(codice), 1)
+        limite = budget.get(nome)
+        if limite is None:
+            esito = "senza budget"
+        elif misure[nome] > limite * TOLLERANZA:
+            esito, regressioni = "REGRESSIONE", regressioni + 1
+        else:
+            esito = "ok"
+        print(f"{nome:<28}{misure[nome]:>12.1f}{limite if limite is not None else '-':>12}  {esito}")
+
+    if aggiorna_budget:
+        with open(FILE_BUDGET, 'w', encoding='utf-8') as f:
+            json.dump(misure, f, indent=2)
+            f.write("\n")
+        print(f"Budget aggiornato in {FILE_BUDGET}")
+    return regressioni
+
+if __name__ == "__main__":
+    # python -m benchmark.avvio [--aggiorna-budget]
+    sys.exit(1 if esegui("--aggiorna-budget" in sys.argv[1:]) else 0)
@@ -0,0 +1,126 @@
+import random
+import datetime
+
+# Storico di riferimento (scala 1x): un mese; la scala 1000x corrisponde a circa 80 anni di dati
+GIORNI_BASE = 30
+TIPI_ATTIVITA = ["running", "trail_running", "cycling", "strength_training", "walking", "lap_swimming"]
+FEEDBACK_SONNO = ["POSITIVE_LONG_AND_DEEP", "POSITIVE_RESTFUL", "NEGATIVE_SHORT", "NEGATIVE_FRAGMENTED"]
+# Campionamento Body Battery di Garmin: un punto ogni 3 minuti
+PASSO_BB_MS = 180_000
+SCARTO_LOCALE_MS = 2 * 3_600_000
+
+
+def _rng(seme, *chiavi):
+    """Generatore indipendente per ogni (seme, chiave): payload identici a ogni esecuzione,
+    qualunque sia l'ordine in cui vengono richiesti."""
+    return random.Random(f"{seme}:" + ":".join(str(c) for c in chiavi))
+
+def _ms(giorno, ore=0.0):
+    mezzanotte = datetime.datetime.combine(giorno, datetime.time(), tzinfo=datetime.timezone.utc)
+    return int(mezzanotte.timestamp() * 1000 + ore * 3_600_000)
+
+def genera_sonno(giorno, seme=0):
+    """Payload di get_sleep_data: notte che termina la mattina di 'giorno'."""
+    rng = _rng(seme, "sonno", giorno)
+    ore = rng.gauss(7.2, 0.8)
+    fine = _ms(giorno, rng.uniform(5.0, 7.0))
+    return {"dailySleepDTO": {
+        "calendarDate": giorno.isoformat(),
+        "sleepTimeSeconds": int(ore * 3600),
+        "sleepStartTimestampGMT": fine - int(ore * 3_600_000),
+        "sleepEndTimestampGMT": fine,
+        "sleepScoreFeedback": rng.choice(FEEDBACK_SONNO),
+        "sleepScores": {"overall": {"value": max(30, min(100, int(rng.gauss(78, 10))))}},
+        "deepSleepSeconds": int(ore * 3600 * rng.uniform(0.15, 0.25)),
+        "remSleepSeconds": int(ore * 3600 * rng.uniform(0.18, 0.25)),
+    }}
+
+def genera_body_battery(giorno, seme=0):
+    """Payload di get_body_battery: un'intera giornata di campioni [timestamp_ms, valore]."""
+    rng = _rng(seme, "body_battery", giorno)
+    inizio = _ms(giorno)
+    valore = rng.uniform(20, 40)
+    campioni = []
+    for i in range(24 * 3_600_000 // PASSO_BB_MS):
+        ora = i * PASSO_BB_MS / 3_600_000
+        # Ricarica notturna, scarica diurna, qualche buco di misura come sul dispositivo reale
+        valore += rng.uniform(0.3, 0.9) if ora < 6.5 else -rng.uniform(0.05, 0.35)
+        valore = max(5, min(100, valore))
+        campioni.append([inizio + i * PASSO_BB_MS, None if rng.random() < 0.01 else int(valore)])
+    return [{
+        "date": giorno.isoformat(),
+        "charged": int(rng.uniform(40, 70)),
+        "drained": int(rng.uniform(40, 70)),
+        "startTimestampGMT": f"{giorno.isoformat()}T00:00:00.0",
+        "startTimestampLocal": f"{giorno.isoformat()}T02:00:00.0",
+        "bodyBatteryValuesArray": campioni,
+    }]
+
+def _id_attivita(giorno, indice):
+    return int(giorno.strftime("%Y%m%d")) * 10 + indice
+
+def genera_attivita_giorno(giorno, seme=0):
+    """Attività (formato get_activities) registrate in 'giorno': da zero a due."""
+    rng = _rng(seme, "attivita", giorno)
+    attivita = []
+    for indice in range(rng.choice([0, 1, 1, 1, 2])):
+        tipo = rng.choice(TIPI_ATTIVITA)
+        durata = rng.uniform(1200, 7200)
+        velocita = {"running": 3.2, "trail_running": 2.6, "cycling": 7.5, "walking": 1.4, "lap_swimming": 0.9}.get(tipo, 0)
+        attivita.append({
+            "activityId": _id_attivita(giorno, indice),
+            "activityName": f"{tipo} {giorno.isoformat()}",
+            "startTimeLocal": f"{giorno.isoformat()} {7 + 10 * indice:02d}:{rng.randrange(60):02d}:00",
+            "activityType": {"typeKey": tipo},
+            "distance": round(durata * velocita * rng.uniform(0.9, 1.1), 1),
+            "duration": round(durata, 1),
+            "averageHR": int(rng.uniform(115, 165)),
+            "calories": int(durata / 60 * rng.uniform(8, 13)),
+        })
+    return attivita
+
+def genera_attivita_recenti(giorno, n=20, seme=0):
+    """Risposta di get_activities(0, n): le n attività più recenti fino a 'giorno', dalla più nuova."""
+    attivita = []
+    while len(attivita) < n and giorno.year > 1900:
+        attivita.extend(reversed(genera_attivita_giorno(giorno, seme)))
+        giorno -= datetime.timedelta(days=1)
+    return attivita[:n]
+
+def genera_dettagli(id_attivita, seme=0, campioni=1800):
+    """Payload di get_activity_details: campioni con tempo, FC, velocità e cadenza."""
+    rng = _rng(seme, "dettagli", id_attivita)
+    descrittori = ["sumDuration", "directHeartRate", "directSpeed", "directRunCadence", "sumDistance"]
+    fc, distanza, metriche = rng.uniform(110, 130), 0.0, []
+    for i in range(campioni):
+        # Deriva cardiaca lenta: il disaccoppiamento calcolato dal trasformatore è positivo
+        fc = min(195, fc + rng.uniform(-0.6, 0.7) + 0.01)
+        velocita = max(0.5, rng.gauss(3.0, 0.25))
+        distanza += velocita * 2
+        metriche.append({"metrics": [i * 2.0, round(fc), round(velocita, 3), rng.randint(160, 180), round(distanza, 1)]})
+    return {
+        "activityId": id_attivita,
+        "metricDescriptors": [{"metricsIndex": i, "key": chiave} for i, chiave in enumerate(descrittori)],
+        "activityDetailMetrics": metriche,
+    }
+
+def genera_giri(id_attivita, seme=0):
+    rng = _rng(seme, "giri", id_attivita)
+    return {"lapDTOs": [{"distance": 1000.0, "duration": rng.uniform(270, 330),
+                         "averageHR": rng.randint(130, 170), "averageSpeed": rng.uniform(3.0, 3.7)}
+                        for _ in range(rng.randint(3, 15))]}
+
+def giorni_storico(scala=1, fine=None):
+    """Elenco dei giorni per una scala di storico (1x = GIORNI_BASE giorni)."""
+    fine = fine or datetime.date(2024, 12, 31)
+    totale = int(GIORNI_BASE * scala)
+    return [fine - datetime.timedelta(days=totale - 1 - i) for i in range(totale)]
+
+def genera_storico(scala=1, seme=0, fine=None):
+    """Tutti i payload grezzi di uno storico: {giorno: {"sonno", "body_battery", "attivita"}}.
+    Per le scale grandi conviene iterare giorno per giorno con le funzioni genera_*."""
+    return {giorno: {
+        "sonno": genera_sonno(giorno, seme),
+        "body_battery": genera_body_battery(giorno, seme),
+        "attivita": genera_attivita_giorno(giorno, seme),
+    } for giorno in giorni_storico(scala, fine)}
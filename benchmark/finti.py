@@ -0,0 +1,376 @@
+import os
+import json
+import time
+import random
+import threading
+import datetime
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import gspread
+from gspread.utils import a1_range_to_grid_range
+from limitatore import LimitatoreToken
+from benchmark import dati_sintetici
+
+
+class Simulatore:
+    """Latenza e quota simulate di un servizio esterno, deterministiche a parità di seme.
+    Conta anche le chiamate ricevute per endpoint (confronto con le metriche della pipeline)."""
+
+    def __init__(self, latenza=(0.0, 0.0), prob_quota=0.0, seme=0):
+        self.latenza = latenza
+        self.prob_quota = prob_quota
+        self.rng = random.Random(seme)
+        self.chiamate = Counter()
+        self.quote = Counter()
+        self.lock = threading.Lock()
+
+    def chiamata(self, nome, errore):
+        """Registra la chiamata, attende la latenza e solleva errore() con probabilità prob_quota."""
+        with self.lock:
+            self.chiamate[nome] += 1
+            attesa = self.rng.uniform(*self.latenza)
+            quota = self.rng.random() < self.prob_quota
+            if quota:
+                self.quote[nome] += 1
+        if attesa:
+            time.sleep(attesa)
+        if quota:
+            raise errore()
+
+    def riepilogo(self):
+        with self.lock:
+            return {"chiamate": dict(self.chiamate), "errori_quota": dict(self.quote)}
+
+
+class LimitatoreAccelerato(LimitatoreToken):
+    """Token bucket col tempo compresso di 'fattore': stessi rapporti tra i servizi e stesse
+    penalità dopo un 429, ma attese 'fattore' volte più brevi (i benchmark non aspettano la quota vera)."""
+
+    def __init__(self, tasso, capacita, fattore):
+        super().__init__(tasso * fattore, capacita)
+        self.fattore = fattore
+
+    def penalizza(self, secondi):
+        super().penalizza(secondi / self.fattore)
+
+
+# --- GARMIN ---
+
+class GarminConnectTooManyRequestsError(Exception):
+    """Stesso nome dell'eccezione di garminconnect: e_throttling_garmin la riconosce come 429."""
+
+
+class FintoGarmin:
+    """Client Garmin in-process: stessi metodi usati da estrattore e backfill, payload sintetici."""
+
+    def __init__(self, simulatore=None, seme=0, giorno_corrente=None):
+        self.simulatore = simulatore or Simulatore()
+        self.seme = seme
+        # get_activities(0, n) risponde con le attività più recenti fino a questa data
+        self.giorno_corrente = giorno_corrente or datetime.date.today()
+
+    def _chiama(self, nome):
+        self.simulatore.chiamata(nome, lambda: GarminConnectTooManyRequestsError(f"429 Too Many Requests ({nome})"))
+
+    def get_sleep_data(self, data):
+        self._chiama("sonno")
+        return dati_sintetici.genera_sonno(datetime.date.fromisoformat(data), self.seme)
+
+    def get_body_battery(self, inizio, fine=None):
+        self._chiama("body_battery")
+        return dati_sintetici.genera_body_battery(datetime.date.fromisoformat(inizio), self.seme)
+
+    def get_activities(self, inizio=0, limite=20):
+        self._chiama("attivita")
+        return dati_sintetici.genera_attivita_recenti(self.giorno_corrente, inizio + limite, self.seme)[inizio:]
+
+    def get_activities_by_date(self, inizio, fine=None, tipo=None):
+        self._chiama("attivita_per_data")
+        dal = datetime.date.fromisoformat(inizio)
+        al = datetime.date.fromisoformat(fine) if fine else dal
+        giorni = ((al - dal).days + 1)
+        return [act for i in range(giorni) for act in
+                dati_sintetici.genera_attivita_giorno(dal + datetime.timedelta(days=i), self.seme)]
+
+    def get_activity_details(self, id_attivita, maxchart=2000, maxpoly=4000):
+        self._chiama("dettagli_attivita")
+        return dati_sintetici.genera_dettagli(int(id_attivita), self.seme)
+
+    def get_activity_splits(self, id_attivita):
+        self._chiama("giri_attivita")
+        return dati_sintetici.genera_giri(int(id_attivita), self.seme)
+
+
+# --- GOOGLE SHEETS ---
+
+class _RispostaQuota:
+    status_code = 429
+
+
+class ErroreQuotaSheets(Exception):
+    """Come gspread.exceptions.APIError su quota superata: e_quota_sheets legge response.status_code."""
+
+    def __init__(self):
+        super().__init__("429 RESOURCE_EXHAUSTED: Quota exceeded for quota metric 'Requests'")
+        self.response = _RispostaQuota()
+
+
+def _valore_cella(cella):
+    valore = (cella or {}).get("userEnteredValue") or {}
+    return next(iter(valore.values()), "")
+
+def _formattato(valore):
+    """Resa FORMATTED_VALUE di Sheets (default di gspread): tutto stringa, interi senza '.0'."""
+    if isinstance(valore, float) and valore.is_integer():
+        return str(int(valore))
+    return str(valore)
+
+def _ritaglia(righe):
+    """Come l'API: niente celle vuote in coda alle righe né righe vuote in coda all'intervallo."""
+    righe = [list(r) for r in righe]
+    for r in righe:
+        while r and r[-1] == "":
+            r.pop()
+    while righe and not righe[-1]:
+        righe.pop()
+    return righe
+
+
+class FintoFoglio:
+    """Worksheet in memoria: righe come liste di valori Python (come UNFORMATTED_VALUE)."""
+
+    def __init__(self, spreadsheet, id_foglio, titolo, righe=None):
+        self.spreadsheet = spreadsheet
+        self.id = id_foglio
+        self.title = titolo
+        self.righe = [list(r) for r in (righe or [])]
+
+    def _leggi(self, intervallo, value_render_option=None):
+        griglia = a1_range_to_grid_range(intervallo)
+        riga_da, riga_a = griglia.get("startRowIndex", 0), griglia.get("endRowIndex", len(self.righe))
+        col_da, col_a = griglia.get("startColumnIndex", 0), griglia.get("endColumnIndex")
+        valori = [r[col_da:col_a] for r in self.righe[riga_da:riga_a]]
+        if value_render_option != "UNFORMATTED_VALUE":
+            valori = [[_formattato(v) for v in r] for r in valori]
+        return _ritaglia(valori)
+
+    def row_values(self, riga, **kwargs):
+        self.spreadsheet.simulatore.chiamata("values.get", ErroreQuotaSheets)
+        return (self._leggi(f"{riga}:{riga}", kwargs.get("value_render_option")) or [[]])[0]
+
+    def col_values(self, colonna, value_render_option=None):
+        self.spreadsheet.simulatore.chiamata("values.get", ErroreQuotaSheets)
+        valori = [r[colonna - 1] if len(r) >= colonna else "" for r in self.righe]
+        if value_render_option != "UNFORMATTED_VALUE":
+            valori = [_formattato(v) for v in valori]
+        while valori and valori[-1] == "":
+            valori.pop()
+        return valori
+
+    def get(self, intervallo, **kwargs):
+        self.spreadsheet.simulatore.chiamata("values.get", ErroreQuotaSheets)
+        return self._leggi(intervallo, kwargs.get("value_render_option"))
+
+    def batch_get(self, intervalli, value_render_option=None, **kwargs):
+        self.spreadsheet.simulatore.chiamata("values.batchGet", ErroreQuotaSheets)
+        return [self._leggi(i, value_render_option) for i in intervalli]
+
+    def scrivi(self, riga, colonna, valori):
+        """Scrive un blocco a partire da (riga, colonna) 0-based estendendo la griglia."""
+        for i, valori_riga in enumerate(valori):
+            while len(self.righe) <= riga + i:
+                self.righe.append([])
+            destinazione = self.righe[riga + i]
+            if len(destinazione) < colonna + len(valori_riga):
+                destinazione.extend([""] * (colonna + len(valori_riga) - len(destinazione)))
+            destinazione[colonna:colonna + len(valori_riga)] = valori_riga
+
+    def ultima_riga(self):
+        """Numero dell'ultima riga non vuota (scansione dal fondo: niente copie del foglio)."""
+        n = len(self.righe)
+        while n and all(v == "" for v in self.righe[n - 1]):
+            n -= 1
+        return n
+
+
+class FintoSpreadsheet:
+    """Spreadsheet in memoria con la stessa superficie di gspread.Spreadsheet usata dal progetto:
+    worksheet/sheet1/add_worksheet e batch_update (appendCells, updateCells, updateSheetProperties)."""
+
+    def __init__(self, simulatore=None, fogli=None):
+        self.simulatore = simulatore or Simulatore()
+        self.fogli = []
+        self.lock = threading.Lock()
+        for titolo, righe in (fogli or {}).items():
+            self._crea(titolo, righe)
+
+    def _crea(self, titolo, righe=None):
+        foglio = FintoFoglio(self, len(self.fogli), titolo, righe)
+        self.fogli.append(foglio)
+        return foglio
+
+    @property
+    def sheet1(self):
+        return self.fogli[0]
+
+    def worksheets(self):
+        return list(self.fogli)
+
+    def worksheet(self, titolo):
+        self.simulatore.chiamata("get", ErroreQuotaSheets)
+        for foglio in self.fogli:
+            if foglio.title == titolo:
+                return foglio
+        raise gspread.exceptions.WorksheetNotFound(titolo)
+
+    def add_worksheet(self, title, rows=1000, cols=26, **kwargs):
+        self.simulatore.chiamata("batchUpdate", ErroreQuotaSheets)
+        with self.lock:
+            return self._crea(title)
+
+    def batch_update(self, corpo):
+        self.simulatore.chiamata("batchUpdate", ErroreQuotaSheets)
+        per_id = {foglio.id: foglio for foglio in self.fogli}
+        with self.lock:
+            for richiesta in corpo.get("requests", []):
+                if "appendCells" in richiesta:
+                    op = richiesta["appendCells"]
+                    foglio = per_id[op["sheetId"]]
+                    foglio.scrivi(foglio.ultima_riga(), 0, [[_valore_cella(c) for c in r.get("values", [])] for r in op["rows"]])
+                elif "updateCells" in richiesta:
+                    op = richiesta["updateCells"]
+                    inizio = op["start"]
+                    per_id[inizio["sheetId"]].scrivi(inizio.get("rowIndex", 0), inizio.get("columnIndex", 0),
+                                                     [[_valore_cella(c) for c in r.get("values", [])] for r in op["rows"]])
+                elif "updateSheetProperties" in richiesta:
+                    proprieta = richiesta["updateSheetProperties"]["properties"]
+                    per_id[proprieta["sheetId"]].title = proprieta.get("title", per_id[proprieta["sheetId"]].title)
+                else:
+                    raise ValueError(f"Richiesta batchUpdate non supportata dal finto Sheets: {list(richiesta)}")
+        return {"replies": [{} for _ in corpo.get("requests", [])]}
+
+
+# --- GEMINI ---
+
+class _Risposta:
+    def __init__(self, text):
+        self.text = text
+
+
+class _ModelliFinti:
+    def __init__(self, simulatore):
+        self.simulatore = simulatore
+
+    def generate_content(self, model, contents):
+        self.simulatore.chiamata(model, lambda: RuntimeError("429 RESOURCE_EXHAUSTED: quota Gemini superata"))
+        # Risposta di lunghezza realistica, diversa per ogni prompt
+        return _Risposta(f"🏃 Coach sintetico ({len(contents)} caratteri di contesto): recupero nella norma, "
+                         "lavoro aerobico a bassa intensità e idratazione. 💪")
+
+
+class FintoGenai:
+    """Client google-genai in-process: client.models.generate_content(...).text."""
+
+    def __init__(self, simulatore=None):
+        self.simulatore = simulatore or Simulatore()
+        self.models = _ModelliFinti(self.simulatore)
+
+
+# --- TELEGRAM ---
+
+class ServerTelegram:
+    """Finto Bot API su 127.0.0.1 (porta libera): POST /bot<token>/sendMessage.
+    Con probabilità prob_quota risponde 429 con parameters.retry_after (secondi, anche frazionari)."""
+
+    def __init__(self, simulatore=None, retry_after=0.05):
+        self.simulatore = simulatore or Simulatore()
+        self.retry_after = retry_after
+        self.messaggi = []
+        server = self
+
+        class Gestore(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Intestazioni e corpo in segmenti separati: senza TCP_NODELAY ogni risposta attende ~40ms di ACK ritardato
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                corpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.endswith("/sendMessage"):
+                    return self._rispondi(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                try:
+                    server.simulatore.chiamata("sendMessage", lambda: ConnectionRefusedError())
+                except ConnectionRefusedError:
+                    return self._rispondi(429, {"ok": False, "error_code": 429, "description": "Too Many Requests",
+                                                "parameters": {"retry_after": server.retry_after}})
+                server.messaggi.append(corpo)
+                self._rispondi(200, {"ok": True, "result": {"message_id": len(server.messaggi)}})
+
+            def _rispondi(self, stato, dati):
+                risposta = json.dumps(dati).encode("utf-8")
+                self.send_response(stato)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(risposta)))
+                self.end_headers()
+                self.wfile.write(risposta)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Gestore)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def avvia(self):
+        self.thread.start()
+        return self
+
+    def ferma(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# --- INSTALLAZIONE ---
+
+def storico_su_fogli(scala=1, seme=0, fine=None):
+    """Contenuto iniziale di Garmin_DB per uno storico sintetico: {'Sonno': righe, 'Attivita': righe},
+    già trasformato come lo scriverebbe il caricatore (intestazione in prima riga)."""
+    from trasformatore import trasforma_dati_sonno_batteria, trasforma_attivita, COLONNE_KPI, COLONNE_ATTIVITA
+    sonno, attivita = [COLONNE_KPI], [COLONNE_ATTIVITA]
+    for giorno in dati_sintetici.giorni_storico(scala, fine):
+        kpi = trasforma_dati_sonno_batteria(dati_sintetici.genera_sonno(giorno, seme),
+                                            dati_sintetici.genera_body_battery(giorno, seme), giorno)
+        sonno.append([kpi[c] for c in COLONNE_KPI])
+        attivita += [[act[c] for c in COLONNE_ATTIVITA]
+                     for act in trasforma_attivita(dati_sintetici.genera_attivita_giorno(giorno, seme))]
+    return {"Sonno": sonno, "Attivita": attivita}
+
+def installa_finti(profili=None, seme=0, giorno_corrente=None, fogli=None):
+    """Sostituisce Garmin, Sheets, Gemini e Telegram con i finti in-process.
+    Va chiamata PRIMA di importare i moduli del progetto: le fabbriche predefinite non
+    sovrascrivono i servizi già registrati e consegna_telegram legge l'URL all'import.
+    profili: {servizio: {"latenza": (min, max), "prob_quota": p}}. Ritorna {servizio: finto}."""
+    import servizi
+    import metriche
+    profili = profili or {}
+
+    def simulatore(nome, indice):
+        return Simulatore(seme=seme * 10 + indice, **profili.get(nome, {}))
+
+    finti = {
+        "garmin": FintoGarmin(simulatore("garmin", 1), seme, giorno_corrente),
+        "sheets": FintoSpreadsheet(simulatore("sheets", 2), fogli),
+        "gemini": FintoGenai(simulatore("gemini", 3)),
+        "telegram": ServerTelegram(simulatore("telegram", 4)).avvia(),
+    }
+    servizi.sostituisci("garmin", finti["garmin"])
+    servizi.sostituisci("sheets_db", finti["sheets"])
+    servizi.sostituisci("gemini", finti["gemini"])
+
+    os.environ["TELEGRAM_API_BASE"] = finti["telegram"].url
+    os.environ.setdefault("TELEGRAM_TOKEN", "000000:finto")
+    os.environ.setdefault("TELEGRAM_CHAT_ID", "1")
+    os.environ.setdefault("GEMINI_API_KEY", "finta")
+    # Le richieste al finto server compaiono nelle metriche HTTP come 'telegram'
+    metriche.SERVIZI_HTTP["127.0.0.1"] = "telegram"
+    return finti
@@ -0,0 +1,325 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+import tempfile
+import tracemalloc
+import multiprocessing
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RADICE not in sys.path:
+    sys.path.insert(0, RADICE)
+
+from benchmark import dati_sintetici
+from benchmark.avvio import TOLLERANZA
+
+CARTELLA_RAPPORTI = os.path.join(RADICE, "stato_locale", "benchmark")
+FILE_RIFERIMENTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "riferimento_offline.json")
+FINE_STORICO = datetime.date(2024, 12, 31)
+
+# Profili dei servizi finti: 'locale' misura solo il nostro codice (confronti tra release),
+# 'realistico' aggiunge latenze di rete tipiche e qualche errore di quota
+PROFILI = {
+    "locale": {},
+    "realistico": {
+        "garmin": {"latenza": (0.08, 0.25), "prob_quota": 0.02},
+        "sheets": {"latenza": (0.05, 0.15), "prob_quota": 0.02},
+        "gemini": {"latenza": (0.4, 1.2), "prob_quota": 0.05},
+        "telegram": {"latenza": (0.01, 0.04), "prob_quota": 0.05},
+    },
+}
+# Volumi delle fasi a richiesta singola: restano fissi al variare della scala dello storico
+GIORNI_CARICAMENTO = 10
+GIORNI_PIPELINE = 3
+LOTTO_COLONNARE = 365
+PAGINA_ATTIVITA = 20
+ATTIVITA_STREAM = 30
+MESSAGGI_TELEGRAM = 30
+PROMPT_GEMINI = 10
+RENDER_DASHBOARD = 3
+# Fase di calibrazione: lavoro fisso che non usa il codice del progetto. Il riferimento salva le
+# misure in unità di calibrazione (rapporti), così resta confrontabile tra macchine diverse
+FASE_CALIBRAZIONE = "calibrazione"
+RIPETIZIONI_CALIBRAZIONE = 300
+
+
+def percentili_ms(latenze):
+    if not latenze:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    p50, p95, p99 = np.percentile(np.array(latenze) * 1000, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3)}
+
+def esegui_fase(richieste, record, memoria=True, verboso=False):
+    """Esegue le richieste di una fase: iterabile di (funzione, argomenti). La preparazione
+    degli argomenti (generazione dei payload) resta fuori dai tempi. Una richiesta che solleva
+    o ritorna False conta come errore. Ritorna throughput, percentili di latenza e picco di memoria."""
+    from metriche import METRICHE
+    METRICHE.azzera()
+    latenze, errori = [], 0
+    if memoria:
+        tracemalloc.start()
+    # I moduli del progetto stampano ogni passo: in benchmark il log resta fuori dai tempi del terminale
+    uscita = sys.stdout if verboso else io.StringIO()
+    with redirect_stdout(uscita):
+        for funzione, argomenti in richieste:
+            inizio = time.perf_counter()
+            try:
+                errori += funzione(*argomenti) is False
+            except Exception as e:
+                errori += 1
+                print(f"[ERRORE BENCHMARK] {e}")
+            latenze.append(time.perf_counter() - inizio)
+            if not verboso:
+                uscita.seek(0)
+                uscita.truncate()
+    picco = tracemalloc.get_traced_memory()[1] if memoria else None
+    if memoria:
+        tracemalloc.stop()
+
+    totale = sum(latenze)
+    return {
+        "richieste": len(latenze),
+        "record": record,
+        "errori": errori,
+        "totale_s": round(totale, 4),
+        "record_s": round(record / totale, 2) if totale else None,
+        "min_ms": round(min(latenze) * 1000, 3) if latenze else None,
+        **percentili_ms(latenze),
+        "picco_mb": round(picco / 2**20, 2) if picco is not None else None,
+        "contatori": METRICHE.istantanea()["contatori"],
+    }
+
+def _lotti(sequenza, dimensione):
+    for i in range(0, len(sequenza), dimensione):
+        yield sequenza[i:i + dimensione]
+
+def _calibrazione(seme):
+    """Unità di lavoro della calibrazione: JSON, ordinamenti e numpy su un payload Body Battery."""
+    payload = json.dumps(dati_sintetici.genera_body_battery(FINE_STORICO, seme))
+
+    def unita():
+        valori = json.loads(payload)[0]["bodyBatteryValuesArray"]
+        serie = np.array([v for v in valori if v[1] is not None], dtype=float)
+        return len(sorted(str(v) for v in valori)) + float(np.diff(serie[:, 1]).sum())
+    return ((unita, ()) for _ in range(RIPETIZIONI_CALIBRAZIONE))
+
+def _fasi(scala, seme, finti):
+    """Fasi del benchmark nell'ordine di esecuzione: (nome, richieste, record).
+    Le richieste sono generatori: i payload delle scale grandi non stanno mai tutti in memoria."""
+    from trasformatore import (trasforma_dati_sonno_batteria, trasforma_attivita, trasforma_sonno_colonnare,
+                               trasforma_attivita_colonnare, trasforma_analisi)
+    from stream_attivita import salva_stream
+    from estrattore import estrai_dati
+    from caricatore import carica_su_sheets
+    from magazzino_locale import sincronizza, leggi_foglio
+    from connessione_sheets import piu_recente
+    from aggregati import leggi_aggregati_attivita, leggi_aggregati_sonno
+    from carico_allenamento import indicatori_carico
+    from grafici import grafico_linea
+    from consegna_telegram import invia
+    from cervello import genera_messaggio_coach, credenziali
+    from orchestratore import costruisci_pipeline
+    import plotly.express as px
+
+    # Storico già sul foglio fino a FINE_STORICO - GIORNI_CARICAMENTO, poi i caricamenti giornalieri
+    giorni = dati_sintetici.giorni_storico(scala, FINE_STORICO - datetime.timedelta(days=GIORNI_CARICAMENTO))
+    nuovi = [FINE_STORICO - datetime.timedelta(days=GIORNI_CARICAMENTO - 1 - i) for i in range(GIORNI_CARICAMENTO)]
+    attivita = [act for g in giorni for act in dati_sintetici.genera_attivita_giorno(g, seme)]
+    garmin, db = finti["garmin"], finti["sheets"]
+
+    def payload_giorno(giorno):
+        return dati_sintetici.genera_sonno(giorno, seme), dati_sintetici.genera_body_battery(giorno, seme)
+
+    def kpi_giorno(giorno):
+        return trasforma_dati_sonno_batteria(*payload_giorno(giorno), giorno)
+
+    def sonno():
+        for g in giorni:
+            yield trasforma_dati_sonno_batteria, (*payload_giorno(g), g)
+
+    def sonno_colonnare():
+        for lotto in _lotti(giorni, LOTTO_COLONNARE):
+            payload = [payload_giorno(g) for g in lotto]
+            yield trasforma_sonno_colonnare, (lotto, [s for s, _ in payload], [b for _, b in payload])
+
+    def attivita_colonnare():
+        for lotto in _lotti(giorni, LOTTO_COLONNARE):
+            ammessi = {g.isoformat() for g in lotto}
+            yield trasforma_attivita_colonnare, ([a for a in attivita if a["startTimeLocal"][:10] in ammessi],)
+
+    def stream():
+        for act in attivita[-ATTIVITA_STREAM:]:
+            id_attivita = act["activityId"]
+            salva_stream(id_attivita, dati_sintetici.genera_dettagli(id_attivita, seme),
+                         dati_sintetici.genera_giri(id_attivita, seme))
+            yield trasforma_analisi, ([str(id_attivita)],)
+
+    def caricamenti():
+        for g in nuovi:
+            garmin.giorno_corrente = g
+            recenti = trasforma_attivita(dati_sintetici.genera_attivita_recenti(g, PAGINA_ATTIVITA, seme))
+            yield carica_su_sheets, (kpi_giorno(g), recenti)
+
+    def render_dashboard(granularita):
+        """Preparazione dati di un render della dashboard, senza Streamlit."""
+        df_sonno, df_att = leggi_foglio("Sonno"), leggi_foglio("Attivita")
+        piu_recente(df_sonno.to_dict("records"), "Data"), piu_recente(df_att.to_dict("records"), "Data_Ora")
+        corse = leggi_aggregati_attivita(granularita, filtro_tipo="running")
+        if not corse.empty:
+            grafico_linea(corse, "Periodo", "Distanza_km", "Volume Corse")
+        volumi = leggi_aggregati_attivita(granularita)
+        if not volumi.empty:
+            px.bar(volumi, x="Periodo", y="Durata_min", color="Tipo")
+        medie = leggi_aggregati_sonno(granularita)
+        if not medie.empty:
+            grafico_linea(medie, "Periodo", ["Voto_Sonno_Medio", "Body_Battery_Media"], "Recupero Medio")
+        indicatori_carico()
+
+    def pipeline(giorno):
+        garmin.giorno_corrente = giorno
+        _, errori = costruisci_pipeline(giorno, forza=True).esegui()
+        return not errori
+
+    _, token, chat_id = credenziali()
+    return [
+        (FASE_CALIBRAZIONE, _calibrazione(seme), RIPETIZIONI_CALIBRAZIONE),
+        ("trasforma_dati_sonno_batteria", sonno(), len(giorni)),
+        ("trasforma_attivita", ((trasforma_attivita, (pagina,)) for pagina in _lotti(attivita, PAGINA_ATTIVITA)), len(attivita)),
+        ("trasforma_sonno_colonnare", sonno_colonnare(), len(giorni)),
+        ("trasforma_attivita_colonnare", attivita_colonnare(), len(attivita)),
+        ("analisi_stream", stream(), min(ATTIVITA_STREAM, len(attivita))),
+        ("estrazione_garmin", ((estrai_dati, (garmin, g)) for g in nuovi), len(nuovi)),
+        ("dashboard_sync_completo", [(sincronizza, (db,))], sum(len(f.righe) - 1 for f in db.fogli)),
+        ("carica_su_sheets", caricamenti(), len(nuovi)),
+        ("dashboard_sync_incrementale", [(sincronizza, (db,))], 1),
+        ("dashboard_preparazione", ((render_dashboard, (gr,)) for gr in ["giorno", "settimana", "mese"] * RENDER_DASHBOARD),
+         3 * RENDER_DASHBOARD),
+        ("telegram_invia", ((invia, (f"Messaggio di prova {i}", token, chat_id)) for i in range(MESSAGGI_TELEGRAM)),
+         MESSAGGI_TELEGRAM),
+        ("gemini_coach", ((genera_messaggio_coach, (kpi_giorno(g),)) for g in nuovi[-PROMPT_GEMINI:]),
+         min(PROMPT_GEMINI, len(nuovi))),
+        ("pipeline_completa", ((pipeline, (g,)) for g in nuovi[-GIORNI_PIPELINE:]), GIORNI_PIPELINE),
+    ]
+
+def esegui_scala(scala, seme=0, profilo="locale", accelerazione=100.0, memoria=True, verboso=False):
+    """Benchmark completo di una scala di storico, in una cartella temporanea (stato_locale,
+    dati_grezzi e magazzino isolati). Va eseguita in un processo dedicato: installa limitatori
+    e servizi finti prima di importare i moduli del progetto."""
+    cartella = tempfile.mkdtemp(prefix="benchmark_offline_")
+    os.chdir(cartella)
+    inizio = time.perf_counter()
+
+    from limitatore import installa_limitatori
+    from squadra import LIMITI_CONDIVISI
+    from benchmark.finti import LimitatoreAccelerato, installa_finti, storico_su_fogli
+    installa_limitatori({nome: LimitatoreAccelerato(tasso, capacita, accelerazione)
+                         for nome, (tasso, capacita) in LIMITI_CONDIVISI.items()})
+    fogli = storico_su_fogli(scala, seme, FINE_STORICO - datetime.timedelta(days=GIORNI_CARICAMENTO))
+    finti = installa_finti(PROFILI[profilo], seme, fogli=fogli)
+
+    fasi = {}
+    try:
+        for nome, richieste, record in _fasi(scala, seme, finti):
+            print(f"[BENCHMARK {scala}x] {nome}...", flush=True)
+            # La calibrazione misura la CPU, non l'overhead di tracemalloc
+            fasi[nome] = esegui_fase(richieste, record, memoria and nome != FASE_CALIBRAZIONE, verboso)
+    finally:
+        finti["telegram"].ferma()
+        os.chdir(RADICE)
+        shutil.rmtree(cartella, ignore_errors=True)
+
+    return {
+        "fasi": fasi,
+        "servizi": {nome: finto.simulatore.riepilogo() for nome, finto in finti.items()},
+        "durata_s": round(time.perf_counter() - inizio, 2),
+    }
+
+def normalizza(esito):
+    """Misure delle fasi in unità di calibrazione: p95 in multipli del tempo di un'unità,
+    throughput in record per unità. Rapporti senza dimensione, indipendenti dalla macchina.
+    L'unità è il tempo minimo della calibrazione: il più stabile su macchine condivise."""
+    unita_ms = esito["fasi"][FASE_CALIBRAZIONE]["min_ms"]
+    return {fase: {"p95_unita": round(m["p95_ms"] / unita_ms, 4), "record_unita": round(m["record_s"] * unita_ms / 1000, 6)}
+            for fase, m in esito["fasi"].items() if fase != FASE_CALIBRAZIONE and m["record_s"]}
+
+def confronta(risultati, riferimento):
+    """Fasi peggiorate oltre TOLLERANZA rispetto al riferimento (p95 o throughput), entrambi
+    normalizzati sulla calibrazione della propria esecuzione. Ritorna le regressioni."""
+    regressioni = []
+    for chiave, esito in risultati.items():
+        for fase, misura in normalizza(esito).items():
+            base = riferimento.get(chiave, {}).get(fase)
+            if not base:
+                continue
+            if (misura["p95_unita"] > base["p95_unita"] * TOLLERANZA
+                    or misura["record_unita"] < base["record_unita"] / TOLLERANZA):
+                regressioni.append(f"{chiave} {fase}: p95 {base['p95_unita']} -> {misura['p95_unita']} unità, "
+                                   f"{base['record_unita']} -> {misura['record_unita']} record/unità")
+    return regressioni
+
+def stampa_tabella(chiave, esito):
+    print(f"\n=== {chiave} ({esito['durata_s']}s) ===")
+    print(f"{'Fase':<31}{'Rich.':>6}{'Record/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'Picco MB':>10}{'Errori':>8}")
+    for fase, m in esito["fasi"].items():
+        print(f"{fase:<31}{m['richieste']:>6}{m['record_s'] or 0:>12.1f}{m['p50_ms'] or 0:>10.2f}{m['p95_ms'] or 0:>10.2f}"
+              f"{m['p99_ms'] or 0:>10.2f}{m['picco_mb'] if m['picco_mb'] is not None else '-':>10}{m['errori']:>8}")
+    for servizio, riepilogo in esito["servizi"].items():
+        print(f"  {servizio}: {sum(riepilogo['chiamate'].values())} chiamate, "
+              f"{sum(riepilogo['errori_quota'].values())} errori di quota simulati")
+
+def esegui(scale, seme=0, profilo="locale", accelerazione=100.0, memoria=True, verboso=False, aggiorna_riferimento=False):
+    """Benchmark di tutte le scale (un processo nuovo per ciascuna), rapporto JSON e confronto
+    col riferimento. Ritorna il numero di regressioni."""
+    contesto = multiprocessing.get_context("spawn")
+    risultati = {}
+    for scala in scale:
+        with ProcessPoolExecutor(max_workers=1, mp_context=contesto, max_tasks_per_child=1) as executor:
+            esito = executor.submit(esegui_scala, scala, seme, profilo, accelerazione, memoria, verboso).result()
+        risultati[f"{profilo}:{scala:g}x"] = esito
+        stampa_tabella(f"{profilo}:{scala:g}x", esito)
+
+    os.makedirs(CARTELLA_RAPPORTI, exist_ok=True)
+    rapporto = os.path.join(CARTELLA_RAPPORTI, f"offline_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(rapporto, 'w', encoding='utf-8') as f:
+        json.dump({"creato": datetime.datetime.now().isoformat(timespec="seconds"), "seme": seme,
+                   "accelerazione": accelerazione, "memoria_tracciata": memoria, "risultati": risultati}, f, indent=2)
+    print(f"\nRapporto salvato in {rapporto}")
+
+    try:
+        with open(FILE_RIFERIMENTO, 'r', encoding='utf-8') as f:
+            riferimento = json.load(f)
+    except FileNotFoundError:
+        riferimento = {}
+    regressioni = confronta(risultati, riferimento)
+    for regressione in regressioni:
+        print(f"[REGRESSIONE] {regressione}")
+
+    if aggiorna_riferimento:
+        for chiave, esito in risultati.items():
+            riferimento[chiave] = normalizza(esito)
+        with open(FILE_RIFERIMENTO, 'w', encoding='utf-8') as f:
+            json.dump(riferimento, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Riferimento aggiornato in {FILE_RIFERIMENTO}")
+    return len(regressioni)
+
+if __name__ == "__main__":
+    # python -m benchmark.harness --scala 1 10 100 [--profilo realistico] [--aggiorna-riferimento]
+    parser = argparse.ArgumentParser(description="Benchmark offline della pipeline su dati Garmin sintetici")
+    parser.add_argument("--scala", type=float, nargs="+", default=[1, 10], help="multipli dello storico base (1x = un mese)")
+    parser.add_argument("--seme", type=int, default=0)
+    parser.add_argument("--profilo", choices=sorted(PROFILI), default="locale")
+    parser.add_argument("--accelerazione", type=float, default=100.0, help="compressione delle attese di quota")
+    parser.add_argument("--senza-memoria", action="store_true", help="tempi senza l'overhead di tracemalloc")
+    parser.add_argument("--verboso", action="store_true", help="mostra il log dei moduli durante le fasi")
+    parser.add_argument("--aggiorna-riferimento", action="store_true")
+    argomenti = parser.parse_args()
+    sys.exit(1 if esegui(argomenti.scala, argomenti.seme, argomenti.profilo, argomenti.accelerazione,
+                         not argomenti.senza_memoria, argomenti.verboso, argomenti.aggiorna_riferimento) else 0)
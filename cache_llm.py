@@ -0,0 +1,48 @@
+import os
+import time
+import sqlite3
+import hashlib
+from contextlib import closing
+from metriche import incrementa
+
+FILE_CACHE_LLM = os.path.join("stato_locale", "cache_llm.sqlite")
+TTL_SECONDI = 24 * 3600
+MAX_VOCI = 500
+
+def _apri(percorso):
+    os.makedirs(os.path.dirname(percorso), exist_ok=True)
+    conn = sqlite3.connect(percorso, timeout=30)
+    conn.execute("""CREATE TABLE IF NOT EXISTS risposte (
+        chiave TEXT PRIMARY KEY, modello TEXT, risposta TEXT, creata REAL, ultimo_accesso REAL)""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_accesso ON risposte (ultimo_accesso)")
+    return conn
+
+def chiave_prompt(modello, prompt):
+    """Hash del prompt renderizzato più il nome del modello."""
+    return hashlib.sha256(f"{modello}\0{prompt}".encode("utf-8")).hexdigest()
+
+def genera_con_cache(modello, prompt, genera, ttl=TTL_SECONDI, max_voci=MAX_VOCI, percorso=FILE_CACHE_LLM):
+    """Ritorna la risposta in cache per (modello, prompt) se ancora valida, altrimenti chiama
+    genera() e la memorizza. Eviction: scadenza per TTL e LRU oltre max_voci."""
+    chiave = chiave_prompt(modello, prompt)
+    adesso = time.time()
+    with closing(_apri(percorso)) as conn:
+        voce = conn.execute("SELECT risposta, creata FROM risposte WHERE chiave = ?", (chiave,)).fetchone()
+        if voce and adesso - voce[1] < ttl:
+            conn.execute("UPDATE risposte SET ultimo_accesso = ? WHERE chiave = ?", (adesso, chiave))
+            conn.commit()
+            print("[CACHE IA] Risposta riutilizzata, nessuna chiamata al modello.")
+            incrementa("cache_llm.hit")
+            return voce[0]
+
+    # La chiamata al modello avviene fuori dalla connessione: può durare diversi secondi
+    incrementa("cache_llm.miss")
+    risposta = genera()
+
+    with closing(_apri(percorso)) as conn:
+        conn.execute("INSERT OR REPLACE INTO risposte VALUES (?, ?, ?, ?, ?)", (chiave, modello, risposta, adesso, adesso))
+        conn.execute("DELETE FROM risposte WHERE creata < ?", (adesso - ttl,))
+        conn.execute("""DELETE FROM risposte WHERE chiave NOT IN (
+            SELECT chiave FROM risposte ORDER BY ultimo_accesso DESC LIMIT ?)""", (max_voci,))
+        conn.commit()
+    return risposta
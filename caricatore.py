@@ -1,78 +1,183 @@
-import os
+import sys
 import datetime
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from trasformatore import leggi_json, trasforma_dati_sonno_batteria, trasforma_attivita
+from contextlib import closing
+from trasformatore import leggi_dati_grezzi, trasforma_payload, trasforma_intervallo, COLONNE_KPI, COLONNE_ATTIVITA, COLONNE_ANALISI
+from scrittura_sheets import PianoScrittura, limitatore_sheets, e_quota_sheets
+from limitatore import con_ritentativi
+from connessione_sheets import ottieni_db
+from carico_allenamento import aggiorna_carico
+from magazzino_locale import apri_magazzino
+from aggregati import aggiorna_aggregati
+
+def _normalizza(valore):
+    """Rende confrontabili i valori locali con quelli letti da Sheets (numeri vs stringhe)."""
+    if valore is None or valore == "":
+        return ""
+    try:
+        return round(float(valore), 6)
+    except (TypeError, ValueError):
+        return str(valore)
+
+def _chiave(valore):
+    normalizzato = _normalizza(valore)
+    return str(int(normalizzato)) if isinstance(normalizzato, float) and normalizzato.is_integer() else str(normalizzato)
+
+def _righe(dati, colonne):
+    """Righe da scrivere da un DataFrame del percorso colonnare o da una lista di dizionari."""
+    if hasattr(dati, "to_numpy"):
+        return dati[colonne].astype(object).to_numpy().tolist()
+    return [[record.get(c, "N/D") for c in colonne] for record in dati]
+
+def _leggi(funzione):
+    """Lettura da Sheets sotto la quota condivisa delle scritture, ritentata su 429/5xx."""
+    return con_ritentativi(funzione, e_quota_sheets, limitatore=limitatore_sheets)
+
+def allinea_intestazione(foglio, colonne, piano):
+    """Estende l'intestazione del foglio quando il trasformatore aggiunge colonne in coda."""
+    attuale = _leggi(lambda: foglio.row_values(1))
+    if attuale == colonne[:len(attuale)]:
+        if len(attuale) < len(colonne):
+            piano.aggiorna_intervallo(foglio, 1, 1, [colonne])
+    else:
+        print(f"[ATTENZIONE] Intestazione del foglio {foglio.title} diversa da quella attesa: {attuale}")
+
+def sincronizza_attivita(foglio_att, lista_attivita, piano, colonne=COLONNE_ATTIVITA):
+    """Upsert incrementale per ID_Attivita: legge solo la colonna chiave (più le righe già note
+    per rilevare modifiche) e accoda nel piano di scrittura solo righe nuove o modificate.
+    Vale per ogni foglio con l'ID in prima colonna (colonne = intestazione attesa)."""
+    from gspread.utils import rowcol_to_a1
+    chiavi = _leggi(lambda: foglio_att.col_values(1, value_render_option='UNFORMATTED_VALUE'))
+    riga_per_id = {_chiave(k): i for i, k in enumerate(chiavi, start=1) if i > 1}
+
+    if not chiavi:
+        piano.accoda_righe(foglio_att, [colonne])
+
+    righe_locali = {_chiave(riga[0]): riga for riga in _righe(lista_attivita, colonne)}
+    note = [(riga_per_id[k], riga) for k, riga in righe_locali.items() if k in riga_per_id]
+    # Le nuove in ordine cronologico: l'ultima riga del foglio resta l'attività più recente
+    nuove = [riga for k, riga in righe_locali.items() if k not in riga_per_id]
+    if colonne == COLONNE_ATTIVITA:
+        nuove.sort(key=lambda r: str(r[1]))
+
+    aggiornate = 0
+    if note:
+        intervalli = [f"A{n}:{rowcol_to_a1(n, len(colonne))}" for n, _ in note]
+        remote = _leggi(lambda: foglio_att.batch_get(intervalli, value_render_option='UNFORMATTED_VALUE'))
+        for (n, riga), intervallo in zip(note, remote):
+            valori_remoti = (list(intervallo[0]) if intervallo else []) + [""] * len(colonne)
+            if [_normalizza(v) for v in riga] != [_normalizza(v) for v in valori_remoti[:len(colonne)]]:
+                piano.aggiorna_intervallo(foglio_att, n, 1, [riga])
+                aggiornate += 1
+
+    piano.accoda_righe(foglio_att, nuove)
+    return len(nuove), aggiornate
+
+def attivita_analizzate():
+    """ID già presenti nel foglio Analisi_Attivita (legge solo la colonna chiave).
+    È il riferimento per decidere quali stream scaricare: la cartella locale sul runner è effimera."""
+    import gspread
+    try:
+        db = ottieni_db()
+        foglio = _leggi(lambda: db.worksheet('Analisi_Attivita'))
+    except gspread.exceptions.WorksheetNotFound:
+        return set()
+    chiavi = _leggi(lambda: foglio.col_values(1, value_render_option='UNFORMATTED_VALUE'))
+    return {_chiave(k) for k in chiavi[1:]}
+
+def carica_analisi(analisi):
+    """Upsert per ID delle analisi dagli stream (zone cardiache, disaccoppiamento) nel foglio
+    Analisi_Attivita, in una batchUpdate separata dal caricamento giornaliero."""
+    import gspread
+    try:
+        db = ottieni_db()
+        piano = PianoScrittura(db)
+        try:
+            foglio_analisi = _leggi(lambda: db.worksheet('Analisi_Attivita'))
+        except gspread.exceptions.WorksheetNotFound:
+            # Creazione una tantum, comunque sotto la quota condivisa di Sheets
+            foglio_analisi = con_ritentativi(
+                lambda: db.add_worksheet('Analisi_Attivita', rows=1000, cols=len(COLONNE_ANALISI)),
+                e_quota_sheets, limitatore=limitatore_sheets)
+        nuove, aggiornate = sincronizza_attivita(foglio_analisi, analisi, piano, COLONNE_ANALISI)
+        piano.esegui()
+        print(f"-> Analisi attività sincronizzate: {nuove} nuove, {aggiornate} aggiornate.")
+        return True
+    except Exception as e:
+        print(f"\n[ERRORE DI SISTEMA] Caricamento delle analisi non riuscito: {e}")
+        return False
 
 def carica_su_sheets(kpi, lista_attivita):
+    # gspread solo quando si carica davvero: all'avvio della pipeline basta costruire il grafo
+    import gspread
     print("Connessione a Google Cloud...")
-    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
     
     try:
-        credenziali = ServiceAccountCredentials.from_json_keyfile_name('credenziali_google.json', scope)
-        client = gspread.authorize(credenziali)
-        db = client.open('Garmin_DB')
+        db = ottieni_db()
+        # Tutte le mutazioni confluiscono in un'unica batchUpdate finale
+        piano = PianoScrittura(db)
         
         # 1. Scrittura KPI su foglio 'Sonno'
         try:
-            foglio_sonno = db.worksheet('Sonno')
+            foglio_sonno = _leggi(lambda: db.worksheet('Sonno'))
         except gspread.exceptions.WorksheetNotFound:
             # Autocorrezione se il foglio si chiama ancora Foglio1
-            foglio_sonno = db.sheet1
-            foglio_sonno.update_title('Sonno')
+            foglio_sonno = _leggi(lambda: db.sheet1)
+            piano.rinomina(foglio_sonno, 'Sonno')
             
-        riga_sonno = [
-            kpi.get("Data", "N/D"),
-            kpi.get("Voto_Sonno", "N/D"),
-            kpi.get("Qualita_Sonno", "N/D"),
-            kpi.get("Ore_Totali", "N/D"),
-            kpi.get("Body_Battery", "N/D")
-        ]
-        foglio_sonno.append_row(riga_sonno)
-        print("-> Record Sonno e Batteria aggiunti.")
+        # kpi: dizionario della giornata oppure DataFrame di più giornate (backfill)
+        allinea_intestazione(foglio_sonno, COLONNE_KPI, piano)
+        righe_sonno = _righe(kpi if hasattr(kpi, "to_numpy") else [kpi], COLONNE_KPI)
+        piano.accoda_righe(foglio_sonno, righe_sonno)
         
         # 2. Scrittura storico su foglio 'Attivita'
         try:
-            foglio_att = db.worksheet('Attivita')
+            foglio_att = _leggi(lambda: db.worksheet('Attivita'))
         except gspread.exceptions.WorksheetNotFound:
             print("ERRORE: Foglio 'Attivita' non trovato!")
-            return
-            
-        # Pulizia del foglio e riscrittura massiva delle ultime 20 attività
-        foglio_att.clear()
-        foglio_att.append_row(["ID_Attivita", "Data_Ora", "Tipo", "Distanza_km", "Durata_min", "FC_Media", "Calorie"])
-        
-        dati_da_scrivere = []
-        for act in lista_attivita:
-            dati_da_scrivere.append([
-                act["ID_Attivita"],
-                act["Data_Ora"],
-                act["Tipo"],
-                act["Distanza_km"],
-                act["Durata_min"],
-                act["FC_Media"],
-                act["Calorie"]
-            ])
+            return False
             
-        if dati_da_scrivere:
-            foglio_att.append_rows(dati_da_scrivere)
-        print(f"-> {len(dati_da_scrivere)} Attività sincronizzate con successo.")
+        nuove, aggiornate = sincronizza_attivita(foglio_att, lista_attivita, piano)
+
+        # 3. Invio unico di tutte le scritture pendenti
+        operazioni = piano.esegui()
+        print(f"-> {len(righe_sonno)} Record Sonno e Batteria aggiunti.")
+        print(f"-> Attività sincronizzate: {nuove} nuove, {aggiornate} aggiornate.")
+        print(f"-> {operazioni} operazioni inviate in una sola richiesta batch.")
+
+        # 4. Modello di carico (ATL/CTL): solo le attività di questo caricamento, in O(1) ciascuna
+        try:
+            integrate = aggiorna_carico(dict(zip(COLONNE_ATTIVITA, riga)) for riga in _righe(lista_attivita, COLONNE_ATTIVITA))
+            print(f"-> Modello di carico aggiornato con {integrate} attività.")
+        except Exception as e:
+            print(f"[ATTENZIONE] Aggiornamento del modello di carico non riuscito: {e}")
+
+        # 5. Aggregati giornalieri/settimanali/mensili nel magazzino locale (delta delle righe caricate)
+        try:
+            with closing(apri_magazzino()) as conn:
+                aggiorna_aggregati(conn, "Sonno", (dict(zip(COLONNE_KPI, riga)) for riga in righe_sonno))
+                aggiorna_aggregati(conn, "Attivita", (dict(zip(COLONNE_ATTIVITA, riga)) for riga in _righe(lista_attivita, COLONNE_ATTIVITA)))
+        except Exception as e:
+            print(f"[ATTENZIONE] Aggiornamento degli aggregati non riuscito: {e}")
         
         print("\n[SUCCESSO GLOBALE] Data Warehouse aggiornato in Cloud.")
+        return True
         
     except Exception as e:
         print(f"\n[ERRORE DI SISTEMA] Fallimento durante il caricamento: {e}")
+        return False
 
 if __name__ == "__main__":
-    oggi = datetime.date.today()
-    print(f"--- Avvio processo di Caricamento (Load) per la data {oggi} ---")
-    
-    f_sonno = os.path.join("dati_grezzi", f"sonno_{oggi}.json")
-    f_batt = os.path.join("dati_grezzi", f"body_battery_{oggi}.json")
-    f_att = os.path.join("dati_grezzi", f"attivita_{oggi}.json")
-    
-    kpi = trasforma_dati_sonno_batteria(leggi_json(f_sonno), leggi_json(f_batt))
-    attivita = trasforma_attivita(leggi_json(f_att))
-    
-    if kpi:
-        carica_su_sheets(kpi, attivita)
\ No newline at end of file
+    if len(sys.argv) == 3:
+        # Caricamento in blocco di un intervallo già in staging (percorso colonnare)
+        dal, al = datetime.date.fromisoformat(sys.argv[1]), datetime.date.fromisoformat(sys.argv[2])
+        print(f"--- Avvio processo di Caricamento (Load) per l'intervallo {dal} -> {al} ---")
+        df_kpi, df_att = trasforma_intervallo(dal, al)
+        carica_su_sheets(df_kpi, df_att)
+    else:
+        oggi = datetime.date.today()
+        print(f"--- Avvio processo di Caricamento (Load) per la data {oggi} ---")
+        
+        kpi, attivita = trasforma_payload(leggi_dati_grezzi(oggi), oggi)
+        
+        if kpi:
+            carica_su_sheets(kpi, attivita)
\ No newline at end of file
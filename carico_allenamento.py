@@ -0,0 +1,154 @@
+import os
+import json
+import math
+import datetime
+import threading
+
+FILE_CARICO = os.path.join("stato_locale", "carico_allenamento.json")
+FILE_REGISTRO_TRIMP = os.path.join("stato_locale", "trimp_attivita.json")
+# Costanti di tempo (giorni) del modello di Banister: carico acuto e cronico
+TAU_ATL = 7
+TAU_CTL = 42
+
+_lock = threading.Lock()
+
+def fc_atleta():
+    """(FC massima, FC a riposo) dell'atleta, da FC_MAX / FC_RIPOSO."""
+    return float(os.getenv("FC_MAX", 190)), float(os.getenv("FC_RIPOSO", 50))
+
+def calcola_trimp(durata_min, fc_media, fc_max=None, fc_riposo=None):
+    """TRIMP di Banister: durata x frazione di FC di riserva x 0.64 e^(1.92 x frazione).
+    Ritorna 0 se mancano durata o frequenza cardiaca."""
+    if fc_max is None or fc_riposo is None:
+        fc_max, fc_riposo = fc_atleta()
+    try:
+        durata_min, fc_media = float(durata_min), float(fc_media)
+    except (TypeError, ValueError):
+        return 0.0
+    if durata_min <= 0 or fc_media <= 0 or fc_max <= fc_riposo:
+        return 0.0
+    riserva = min(max((fc_media - fc_riposo) / (fc_max - fc_riposo), 0.0), 1.0)
+    return durata_min * riserva * 0.64 * math.exp(1.92 * riserva)
+
+def _leggi(percorso, default):
+    try:
+        with open(percorso, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+def _scrivi(percorso, dati):
+    os.makedirs(os.path.dirname(percorso), exist_ok=True)
+    temporaneo = percorso + ".tmp"
+    with open(temporaneo, 'w', encoding='utf-8') as f:
+        json.dump(dati, f)
+    os.replace(temporaneo, percorso)
+
+
+class ModelloCarico:
+    """ATL/CTL come medie mobili esponenziali giornaliere del TRIMP, aggiornate in O(1) per attività.
+    Il modello è lineare: il contributo di un'attività del giorno d al riferimento r vale
+    k * trimp * e^(-(r-d)/tau), quindi le attività arretrate si sommano senza ripercorrere lo storico.
+    Un'attività modificata invece fa ricalcolare lo stato dal registro: sottrarre il vecchio
+    contributo accumulerebbe errore (e andrebbe troncato a zero)."""
+
+    def __init__(self, percorso=FILE_CARICO, percorso_registro=FILE_REGISTRO_TRIMP):
+        self.percorso = percorso
+        self.percorso_registro = percorso_registro
+        self.stato = _leggi(percorso, {"riferimento": None, "atl": 0.0, "ctl": 0.0, "attivita": 0})
+        # ID_Attivita -> [giorno, trimp]: serve per ricalcolare dopo un'attività modificata
+        self.registro = _leggi(percorso_registro, {})
+
+    def _contributo(self, giorno, trimp):
+        riferimento = self.stato["riferimento"]
+        if riferimento is None or giorno > riferimento:
+            # Il riferimento avanza: prima si decade lo stato fino al nuovo giorno
+            if riferimento is not None:
+                giorni = (datetime.date.fromisoformat(giorno) - datetime.date.fromisoformat(riferimento)).days
+                self.stato["atl"] *= math.exp(-giorni / TAU_ATL)
+                self.stato["ctl"] *= math.exp(-giorni / TAU_CTL)
+            self.stato["riferimento"] = riferimento = giorno
+        distanza = (datetime.date.fromisoformat(riferimento) - datetime.date.fromisoformat(giorno)).days
+        for chiave, tau in (("atl", TAU_ATL), ("ctl", TAU_CTL)):
+            self.stato[chiave] += (1 - math.exp(-1 / tau)) * trimp * math.exp(-distanza / tau)
+
+    def _ricalcola(self):
+        """Stato ricostruito dal registro, dal giorno più vecchio in avanti (solo somme positive)."""
+        self.stato = {"riferimento": None, "atl": 0.0, "ctl": 0.0, "attivita": len(self.registro)}
+        for giorno, trimp in sorted(self.registro.values()):
+            self._contributo(giorno, trimp)
+
+    def aggiorna(self, attivita):
+        """Integra attività nuove o modificate (dizionari con le COLONNE_ATTIVITA).
+        Ritorna il numero di attività che hanno cambiato lo stato."""
+        modificate, da_ricalcolare = 0, False
+        for act in attivita:
+            id_attivita = str(act.get("ID_Attivita", ""))
+            giorno = str(act.get("Data_Ora", ""))[:10]
+            try:
+                datetime.date.fromisoformat(giorno)
+            except ValueError:
+                continue
+            trimp = round(calcola_trimp(act.get("Durata_min"), act.get("FC_Media")), 3)
+            precedente = self.registro.get(id_attivita)
+            if precedente == [giorno, trimp]:
+                continue
+            if precedente:
+                da_ricalcolare = True
+            else:
+                self.stato["attivita"] += 1
+                if not da_ricalcolare:
+                    self._contributo(giorno, trimp)
+            self.registro[id_attivita] = [giorno, trimp]
+            modificate += 1
+        if da_ricalcolare:
+            self._ricalcola()
+        return modificate
+
+    def ricostruisci(self, attivita):
+        """Riparte da zero con l'elenco completo delle attività (es. dal mirror locale):
+        le attività sparite dal foglio escono anche dal modello."""
+        self.registro = {}
+        self.stato = {"riferimento": None, "atl": 0.0, "ctl": 0.0, "attivita": 0}
+        return self.aggiorna(attivita)
+
+    def salva(self):
+        with _lock:
+            _scrivi(self.percorso_registro, self.registro)
+            _scrivi(self.percorso, self.stato)
+
+
+def indicatori_carico(giorno=None, percorso=FILE_CARICO):
+    """Lettura O(1) per dashboard e coach: ATL, CTL, TSB e ACWR proiettati al giorno richiesto
+    (oggi se omesso). Ritorna None se il modello non ha ancora elaborato attività."""
+    stato = _leggi(percorso, None)
+    if not stato or stato.get("riferimento") is None:
+        return None
+    giorno = giorno or datetime.date.today()
+    giorni = max((giorno - datetime.date.fromisoformat(stato["riferimento"])).days, 0)
+    atl = stato["atl"] * math.exp(-giorni / TAU_ATL)
+    ctl = stato["ctl"] * math.exp(-giorni / TAU_CTL)
+    return {
+        "ATL": round(atl, 1),
+        "CTL": round(ctl, 1),
+        "TSB": round(ctl - atl, 1),
+        "ACWR": round(atl / ctl, 2) if ctl > 0 else None,
+        "Ultimo_Allenamento": stato["riferimento"],
+    }
+
+def aggiorna_carico(attivita):
+    """Aggiorna e salva il modello con le attività appena caricate."""
+    modello = ModelloCarico()
+    modificate = modello.aggiorna(attivita)
+    if modificate:
+        modello.salva()
+    return modificate
+
+if __name__ == "__main__":
+    # Ricostruzione dallo storico del mirror locale (il sync del magazzino la fa già in automatico)
+    from magazzino_locale import leggi_foglio
+    modello = ModelloCarico()
+    integrate = modello.ricostruisci(leggi_foglio('Attivita').to_dict("records"))
+    modello.salva()
+    print(f"[SUCCESSO] {integrate} attività integrate nel modello di carico.")
+    print(indicatori_carico())
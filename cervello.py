@@ -1,56 +1,80 @@
 import os
-import requests
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+import functools
 from dotenv import load_dotenv
-from google import genai
+import servizi
+from connessione_sheets import ottieni_db, leggi_coda, piu_recente
+from cache_llm import genera_con_cache
+from consegna_telegram import invia, svuota_outbox
+from carico_allenamento import indicatori_carico
+from metriche import misura
+from limitatore import ottieni_limitatore, con_ritentativi
 
-# 1. Caricamento Sicuro Credenziali e Token
-load_dotenv()
-gemini_key = os.getenv("GEMINI_API_KEY")
-telegram_token = os.getenv("TELEGRAM_TOKEN")
-telegram_chat_id = os.getenv("TELEGRAM_CHAT_ID")
+# 1. Caricamento Sicuro Credenziali e Token (al primo utilizzo, non all'import)
+@functools.lru_cache(maxsize=None)
+def credenziali():
+    """(gemini_key, telegram_token, telegram_chat_id) da ambiente/.env, altrimenti dai Secrets di Streamlit."""
+    load_dotenv()
+    gemini_key = os.getenv("GEMINI_API_KEY")
+    telegram_token = os.getenv("TELEGRAM_TOKEN")
+    telegram_chat_id = os.getenv("TELEGRAM_CHAT_ID")
 
-# --- INIZIO AGGIUNTA: PIANO B PER IL CLOUD ---
-if not gemini_key:
-    try:
-        import streamlit as st
-        gemini_key = st.secrets["GEMINI_API_KEY"]
-        telegram_token = st.secrets["TELEGRAM_TOKEN"]
-        telegram_chat_id = st.secrets["TELEGRAM_CHAT_ID"]
-    except Exception:
-        pass
-# --- FINE AGGIUNTA ---
+    # --- PIANO B PER IL CLOUD ---
+    if not gemini_key:
+        try:
+            import streamlit as st
+            gemini_key = st.secrets["GEMINI_API_KEY"]
+            telegram_token = st.secrets["TELEGRAM_TOKEN"]
+            telegram_chat_id = st.secrets["TELEGRAM_CHAT_ID"]
+        except Exception:
+            pass
+    return gemini_key, telegram_token, telegram_chat_id
+
+def _crea_client_gemini():
+    # google-genai è l'import più pesante: si paga solo quando serve davvero il modello
+    from google import genai
+    return genai.Client(api_key=credenziali()[0])
+
+servizi.registra("gemini", _crea_client_gemini, predefinita=True)
+
+MODELLO = 'gemini-2.5-flash' # Mantenuto riferimento modello (ottimizzato a 2.0)
+
+# Piano gratuito Gemini: circa 15 richieste al minuto per chiave
+limitatore_gemini = ottieni_limitatore("gemini", tasso=0.25, capacita=2)
 
-# Inizializzazione Client IA
-client = genai.Client(api_key=gemini_key)
+def e_quota_gemini(errore):
+    """Errori ritentabili di Gemini: quota (429 / RESOURCE_EXHAUSTED) o sovraccarico (503)."""
+    testo = str(errore)
+    return "429" in testo or "RESOURCE_EXHAUSTED" in testo or "503" in testo or "UNAVAILABLE" in testo
+
+def genera_testo(prompt):
+    """Chiamata a Gemini con cache persistente: input identici non ripetono la chiamata."""
+    def genera():
+        with misura("gemini", MODELLO):
+            client = servizi.ottieni("gemini")
+            return con_ritentativi(lambda: client.models.generate_content(model=MODELLO, contents=prompt).text,
+                                   e_quota_gemini, limitatore=limitatore_gemini)
+    return genera_con_cache(MODELLO, prompt, genera)
+
+# Righe finali lette per trovare il record più recente: upsert e backfill non scrivono in ordine
+# cronologico, quindi l'ultima riga fisica non è necessariamente l'ultima giornata
+RIGHE_CODA = 25
 
 def recupera_ultimo_dato():
     """Connessione al Data Warehouse (Google Sheets) per estrarre l'ultimo record del SONNO."""
-    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-    credenziali = ServiceAccountCredentials.from_json_keyfile_name('credenziali_google.json', scope)
-    gc = gspread.authorize(credenziali)
-    
-    foglio = gc.open('Garmin_DB').sheet1
-    records = foglio.get_all_records()
-    
-    if records:
-        return records[-1]
-    return None
+    return piu_recente(leggi_coda(ottieni_db().sheet1, RIGHE_CODA), "Data")
 
 def recupera_ultima_attivita():
     """Connessione al foglio ATTIVITA per estrarre l'ultimo workout sincronizzato."""
-    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-    credenziali = ServiceAccountCredentials.from_json_keyfile_name('credenziali_google.json', scope)
-    gc = gspread.authorize(credenziali)
-    
     # Puntiamo esplicitamente al foglio delle attività
-    foglio = gc.open('Garmin_DB').worksheet('Attivita')
-    records = foglio.get_all_records()
-    
-    if records:
-        return records[-1]
-    return None
+    return piu_recente(leggi_coda(ottieni_db().worksheet('Attivita'), RIGHE_CODA), "Data_Ora")
+
+def descrivi_carico():
+    """Riga di contesto sul carico di allenamento (ATL/CTL/TSB/ACWR), se disponibile."""
+    carico = indicatori_carico()
+    if not carico:
+        return "- Carico di allenamento: non disponibile"
+    return (f"- Carico acuto (ATL): {carico['ATL']}, cronico (CTL): {carico['CTL']}, "
+            f"forma (TSB): {carico['TSB']}, rapporto acuto/cronico (ACWR): {carico['ACWR']}")
 
 def genera_messaggio_coach(dati):
     """Elaborazione predittiva mattutina tramite LLM."""
@@ -60,19 +84,17 @@ def genera_messaggio_coach(dati):
     Oggi i suoi parametri fisiologici estratti dal Garmin sono:
     - Voto Sonno: {dati.get('Voto_Sonno')} su 100
     - Qualità: {dati.get('Qualita_Sonno')}
+    {descrivi_carico()}
     
     REGOLE INGAGGIO:
     1. Valuta il recupero. Se alto, ordina di dominare l'asfalto. Se basso, prescrivi scarico.
+       Con ACWR sopra 1.5 o TSB molto negativo il rischio infortuni è alto: privilegia lo scarico.
     2. Tono da coach d'élite, ingegneristico, motivante, mindset manageriale.
     3. Conciso, dritto al punto, usa emoji.
     4. NO asterischi (**) o underscore (_). Solo testo semplice.
     """
     
-    response = client.models.generate_content(
-        model='gemini-2.5-flash', # Mantenuto riferimento modello (ottimizzato a 2.0)
-        contents=prompt
-    )
-    return response.text
+    return genera_testo(prompt)
 
 def genera_debriefing_post_allenamento(dati):
     """Analisi a consuntivo (Post-Workout) con approccio da Performance Manager."""
@@ -83,6 +105,7 @@ def genera_debriefing_post_allenamento(dati):
     - Durata: {dati.get('Durata_min')} min
     - FC Media: {dati.get('FC_Media')} bpm
     - Calorie: {dati.get('Calorie')}
+    {descrivi_carico()}
     
     OBIETTIVO DEBRIEFING:
     1. Esegui un Load Assessment rapido: l'allenamento è stato efficiente rispetto ai battiti e alla distanza?
@@ -92,46 +115,47 @@ def genera_debriefing_post_allenamento(dati):
     5. NO asterischi (**) o underscore (_). Solo testo semplice ed emoji.
     """
     
-    response = client.models.generate_content(
-        model='gemini-2.5-flash',
-        contents=prompt
-    )
-    return response.text
+    return genera_testo(prompt)
 
 def invia_notifica_telegram(messaggio):
     """Modulo di Delivery per push notification su smartphone."""
     print("Inizializzazione protocollo di rete verso i server Telegram...")
-    url = f"https://api.telegram.org/bot{telegram_token}/sendMessage"
-    
-    payload = {
-       "chat_id": telegram_chat_id,
-        "text": messaggio
-    }
+    _, telegram_token, telegram_chat_id = credenziali()
     
     try:
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
+        if invia(messaggio, telegram_token, telegram_chat_id):
             print("[SUCCESSO] Notifica push consegnata!")
-        else:
-            print(f"[ERRORE DELIVERY] {response.text}")
+            # Telegram risponde: ora i messaggi rimasti indietro dalle esecuzioni precedenti
+            recuperati = svuota_outbox(telegram_token)
+            if recuperati:
+                print(f"[SUCCESSO] {recuperati} notifiche in outbox consegnate.")
+            return True
     except Exception as e:
         print(f"[ECCEZIONE CRITICA] {e}")
+    return False
+
+def routine_mattutina(ultimi_dati=None):
+    """Routine mattutina (Planning): ultimo record sonno -> coach IA -> Telegram.
+    Se la pipeline passa già i KPI del giorno, il foglio non viene riletto."""
+    ultimi_dati = ultimi_dati or recupera_ultimo_dato()
+    if not ultimi_dati:
+        print("Nessun record sonno disponibile nel Data Warehouse.")
+        return None
+
+    messaggio_generato = genera_messaggio_coach(ultimi_dati)
+    url_dashboard = "https://francesco-digital-twin-garmin.streamlit.app/"
+    messaggio_finale = f"{messaggio_generato}\n\n📡 Accesso SOC Dashboard:\n{url_dashboard}"
+
+    print("=== PAYLOAD MESSAGGIO MATTUTINO ===")
+    print(messaggio_finale)
+
+    invia_notifica_telegram(messaggio_finale)
+    return messaggio_finale
 
 if __name__ == "__main__":
     # Questo blocco rimane dedicato alla routine mattutina (CRON JOB)
     print("Esecuzione routine mattutina (Planning)...")
-    ultimi_dati = recupera_ultimo_dato()
-    
-    if ultimi_dati:
-        try:
-            messaggio_generato = genera_messaggio_coach(ultimi_dati)
-            url_dashboard = "https://francesco-digital-twin-garmin.streamlit.app/"
-            messaggio_finale = f"{messaggio_generato}\n\n📡 Accesso SOC Dashboard:\n{url_dashboard}"
-            
-            print("=== PAYLOAD MESSAGGIO MATTUTINO ===")
-            print(messaggio_finale)
-            
-            invia_notifica_telegram(messaggio_finale)
-            
-        except Exception as e:
-            print(f"Errore: {e}")
\ No newline at end of file
+    try:
+        routine_mattutina()
+    except Exception as e:
+        print(f"Errore: {e}")
\ No newline at end of file
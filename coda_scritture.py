@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import closing
+from scrittura_sheets import PianoScrittura
+
+FILE_CODA = os.path.join("stato_locale", "coda_scritture.sqlite")
+INTERVALLO_SVUOTAMENTO = 5        # secondi tra un giro e l'altro del thread di invio
+ATTESA_MASSIMA_ERRORE = 300       # tetto del backoff quando Sheets non risponde
+CONSERVAZIONE_INVIATE = 86400     # le righe inviate restano visibili finché il mirror non le vede
+
+_lock_svuotamento = threading.Lock()
+
+def _apri(percorso=FILE_CODA):
+    os.makedirs(os.path.dirname(percorso), exist_ok=True)
+    conn = sqlite3.connect(percorso, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS coda (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, foglio TEXT, riga TEXT, creata REAL,
+        inviata REAL, tentativi INTEGER DEFAULT 0, ultimo_errore TEXT)""")
+    return conn
+
+def accoda(foglio, riga, percorso=FILE_CODA):
+    """Registra la riga su disco e ritorna subito: l'invio a Sheets avviene in background."""
+    with closing(_apri(percorso)) as conn:
+        cursore = conn.execute("INSERT INTO coda (foglio, riga, creata) VALUES (?, ?, ?)",
+                               (foglio, json.dumps(riga), time.time()))
+        conn.commit()
+    if _scrittore is not None:
+        _scrittore.sveglia.set()
+    return cursore.lastrowid
+
+def righe_locali(foglio, inviate_dopo=None, percorso=FILE_CODA):
+    """Righe non ancora confermate dal foglio remoto: quelle in coda e quelle inviate dopo
+    l'ultimo sync del mirror (timestamp inviate_dopo). Ritorna [(riga, stato)]."""
+    with closing(_apri(percorso)) as conn:
+        risultati = conn.execute(
+            "SELECT riga, inviata FROM coda WHERE foglio = ? AND (inviata IS NULL OR inviata > ?) ORDER BY id",
+            (foglio, inviate_dopo or 0)).fetchall()
+    return [(json.loads(riga), "in coda" if inviata is None else "inviata") for riga, inviata in risultati]
+
+def svuota(db=None, percorso=FILE_CODA, max_righe=500):
+    """Invia le righe in coda di tutti i fogli con un'unica batchUpdate (appendCells per foglio).
+    Ritorna il numero di righe inviate; in caso di errore le righe restano in coda."""
+    with _lock_svuotamento, closing(_apri(percorso)) as conn:
+        conn.execute("DELETE FROM coda WHERE inviata IS NOT NULL AND inviata < ?", (time.time() - CONSERVAZIONE_INVIATE,))
+        in_coda = conn.execute("SELECT id, foglio, riga FROM coda WHERE inviata IS NULL ORDER BY id LIMIT ?",
+                               (max_righe,)).fetchall()
+        conn.commit()
+        if not in_coda:
+            return 0
+
+        per_foglio = {}
+        for id_riga, foglio, riga in in_coda:
+            per_foglio.setdefault(foglio, []).append(json.loads(riga))
+        try:
+            if db is None:
+                from connessione_sheets import ottieni_db
+                db = ottieni_db()
+            piano = PianoScrittura(db)
+            for foglio, righe in per_foglio.items():
+                piano.accoda_righe(db.worksheet(foglio), righe)
+            piano.esegui()
+        except Exception as e:
+            conn.executemany("UPDATE coda SET tentativi = tentativi + 1, ultimo_errore = ? WHERE id = ?",
+                             [(str(e), id_riga) for id_riga, _, _ in in_coda])
+            conn.commit()
+            raise
+
+        conn.executemany("UPDATE coda SET inviata = ? WHERE id = ?", [(time.time(), id_riga) for id_riga, _, _ in in_coda])
+        conn.commit()
+        return len(in_coda)
+
+
+class ScrittoreDifferito(threading.Thread):
+    """Thread demone che svuota la coda periodicamente (o subito dopo un accoda),
+    con backoff esponenziale finché Sheets resta irraggiungibile."""
+
+    def __init__(self, percorso=FILE_CODA, intervallo=INTERVALLO_SVUOTAMENTO):
+        super().__init__(daemon=True, name="scrittore_differito")
+        self.percorso = percorso
+        self.intervallo = intervallo
+        self.sveglia = threading.Event()
+        self.ultimo_errore = None
+
+    def run(self):
+        attesa = self.intervallo
+        while True:
+            self.sveglia.wait(attesa)
+            self.sveglia.clear()
+            try:
+                inviate = svuota(percorso=self.percorso)
+                if inviate:
+                    print(f"[SUCCESSO] {inviate} righe in coda inviate a Google Sheets.")
+                self.ultimo_errore, attesa = None, self.intervallo
+            except Exception as e:
+                self.ultimo_errore = str(e)
+                attesa = min(attesa * 2, ATTESA_MASSIMA_ERRORE)
+                print(f"[ERRORE CODA] Invio differito non riuscito, nuovo tentativo tra {attesa:.0f}s: {e}")
+
+
+_scrittore = None
+_lock_scrittore = threading.Lock()
+
+def avvia_scrittore():
+    """Avvia (una sola volta per processo) il thread di invio in background."""
+    global _scrittore
+    with _lock_scrittore:
+        if _scrittore is None:
+            _scrittore = ScrittoreDifferito()
+            _scrittore.start()
+        return _scrittore
@@ -0,0 +1,69 @@
+import os
+import json
+import servizi
+from limitatore import con_ritentativi
+from scrittura_sheets import limitatore_sheets, e_quota_sheets
+from metriche import strumenta_sessione
+
+SCOPE = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+NOME_DB = 'Garmin_DB'
+FILE_CREDENZIALI = 'credenziali_google.json'
+
+def _credenziali():
+    """File locale in priorità (CREDENZIALI_GOOGLE per un percorso diverso), altrimenti i Secrets di Streamlit Cloud."""
+    from oauth2client.service_account import ServiceAccountCredentials
+    percorso = os.getenv("CREDENZIALI_GOOGLE", FILE_CREDENZIALI)
+    if os.path.exists(percorso):
+        return ServiceAccountCredentials.from_json_keyfile_name(percorso, SCOPE)
+    try:
+        import streamlit as st
+        segreto = st.secrets["GOOGLE_CREDENTIALS"]
+    except Exception:
+        raise RuntimeError("Nessun metodo di autenticazione trovato (file JSON o Secrets).")
+    credenziali_dict = json.loads(segreto) if isinstance(segreto, str) else dict(segreto)
+    return ServiceAccountCredentials.from_json_keyfile_dict(credenziali_dict, SCOPE)
+
+def _crea_client():
+    import gspread
+    client = gspread.authorize(_credenziali())
+    strumenta_sessione(client.http_client.session)
+    return client
+
+def _apri_db():
+    client = ottieni_client()
+    return con_ritentativi(lambda: client.open(os.getenv("GARMIN_DB_NOME", NOME_DB)), e_quota_sheets, limitatore=limitatore_sheets)
+
+servizi.registra("sheets_client", _crea_client, predefinita=True)
+servizi.registra("sheets_db", _apri_db, predefinita=True)
+
+def ottieni_client():
+    """Client gspread condiviso: una sola autorizzazione e una sola sessione HTTP per processo."""
+    return servizi.ottieni("sheets_client")
+
+def ottieni_db():
+    """Handle condiviso dello spreadsheet Garmin_DB (aperto una volta sola).
+    GARMIN_DB_NOME seleziona un altro spreadsheet (un Data Warehouse per atleta)."""
+    return servizi.ottieni("sheets_db")
+
+def leggi_coda(foglio, n=1):
+    """Ultimi n record del foglio come dizionari (stesso formato di get_all_records),
+    leggendo solo intestazione, colonna chiave e un intervallo limitato in coda."""
+    from gspread.utils import numericise_all, rowcol_to_a1
+    intestazione, chiavi = con_ritentativi(lambda: foglio.batch_get(["1:1", "A:A"]), e_quota_sheets, limitatore=limitatore_sheets)
+    intestazione = intestazione[0] if intestazione else []
+    ultima = len(chiavi)
+    if not intestazione or ultima < 2:
+        return []
+
+    prima = max(2, ultima - n + 1)
+    intervallo = f"A{prima}:{rowcol_to_a1(ultima, len(intestazione))}"
+    righe = con_ritentativi(lambda: foglio.get(intervallo), e_quota_sheets, limitatore=limitatore_sheets)
+    return [dict(zip(intestazione, numericise_all(list(r) + [""] * (len(intestazione) - len(r))))) for r in righe]
+
+def piu_recente(records, colonna):
+    """Record con la data più recente in colonna (date ISO: l'ordine testuale è quello cronologico).
+    A parità vale la riga più in basso. Celle vuote o NaN (record da DataFrame) non contano."""
+    datati = [r for r in records if r.get(colonna) not in (None, "") and r[colonna] == r[colonna]]
+    if not datati:
+        return records[-1] if records else None
+    return max(reversed(datati), key=lambda r: str(r[colonna]))
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from metriche import strumenta_sessione
+
+# Sovrascrivibile per puntare a un finto server HTTP locale
+URL_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+FILE_OUTBOX = os.path.join("stato_locale", "outbox_telegram.jsonl")
+TIMEOUT = (5, 15)          # connessione, lettura
+TENTATIVI = 4
+SCADENZA_SECONDI = 60      # tetto complessivo per messaggio, attese incluse
+MASSIMO_OUTBOX = 20        # messaggi arretrati ritentati per giro
+
+_lock_sessione = threading.Lock()
+_lock_outbox = threading.Lock()
+_sessione = None
+
+def _ottieni_sessione():
+    """Sessione HTTP persistente con pool di connessioni (keep-alive verso Telegram)."""
+    global _sessione
+    with _lock_sessione:
+        if _sessione is None:
+            _sessione = requests.Session()
+            _sessione.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=8))
+            _sessione.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=8))
+            strumenta_sessione(_sessione)
+        return _sessione
+
+def _attesa_richiesta(risposta, tentativo):
+    """Secondi da attendere: retry_after di Telegram se presente, altrimenti backoff esponenziale."""
+    try:
+        return float(risposta.json()["parameters"]["retry_after"])
+    except Exception:
+        return float(2 ** tentativo)
+
+def _consegna(testo, token, chat_id, url_base, tentativi, scadenza):
+    """Tentativi di consegna di un messaggio. Ritorna (True, None) se consegnato,
+    (False, errore) se l'errore è definitivo, (None, errore) se transitorio (rete, 429, 5xx)."""
+    url = f"{url_base or URL_BASE}/bot{token}/sendMessage"
+    limite = time.monotonic() + scadenza
+    errore = None
+
+    for tentativo in range(tentativi):
+        try:
+            risposta = _ottieni_sessione().post(url, json={"chat_id": chat_id, "text": testo}, timeout=TIMEOUT)
+            if risposta.status_code == 200:
+                return True, None
+            errore = f"HTTP {risposta.status_code}: {risposta.text}"
+            if risposta.status_code != 429 and risposta.status_code < 500:
+                # Errore definitivo (token, chat, testo): ritentare non serve
+                print(f"[ERRORE DELIVERY] {errore}")
+                return False, errore
+            attesa = _attesa_richiesta(risposta, tentativo)
+        except requests.RequestException as e:
+            errore = str(e)
+            attesa = float(2 ** tentativo)
+
+        if tentativo == tentativi - 1 or time.monotonic() + attesa > limite:
+            break
+        print(f"[RITENTATIVO TELEGRAM] {errore} -> nuovo invio tra {attesa:.0f}s")
+        time.sleep(attesa)
+    return None, errore
+
+def invia(testo, token, chat_id, url_base=None, tentativi=TENTATIVI, scadenza=SCADENZA_SECONDI, outbox=True):
+    """Invio con ritentativi. Ritorna True se consegnato; in caso di errore transitorio
+    il messaggio finisce nell'outbox su disco per il prossimo giro (salvo outbox=False)."""
+    esito, errore = _consegna(testo, token, chat_id, url_base, tentativi, scadenza)
+    if esito is not None:
+        return esito
+
+    if outbox:
+        print(f"[ERRORE DELIVERY] {errore} -> messaggio messo in outbox.")
+        accoda_outbox(testo, chat_id)
+    else:
+        print(f"[ERRORE DELIVERY] {errore}")
+    return False
+
+async def invia_async(testo, token, chat_id, url_base=None):
+    """Percorso asincrono: l'invio bloccante gira in un thread senza fermare l'event loop."""
+    return await asyncio.to_thread(invia, testo, token, chat_id, url_base)
+
+def accoda_outbox(testo, chat_id):
+    # Il token non finisce su disco: solo destinatario e testo
+    with _lock_outbox:
+        os.makedirs(os.path.dirname(FILE_OUTBOX), exist_ok=True)
+        with open(FILE_OUTBOX, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"chat_id": chat_id, "testo": testo, "creato": time.time()}, ensure_ascii=False) + "\n")
+
+def _leggi_outbox():
+    if not os.path.exists(FILE_OUTBOX):
+        return []
+    with open(FILE_OUTBOX, 'r', encoding='utf-8') as f:
+        return [json.loads(riga) for riga in f if riga.strip()]
+
+def _rimuovi_da_outbox(messaggio):
+    """Riscrive l'outbox (file temporaneo + os.replace) senza il messaggio consegnato,
+    conservando quelli accodati nel frattempo da altri invii."""
+    with _lock_outbox:
+        rimasti = [m for m in _leggi_outbox() if m != messaggio]
+        temporaneo = FILE_OUTBOX + ".tmp"
+        with open(temporaneo, 'w', encoding='utf-8') as f:
+            for m in rimasti:
+                f.write(json.dumps(m, ensure_ascii=False) + "\n")
+        os.replace(temporaneo, FILE_OUTBOX)
+
+def svuota_outbox(token, url_base=None, massimo=MASSIMO_OUTBOX):
+    """Ritenta i messaggi rimasti in outbox, dal più vecchio, al più 'massimo' per giro.
+    Ritorna il numero di messaggi consegnati. Al primo errore transitorio si ferma: gli altri
+    fallirebbero allo stesso modo, ciascuno con le sue attese. Un errore definitivo scarta il
+    messaggio. Ogni messaggio esce dal file solo dopo l'esito: un'interruzione non perde nulla."""
+    with _lock_outbox:
+        in_coda = _leggi_outbox()[:massimo]
+
+    consegnati = 0
+    for i, messaggio in enumerate(in_coda):
+        esito, _ = _consegna(messaggio["testo"], token, messaggio["chat_id"], url_base, tentativi=2, scadenza=20)
+        if esito is None:
+            # Resta nel file così com'è, insieme ai successivi: niente duplicati in coda
+            print(f"[OUTBOX] Telegram non raggiungibile: {len(in_coda) - i} messaggi rinviati al prossimo giro.")
+            break
+        _rimuovi_da_outbox(messaggio)
+        if esito:
+            consegnati += 1
+    return consegnati
@@ -1,14 +1,15 @@
 import streamlit as st
 import pandas as pd
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 import plotly.express as px
 import plotly.graph_objects as go
-import json
-import subprocess 
 import datetime
-import os
-from cervello import genera_debriefing_post_allenamento 
+from connessione_sheets import ottieni_db, piu_recente
+from magazzino_locale import sincronizza, leggi_foglio, ultimo_sync
+from coda_scritture import accoda, righe_locali, avvia_scrittore
+from lavori import GestoreLavori
+from carico_allenamento import indicatori_carico
+from aggregati import leggi_aggregati_attivita, leggi_aggregati_sonno
+from grafici import grafico_linea, finestra_visibile
 
 # 1. Configurazione (DEVE ESSERE LA PRIMA ISTRUZIONE)
 st.set_page_config(page_title="Digital Twin - F. Pagliara", page_icon="📈", layout="wide")
@@ -16,59 +17,85 @@ st.set_page_config(page_title="Digital Twin - F. Pagliara", page_icon="📈", la
 # 2. Connessione al Data Warehouse (Lettura)
 @st.cache_data(ttl=600)
 def carica_dati():
-    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
     try:
-        # CONTROLLO PRIORITARIO: Esiste il file locale?
-        if os.path.exists('credenziali_google.json'):
-            credenziali = ServiceAccountCredentials.from_json_keyfile_name('credenziali_google.json', scope)
-        # ALTRIMENTI: Cerca nei Secrets di Streamlit Cloud
-        elif "GOOGLE_CREDENTIALS" in st.secrets:
-            segreto = st.secrets["GOOGLE_CREDENTIALS"]
-            credenziali_dict = json.loads(segreto) if isinstance(segreto, str) else dict(segreto)
-            credenziali = ServiceAccountCredentials.from_json_keyfile_dict(credenziali_dict, scope)
-        else:
-            st.error("Nessun metodo di autenticazione trovato (file JSON o Secrets).")
-            return pd.DataFrame(), pd.DataFrame()
-            
-        client = gspread.authorize(credenziali)
-        db = client.open('Garmin_DB')
-        
-        df_sonno = pd.DataFrame(db.worksheet('Sonno').get_all_records())
-        df_att = pd.DataFrame(db.worksheet('Attivita').get_all_records())
-        return df_sonno, df_att
+        # Sync incrementale del mirror locale: scarica solo le righe aggiunte dall'ultimo giro
+        sincronizza(ottieni_db())
+    except Exception as e:
+        st.warning(f"Sync con il Data Warehouse non riuscito, uso la copia locale: {e}")
+    try:
+        return leggi_foglio('Sonno'), leggi_foglio('Attivita')
     except Exception as e:
         st.error(f"Errore di connessione globale: {e}")
         return pd.DataFrame(), pd.DataFrame()
 
+# Esecutore dei lavori in background, condiviso tra sessioni e rerun
+@st.cache_resource
+def gestore_lavori():
+    return GestoreLavori()
+
+def pipeline_sincronizzazione(osservatore):
+    # Import differito: il grafo ETL (e il client Garmin) serve solo al click
+    from orchestratore import costruisci_pipeline
+    return costruisci_pipeline(datetime.date.today(), includi_coach=False, osservatore=osservatore)
+
+def debriefing_ai():
+    """Debriefing dell'ultimo allenamento: generato una sola volta, dentro il lavoro di sincronizzazione."""
+    from cervello import recupera_ultima_attivita, genera_debriefing_post_allenamento
+    ultima_attivita = recupera_ultima_attivita()
+    return genera_debriefing_post_allenamento(ultima_attivita) if ultima_attivita else None
+
+ICONE_FASI = {"in_attesa": "⏳", "in_corso": "🔄", "completata": "✅", "invariata": "⏭️", "saltata": "⛔", "fallita": "❌"}
+
+@st.fragment(run_every=2)
+def monitor_sincronizzazione():
+    """Polling dell'avanzamento: solo questo frammento si riesegue, il resto della pagina resta libero."""
+    stato = gestore_lavori().stato(st.session_state.get("lavoro_sync"))
+    if stato is None:
+        return
+    for fase, esito in stato["fasi"].items():
+        st.write(f"{ICONE_FASI.get(esito, '•')} {fase}: {esito}")
+    if stato["stato"] in ("in_coda", "in_corso"):
+        st.caption(f"Lavoro {stato['id']} in corso da {datetime.datetime.now().timestamp() - stato['inizio']:.0f}s...")
+        return
+    # Lavoro concluso: si smette di interrogare e si aggiorna l'intera pagina
+    st.session_state["esito_sync"] = stato
+    del st.session_state["lavoro_sync"]
+    st.cache_data.clear()
+    st.rerun()
+
+# Invio differito delle scritture: un solo thread di background per processo
+@st.cache_resource
+def scrittore_differito():
+    return avvia_scrittore()
+
 # Nuova funzione corazzata per scrivere i dati
 def salva_dati_bilancia(peso, grasso_sotto, imc, massa_grassa, muscoli, acqua, proteine, metabolismo, grasso_visc, massa_ossea, muscolo_scheletrico, eta_corpo):
-    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
     try:
-        # CONTROLLO 1: Locale
-        if os.path.exists('credenziali_google.json'):
-            credenziali = ServiceAccountCredentials.from_json_keyfile_name('credenziali_google.json', scope)
-        # CONTROLLO 2: Cloud
-        elif "GOOGLE_CREDENTIALS" in st.secrets:
-            segreto = st.secrets["GOOGLE_CREDENTIALS"]
-            credenziali_dict = json.loads(segreto) if isinstance(segreto, str) else dict(segreto)
-            credenziali = ServiceAccountCredentials.from_json_keyfile_dict(credenziali_dict, scope)
-        # CONTROLLO 3: Errore fatale
-        else:
-            st.error("ERRORE DI SISTEMA: Nessuna credenziale trovata per autorizzare la scrittura.")
-            return False
-        
-        client = gspread.authorize(credenziali)
-        foglio_bilancia = client.open('Garmin_DB').worksheet('Bilancia')
-        
         nuova_riga = [datetime.date.today().strftime("%d/%m/%Y"), peso, grasso_sotto, imc, massa_grassa, muscoli, acqua, proteine, metabolismo, grasso_visc, massa_ossea, muscolo_scheletrico, eta_corpo]
-        foglio_bilancia.append_row(nuova_riga)
+        # Coda durevole su disco: il submit non attende Google, l'invio lo fa il thread in background
+        scrittore_differito()
+        accoda('Bilancia', nuova_riga)
         return True
         
     except Exception as e:
-        # Questo ci dirà esattamente COSA sta bloccando il Cloud
         st.error(f"Errore tecnico durante il salvataggio dei dati bilancia: {str(e)}")
         return False
 
+def storico_bilancia():
+    """Pesate remote (mirror) unite a quelle ancora in coda o non ancora viste dal mirror."""
+    df_remoto = leggi_foglio('Bilancia')
+    locali = righe_locali('Bilancia', inviate_dopo=ultimo_sync('Bilancia'))
+    if not locali:
+        return df_remoto
+    righe = [riga for riga, _ in locali]
+    larghezza = max(len(r) for r in righe)
+    colonne = list(df_remoto.columns[:larghezza]) if len(df_remoto.columns) >= larghezza else [f"Campo_{i + 1}" for i in range(larghezza)]
+    df_locale = pd.DataFrame([r[:len(colonne)] for r in righe], columns=colonne)
+    df_locale["Stato"] = ["⏳ " + stato for _, stato in locali]
+    if not df_remoto.empty:
+        df_remoto = df_remoto.assign(Stato="✅ sincronizzata")
+    return pd.concat([df_remoto, df_locale], ignore_index=True)
+
 # Esecuzione
 st.title("🏃‍♂️ Operations Center - Designed and Developed by Francesco Pagliara")
 st.markdown("---")
@@ -80,8 +107,9 @@ tab_dash, tab_gestione = st.tabs(["📊 Dashboard Analitica", "⚙️ Gestione &
 
 with tab_dash:
     if not df_sonno.empty and not df_att.empty:
-        ultimo_sonno = df_sonno.iloc[-1]
-        ultima_att = df_att.iloc[0] 
+        # Con upsert e backfill i fogli non sono in ordine: le più recenti si ricavano dalle date
+        ultimo_sonno = piu_recente(df_sonno.to_dict("records"), "Data")
+        ultima_att = piu_recente(df_att.to_dict("records"), "Data_Ora")
         
         st.subheader(f"📡 Telemetria Odierna ({ultimo_sonno['Data']})")
         
@@ -104,6 +132,16 @@ with tab_dash:
             else:
                 st.metric("Body Battery", "N/D")
 
+        # Curva intraday ridotta (BB_Serie = "HH:MM=valore;...") calcolata dal trasformatore
+        serie_bb = str(ultimo_sonno.get('BB_Serie', 'N/D'))
+        if '=' in serie_bb:
+            punti_bb = pd.DataFrame([p.split('=') for p in serie_bb.split(';')], columns=["Ora", "Body_Battery"])
+            punti_bb["Body_Battery"] = pd.to_numeric(punti_bb["Body_Battery"], errors="coerce")
+            fig_bb_intraday = px.area(punti_bb, x="Ora", y="Body_Battery", title="⚡ Curva Energetica Intraday",
+                                      color_discrete_sequence=["#0088ff"])
+            fig_bb_intraday.update_layout(height=250, margin=dict(l=10, r=10, t=40, b=10), yaxis_range=[0, 100])
+            st.plotly_chart(fig_bb_intraday, use_container_width=True)
+
         st.subheader("🔥 Ultima Attività Rilevata")
         col_att_1, col_att_2 = st.columns([1, 2])
         
@@ -116,23 +154,47 @@ with tab_dash:
             st.write(f"🔥 **Calorie:** {ultima_att['Calorie']} kcal")
             
         with col_att_2:
-            df_corse = df_att[df_att['Tipo'].str.contains('running', case=False, na=False)].copy()
+            # Volumi pre-aggregati nel magazzino: nessuna scansione delle attività a ogni render
+            granularita = st.radio("Granularità", ["giorno", "settimana", "mese"], index=1, horizontal=True)
+            df_corse = leggi_aggregati_attivita(granularita, filtro_tipo="running")
             if not df_corse.empty:
-                df_corse = df_corse.sort_values(by="Data_Ora")
-                fig_trend = px.line(df_corse, x="Data_Ora", y="Distanza_km", markers=True, 
-                                    title="Trend Distanza Corse (km)", line_shape="spline",
-                                    color_discrete_sequence=["#00ff00"])
+                # Ricampionamento LTTB sulla finestra scelta: payload leggero anche con anni di storico
+                df_corse = finestra_visibile(df_corse, "Periodo", "finestra_corse")
+                fig_trend = grafico_linea(df_corse, "Periodo", "Distanza_km",
+                                          f"Volume Corse per {granularita} (km)", colori=["#00ff00"])
                 st.plotly_chart(fig_trend, use_container_width=True)
+        
+        df_volumi = leggi_aggregati_attivita(granularita)
+        df_sonno_medio = leggi_aggregati_sonno(granularita)
+        col_vol, col_rec = st.columns(2)
+        with col_vol:
+            if not df_volumi.empty:
+                fig_volumi = px.bar(df_volumi, x="Periodo", y="Durata_min", color="Tipo",
+                                    title=f"Volume Allenamento per {granularita} (min)")
+                st.plotly_chart(fig_volumi, use_container_width=True)
+        with col_rec:
+            if not df_sonno_medio.empty:
+                fig_sonno = grafico_linea(df_sonno_medio, "Periodo", ["Voto_Sonno_Medio", "Body_Battery_Media"],
+                                          f"Recupero Medio per {granularita}", colori=["#00e5ff", "#0088ff"])
+                st.plotly_chart(fig_sonno, use_container_width=True)
                 
         st.markdown("---")
         st.subheader("🕸️ Bilanciamento Sistemico (Radar)")
         voto_sonno = int(ultimo_sonno['Voto_Sonno']) if str(ultimo_sonno['Voto_Sonno']).isdigit() else 0
         bb_radar = int(ultimo_sonno['Body_Battery']) if str(ultimo_sonno['Body_Battery']).isdigit() and int(ultimo_sonno['Body_Battery']) > 0 else 50
-        fc_ultima = int(ultima_att['FC_Media']) if str(ultima_att['FC_Media']).isdigit() else 0
-        carico_fisico = min((fc_ultima / 180) * 100, 100)
+        # Carico e freschezza dal modello ATL/CTL persistito (lettura O(1), niente finestre mobili)
+        carico = indicatori_carico()
+        if carico and carico['ACWR'] is not None:
+            # ACWR 1.5 (soglia di rischio) = carico pieno; TSB 0 = freschezza neutra
+            carico_fisico = min(carico['ACWR'] / 1.5 * 100, 100)
+            freschezza = min(max(50 + carico['TSB'], 0), 100)
+        else:
+            fc_ultima = int(ultima_att['FC_Media']) if str(ultima_att['FC_Media']).isdigit() else 0
+            carico_fisico = min((fc_ultima / 180) * 100, 100)
+            freschezza = 50
         
-        categorie = ['Recupero Sonno', 'Energia (Body Battery)', 'Carico Fisico (Ultimo Workout)', 'Qualità Riposo']
-        valori = [voto_sonno, bb_radar, carico_fisico, 85]
+        categorie = ['Recupero Sonno', 'Energia (Body Battery)', 'Carico Acuto/Cronico (ACWR)', 'Freschezza (TSB)']
+        valori = [voto_sonno, bb_radar, carico_fisico, freschezza]
         
         fig_radar = go.Figure(go.Scatterpolar(r=valori, theta=categorie, fill='toself', name='Stato Attuale', line_color='#00e5ff'))
         fig_radar.update_layout(polar=dict(radialaxis=dict(visible=True, range=[0, 100])), showlegend=False)
@@ -141,7 +203,15 @@ with tab_dash:
         with col_rad1: st.plotly_chart(fig_radar, use_container_width=True)
         with col_rad2:
             st.write("### Interpretazione Radar")
-            st.write("Analisi bilanciamento sistema.")
+            if carico:
+                c_atl, c_ctl = st.columns(2)
+                c_atl.metric("Carico Acuto (ATL)", carico['ATL'])
+                c_ctl.metric("Carico Cronico (CTL)", carico['CTL'])
+                c_tsb, c_acwr = st.columns(2)
+                c_tsb.metric("Forma (TSB)", carico['TSB'])
+                c_acwr.metric("ACWR", carico['ACWR'] if carico['ACWR'] is not None else "N/D")
+            else:
+                st.write("Analisi bilanciamento sistema.")
     else:
         st.warning("In attesa di dati dal Data Warehouse...")
 
@@ -149,26 +219,30 @@ with tab_gestione:
     st.header("⚙️ Operazioni Avanzate")
     st.subheader("🔄 Sincronizzazione Real-Time")
     
-    if st.button("Lancia Sincronizzazione Garmin"):
-        with st.spinner("Eseguendo estrattore.py..."):
-            try:
-                processo = subprocess.run(["python", "estrattore.py"], capture_output=True, text=True)
-                if processo.returncode == 0:
-                    st.success("✅ Database aggiornato!")
-                    st.cache_data.clear()
-                    
-                    st.markdown("---")
-                    st.subheader("🤖 AI Performance Debriefing")
-                    _, df_nuovo_att = carica_dati()
-                    if not df_nuovo_att.empty:
-                        ultima_att_sync = df_nuovo_att.iloc[0]
-                        with st.status("Gemini sta analizzando la performance...", expanded=True):
-                            analisi = genera_debriefing_post_allenamento(ultima_att_sync)
-                            st.write(analisi)
-                else:
-                    st.error(f"Errore script: {processo.stderr}")
-            except Exception as e:
-                st.error(f"Errore: {e}")
+    if st.button("Lancia Sincronizzazione Garmin", disabled="lavoro_sync" in st.session_state):
+        # Click ripetuti restituiscono il lavoro già in esecuzione invece di lanciarne un altro
+        st.session_state["lavoro_sync"] = gestore_lavori().avvia(pipeline_sincronizzazione, al_termine=debriefing_ai)
+        st.session_state.pop("esito_sync", None)
+        st.rerun()
+
+    if "lavoro_sync" in st.session_state:
+        monitor_sincronizzazione()
+
+    esito_sync = st.session_state.get("esito_sync")
+    if esito_sync:
+        if esito_sync["stato"] == "completato":
+            st.success(f"✅ Database aggiornato in {esito_sync['fine'] - esito_sync['inizio']:.0f}s!")
+            # Testo già generato dal lavoro: i rerun della pagina non richiamano Gemini
+            if esito_sync["risultato"] or esito_sync["errori"]:
+                st.markdown("---")
+                st.subheader("🤖 AI Performance Debriefing")
+                if esito_sync["risultato"]:
+                    st.write(esito_sync["risultato"])
+                for errore in esito_sync["errori"].values():
+                    st.error(f"Errore: {errore}")
+        else:
+            for fase, errore in esito_sync["errori"].items():
+                st.error(f"Errore nella fase {fase}: {errore}")
 
     st.markdown("---")
     st.subheader("⚖️ Log Bilancia Amazfit")
@@ -201,4 +275,11 @@ with tab_gestione:
             # Passiamo tutti e 12 i parametri alla funzione
             if salva_dati_bilancia(peso_in, grasso_sotto_in, imc_in, massa_grassa_in, muscoli_in, acqua_in, proteine_in, metabolismo_in, grasso_visc_in, massa_ossea_in, muscolo_scheletrico_in, eta_corpo_in):
                 st.balloons()
-                st.success("Dati biometrici registrati e allineati nel Data Warehouse!")
\ No newline at end of file
+                st.success("Dati biometrici registrati! L'allineamento col Data Warehouse avviene in background.")
+
+    errore_coda = scrittore_differito().ultimo_errore
+    if errore_coda:
+        st.warning(f"Invio al Data Warehouse in ritardo, le pesate restano in coda locale: {errore_coda}")
+    df_bilancia = storico_bilancia()
+    if not df_bilancia.empty:
+        st.dataframe(df_bilancia.tail(10), use_container_width=True)
\ No newline at end of file
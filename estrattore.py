@@ -1,32 +1,171 @@
 import os
-import json
 import datetime
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from garminconnect import Garmin
+import servizi
+from sessione_garmin import carica_sessione, salva_sessione
+from archivio_grezzi import salva_grezzo
+from stream_attivita import stream_presenti, salva_stream
+from limitatore import ottieni_limitatore, con_ritentativi
+from metriche import misura, incrementa, strumenta_sessione
 
 load_dotenv()
-email = os.getenv("GARMIN_EMAIL")
-password = os.getenv("GARMIN_PASSWORD")
+
+# Garmin Connect inizia a rispondere 429 sopra qualche richiesta al secondo
+limitatore_garmin = ottieni_limitatore("garmin", tasso=2.0, capacita=4)
+
+def e_throttling_garmin(errore):
+    """Riconosce il rate limiting di Garmin (HTTP 429) tra le eccezioni di garminconnect/garth."""
+    return type(errore).__name__ == "GarminConnectTooManyRequestsError" or "429" in str(errore)
+
+def contata(chiamata):
+    """Avvolge una chiamata API Garmin contandone ogni tentativo alla sorgente (chiamate.garmin),
+    indipendentemente dalla sessione HTTP usata dal client (o da un client finto)."""
+    def eseguita():
+        incrementa("chiamate.garmin")
+        return chiamata()
+    return eseguita
+
+def _strumenta_garmin(client):
+    """Aggancia le metriche HTTP alle sessioni requests di garminconnect. Dalla 0.3 ogni chiamata
+    API apre una sessione nuova (client.client._fresh_api_session): si avvolge la fabbrica.
+    client.client.cs serve a login e rinnovo dei token; prima della 0.3 tutto passava da garth.sess."""
+    interno = getattr(client, "client", None)
+    fabbrica = getattr(interno, "_fresh_api_session", None)
+    if fabbrica is not None and not getattr(fabbrica, "strumentata", False):
+        def sessione_strumentata():
+            return strumenta_sessione(fabbrica())
+        sessione_strumentata.strumentata = True
+        interno._fresh_api_session = sessione_strumentata
+    for sessione in (getattr(interno, "cs", None), getattr(getattr(client, "garth", None), "sess", None)):
+        if hasattr(sessione, "hooks"):
+            strumenta_sessione(sessione)
+    return client
 
 def init_garmin():
+    email = os.getenv("GARMIN_EMAIL")
+    password = os.getenv("GARMIN_PASSWORD")
+
+    # Avvio a caldo: token cifrati su disco, nessun handshake SSO (solo rinnovo se in scadenza)
+    client = carica_sessione(email, password)
+    if client:
+        print("Sessione Garmin ripristinata dalla cache.\n")
+        return _strumenta_garmin(client)
+
     print("Tentativo di login in corso...")
     try:
+        from garminconnect import Garmin
         client = Garmin(email, password)
         client.login()
         print("Login effettuato con successo!\n")
-        return client
+        salva_sessione(client, password)
+        return _strumenta_garmin(client)
     except Exception as e:
         print(f"Errore di autenticazione: {e}")
         return None
 
-def salva_file_json(dati, nome_file):
-    cartella_staging = "dati_grezzi"
-    if not os.path.exists(cartella_staging):
-        os.makedirs(cartella_staging)
-    percorso_completo = os.path.join(cartella_staging, nome_file)
-    with open(percorso_completo, 'w', encoding='utf-8') as f:
-        json.dump(dati, f, ensure_ascii=False, indent=4)
-    print(f"--> File salvato correttamente in: {percorso_completo}")
+# Nessun riuso: ogni esecuzione ripristina (e se serve rinnova) la sessione dalla cache cifrata
+servizi.registra("garmin", init_garmin, predefinita=True, riusa=False)
+
+# Registro degli endpoint giornalieri: per aggiungerne uno basta una nuova voce
+ENDPOINT_GIORNALIERI = {
+    "sonno": {"chiamata": lambda client, giorno: client.get_sleep_data(giorno.isoformat()), "timeout": 30},
+    "body_battery": {"chiamata": lambda client, giorno: client.get_body_battery(giorno.isoformat()), "timeout": 30},
+    "attivita": {"chiamata": lambda client, giorno: client.get_activities(0, 20), "timeout": 45},
+}
+
+def estrai_dati(client, giorno, endpoint=None, max_workers=4):
+    """Scarica in parallelo i payload grezzi della giornata sulla stessa sessione Garmin.
+    Un endpoint in errore o in timeout vale None e non interrompe gli altri."""
+    endpoint = endpoint or ENDPOINT_GIORNALIERI
+    inizi = {}
+
+    # Thread daemon e non ThreadPoolExecutor: i worker dell'executor vengono attesi dall'handler
+    # atexit dell'interprete, quindi una chiamata appesa bloccherebbe comunque l'uscita del processo
+    risultati = queue.Queue()
+    posti = threading.Semaphore(max_workers)
+
+    def chiama(nome):
+        with posti:
+            inizi[nome] = time.monotonic()
+            print(f"Estrazione {nome}...")
+            try:
+                with misura("garmin", nome):
+                    risultati.put((nome, contata(lambda: endpoint[nome]["chiamata"](client, giorno))(), None))
+            except Exception as e:
+                risultati.put((nome, None, e))
+
+    for nome in endpoint:
+        threading.Thread(target=chiama, args=(nome,), name=f"garmin-{nome}", daemon=True).start()
+    pendenti = set(endpoint)
+    dati = {nome: None for nome in endpoint}
+    while pendenti:
+        try:
+            nome, risultato, errore = risultati.get(timeout=0.5)
+        except queue.Empty:
+            pass
+        else:
+            # Una risposta arrivata dopo il timeout dell'endpoint viene ignorata
+            if nome in pendenti:
+                pendenti.discard(nome)
+                if errore is None:
+                    dati[nome] = risultato
+                    print(f"--> Endpoint {nome} completato.")
+                else:
+                    print(f"[ERRORE ENDPOINT] {nome}: {errore}")
+
+        # Il timeout decorre dall'avvio effettivo della chiamata, non dall'attesa di un posto libero
+        adesso = time.monotonic()
+        for nome in list(pendenti):
+            if nome in inizi and adesso - inizi[nome] > endpoint[nome]["timeout"]:
+                print(f"[TIMEOUT ENDPOINT] {nome}: nessuna risposta entro {endpoint[nome]['timeout']}s")
+                pendenti.discard(nome)
+
+    return dati
+
+def salva_dati_grezzi(dati, giorno):
+    """Persistenza in staging dei payload estratti nell'archivio compresso partizionato."""
+    for nome, payload in dati.items():
+        if payload is None:
+            continue  # endpoint fallito: non sovrascriviamo lo staging precedente
+        if salva_grezzo(nome, giorno, payload):
+            print(f"--> Payload {nome} del {giorno} archiviato.")
+        else:
+            print(f"--> Payload {nome} del {giorno} invariato, nessuna scrittura.")
+
+def scarica_dettagli_attivita(client, attivita, gia_analizzate=None, max_workers=4):
+    """Scarica in parallelo (sotto il limitatore Garmin) dettagli e giri delle sole attività
+    non ancora archiviate né già analizzate ('gia_analizzate': ID presenti nel foglio di analisi)
+    e li salva come array compressi. Ritorna gli ID scaricati."""
+    presenti = stream_presenti() | {str(i) for i in (gia_analizzate or ())}
+    nuove = [str(act.get("activityId")) for act in (attivita or [])
+             if act.get("activityId") and str(act.get("activityId")) not in presenti]
+    if not nuove:
+        return []
+
+    def scarica(id_attivita):
+        with misura("garmin", "dettagli_attivita"):
+            dettagli = con_ritentativi(contata(lambda: client.get_activity_details(id_attivita)),
+                                       e_throttling_garmin, limitatore=limitatore_garmin)
+            giri = con_ritentativi(contata(lambda: client.get_activity_splits(id_attivita)),
+                                   e_throttling_garmin, limitatore=limitatore_garmin)
+        salva_stream(id_attivita, dettagli, giri)
+        return id_attivita
+
+    scaricate = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(scarica, id_attivita): id_attivita for id_attivita in nuove}
+        for future in as_completed(futures):
+            try:
+                scaricate.append(future.result())
+            except Exception as e:
+                # Senza file .npz l'attività verrà ritentata al prossimo giro
+                print(f"[ERRORE DETTAGLI] Attività {futures[future]}: {e}")
+    print(f"--> Stream di {len(scaricate)}/{len(nuove)} nuove attività archiviati.")
+    return scaricate
 
 if __name__ == "__main__":
     garmin_client = init_garmin()
@@ -34,18 +173,7 @@ if __name__ == "__main__":
         oggi = datetime.date.today()
         print(f"--- Avvio estrazione dati per la data: {oggi} ---")
         try:
-            print("\nEstrazione metriche sonno...")
-            sleep_data = garmin_client.get_sleep_data(oggi.isoformat())
-            salva_file_json(sleep_data, f"sonno_{oggi}.json")
-            
-            print("\nEstrazione Body Battery...")
-            body_battery = garmin_client.get_body_battery(oggi.isoformat())
-            salva_file_json(body_battery, f"body_battery_{oggi}.json")
-
-            print("\nEstrazione Ultime 20 Attività...")
-            attivita = garmin_client.get_activities(0, 20)
-            salva_file_json(attivita, f"attivita_{oggi}.json")
-            
+            salva_dati_grezzi(estrai_dati(garmin_client, oggi), oggi)
             print("\n[SUCCESS] Processo di estrazione completato!")
         except Exception as e:
             print(f"Errore durante il download dei dati: {e}")
\ No newline at end of file
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Più punti di quanti pixel abbia un grafico su smartphone non aggiungono dettaglio visibile
+PUNTI_MASSIMI = 400
+# Oltre questa soglia il rendering passa a WebGL (Scattergl) invece che SVG
+SOGLIA_WEBGL = 1000
+
+def lttb(x, y, soglia):
+    """Largest-Triangle-Three-Buckets: indici dei 'soglia' punti che conservano meglio la forma
+    della serie (primo e ultimo sempre inclusi). x e y sono array numerici della stessa lunghezza."""
+    n = len(y)
+    if soglia >= n or soglia < 3:
+        return np.arange(n)
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    # Bordi dei bucket interni (il primo e l'ultimo punto fanno bucket a sé)
+    bordi = np.linspace(1, n - 1, soglia - 1).astype(int)
+    indici = np.empty(soglia, dtype=int)
+    indici[0], indici[-1] = 0, n - 1
+    scelto = 0
+    for i in range(soglia - 2):
+        inizio, fine = bordi[i], max(bordi[i + 1], bordi[i] + 1)
+        # Vertice successivo: media del bucket seguente (o l'ultimo punto)
+        prossimo_inizio, prossimo_fine = fine, bordi[i + 2] if i + 2 < len(bordi) else n
+        media_x = x[prossimo_inizio:max(prossimo_fine, prossimo_inizio + 1)].mean()
+        media_y = y[prossimo_inizio:max(prossimo_fine, prossimo_inizio + 1)].mean()
+        # Area del triangolo (punto scelto, candidato, media successiva) per tutto il bucket in un colpo
+        aree = np.abs((x[scelto] - media_x) * (y[inizio:fine] - y[scelto])
+                      - (x[scelto] - x[inizio:fine]) * (media_y - y[scelto]))
+        scelto = inizio + int(aree.argmax())
+        indici[i + 1] = scelto
+    return indici
+
+def riduci_serie(df, x, y, punti=PUNTI_MASSIMI):
+    """Riduce il DataFrame (ordinato per x) a circa 'punti' righe con LTTB calcolato su y.
+    Con più colonne y ogni serie conserva i propri punti salienti (unione degli indici)."""
+    colonne = [y] if isinstance(y, str) else list(y)
+    df = df.dropna(subset=colonne, how="all").reset_index(drop=True)
+    if len(df) <= punti:
+        return df
+    # x può essere testuale (es. '2024-W05'): per la geometria basta la posizione ordinale
+    posizioni = np.arange(len(df))
+    indici = set()
+    for colonna in colonne:
+        valori = pd.to_numeric(df[colonna], errors="coerce").interpolate(limit_direction="both").fillna(0)
+        indici.update(lttb(posizioni, valori.to_numpy(), max(punti // len(colonne), 3)).tolist())
+    return df.iloc[sorted(indici)]
+
+def grafico_linea(df, x, y, titolo, colori=None, punti=PUNTI_MASSIMI, soglia_webgl=SOGLIA_WEBGL):
+    """Grafico a linee costruito sui dati ridotti: SVG con spline per serie brevi,
+    Scattergl lineare per serie lunghe (WebGL non supporta le spline)."""
+    colonne = [y] if isinstance(y, str) else list(y)
+    originali = len(df)
+    ridotto = riduci_serie(df, x, colonne, punti)
+    traccia = go.Scattergl if originali > soglia_webgl else go.Scatter
+    linea = {} if traccia is go.Scattergl else {"shape": "spline"}
+
+    fig = go.Figure()
+    for i, colonna in enumerate(colonne):
+        if colori:
+            linea = {**linea, "color": colori[i % len(colori)]}
+        fig.add_trace(traccia(x=ridotto[x], y=ridotto[colonna], name=colonna,
+                              mode="lines+markers" if len(ridotto) <= 60 else "lines", line=linea))
+    fig.update_layout(title=titolo, showlegend=len(colonne) > 1, margin=dict(l=10, r=10, t=40, b=10))
+    return fig
+
+def finestra_visibile(df, x, chiave):
+    """Slider sull'asse x: il grafico viene ricampionato sulla sola finestra scelta,
+    così zoomando si ottiene più dettaglio senza inviare l'intero storico al browser."""
+    import streamlit as st
+    valori = df[x].astype(str).tolist()
+    if len(valori) < 2:
+        return df
+    dal, al = st.select_slider("Finestra temporale", options=valori, value=(valori[0], valori[-1]), key=chiave)
+    maschera = (df[x].astype(str) >= dal) & (df[x].astype(str) <= al)
+    return df[maschera]
@@ -0,0 +1,41 @@
+import os
+import json
+import hashlib
+import threading
+
+FILE_IMPRONTE = os.path.join("stato_locale", "impronte.json")
+
+def calcola_impronta(*valori):
+    """Fingerprint stabile (SHA-256) di valori serializzabili in JSON."""
+    serializzato = json.dumps(valori, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(serializzato.encode("utf-8")).hexdigest()
+
+
+class ArchivioImpronte:
+    """Ultima impronta degli input e ultimo risultato di ciascuna fase della pipeline."""
+
+    def __init__(self, percorso=FILE_IMPRONTE):
+        self.percorso = percorso
+        self.lock = threading.Lock()
+        try:
+            with open(percorso, 'r', encoding='utf-8') as f:
+                self.voci = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.voci = {}
+
+    def cerca(self, fase, impronta):
+        """Ritorna (True, risultato) se la fase ha già elaborato esattamente questi input."""
+        with self.lock:
+            voce = self.voci.get(fase)
+        if voce and voce.get("impronta") == impronta:
+            return True, voce.get("risultato")
+        return False, None
+
+    def registra(self, fase, impronta, risultato):
+        with self.lock:
+            self.voci[fase] = {"impronta": impronta, "risultato": risultato}
+            os.makedirs(os.path.dirname(self.percorso), exist_ok=True)
+            temporaneo = self.percorso + ".tmp"
+            with open(temporaneo, 'w', encoding='utf-8') as f:
+                json.dump(self.voci, f, ensure_ascii=False, default=str)
+            os.replace(temporaneo, self.percorso)
@@ -0,0 +1,74 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_STORICO = 20
+
+
+class GestoreLavori:
+    """Esecutore in background delle pipeline lanciate dalla dashboard: un lavoro alla volta,
+    click concorrenti deduplicati sul lavoro già in corso, avanzamento interrogabile per ID."""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lavoro")
+        self.lock = threading.Lock()
+        self.lavori = {}
+        self.attivo = None
+
+    def avvia(self, costruisci_pipeline, al_termine=None):
+        """Accoda un lavoro e ne ritorna l'ID. Se uno è già in corso ritorna l'ID di quello.
+        costruisci_pipeline(osservatore) deve restituire una Pipeline da eseguire; al_termine(),
+        se indicato, gira una sola volta dopo una pipeline riuscita e il suo valore resta in 'risultato'."""
+        with self.lock:
+            if self.attivo and self.lavori[self.attivo]["stato"] in ("in_coda", "in_corso"):
+                return self.attivo
+            id_lavoro = uuid.uuid4().hex[:8]
+            self.lavori[id_lavoro] = {
+                "id": id_lavoro, "stato": "in_coda", "fasi": {}, "errori": {},
+                "inizio": time.time(), "fine": None, "risultato": None,
+            }
+            self.attivo = id_lavoro
+            # Storico limitato: si scartano i lavori conclusi più vecchi
+            for vecchio in list(self.lavori)[:-MAX_STORICO]:
+                del self.lavori[vecchio]
+        self.executor.submit(self._esegui, id_lavoro, costruisci_pipeline, al_termine)
+        return id_lavoro
+
+    def _aggiorna_fase(self, id_lavoro, fase, stato):
+        with self.lock:
+            self.lavori[id_lavoro]["fasi"][fase] = stato
+
+    def _esegui(self, id_lavoro, costruisci_pipeline, al_termine=None):
+        with self.lock:
+            self.lavori[id_lavoro]["stato"] = "in_corso"
+        try:
+            pipeline = costruisci_pipeline(lambda fase, stato: self._aggiorna_fase(id_lavoro, fase, stato))
+            with self.lock:
+                for fase in pipeline.fasi:
+                    self.lavori[id_lavoro]["fasi"].setdefault(fase, "in_attesa")
+            _, errori = pipeline.esegui()
+            esito, dettagli = ("fallito" if errori else "completato"), {f: str(e) for f, e in errori.items()}
+        except Exception as e:
+            esito, dettagli = "fallito", {"avvio": str(e)}
+        risultato = None
+        if esito == "completato" and al_termine is not None:
+            # Passo finale fuori dal DAG: un suo errore non invalida la pipeline già conclusa
+            fase = getattr(al_termine, "__name__", "al_termine")
+            self._aggiorna_fase(id_lavoro, fase, "in_corso")
+            try:
+                risultato = al_termine()
+                self._aggiorna_fase(id_lavoro, fase, "completata")
+            except Exception as e:
+                self._aggiorna_fase(id_lavoro, fase, "fallita")
+                dettagli[fase] = str(e)
+        with self.lock:
+            self.lavori[id_lavoro].update(stato=esito, errori=dettagli, fine=time.time(), risultato=risultato)
+
+    def stato(self, id_lavoro):
+        """Istantanea (copia) dello stato del lavoro, oppure None se sconosciuto."""
+        with self.lock:
+            lavoro = self.lavori.get(id_lavoro)
+            if lavoro is None:
+                return None
+            return {**lavoro, "fasi": dict(lavoro["fasi"]), "errori": dict(lavoro["errori"])}
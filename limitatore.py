@@ -0,0 +1,72 @@
+import random
+import threading
+import time
+from metriche import incrementa
+
+
+class LimitatoreToken:
+    """Token bucket thread-safe: 'tasso' gettoni al secondo, raffiche fino a 'capacita'."""
+
+    def __init__(self, tasso, capacita):
+        self.tasso = float(tasso)
+        self.capacita = float(capacita)
+        self.gettoni = float(capacita)
+        self.ultimo = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquisisci(self, gettoni=1):
+        """Blocca finché non sono disponibili i gettoni richiesti."""
+        while True:
+            with self.lock:
+                adesso = time.monotonic()
+                self.gettoni = min(self.capacita, self.gettoni + (adesso - self.ultimo) * self.tasso)
+                self.ultimo = adesso
+                if self.gettoni >= gettoni:
+                    self.gettoni -= gettoni
+                    return
+                attesa = (gettoni - self.gettoni) / self.tasso
+            time.sleep(attesa)
+
+    def penalizza(self, secondi):
+        """Svuota il secchio dopo un throttling lato server: nessuno riparte prima di 'secondi'."""
+        with self.lock:
+            self.ultimo = time.monotonic()
+            self.gettoni = -secondi * self.tasso
+
+
+# Limitatori condivisi per servizio esterno (Garmin, Sheets, ...) nello stesso processo
+LIMITATORI = {}
+_lock_registro = threading.Lock()
+
+def ottieni_limitatore(nome, tasso, capacita):
+    """Ritorna il limitatore condiviso 'nome', creandolo al primo utilizzo."""
+    with _lock_registro:
+        if nome not in LIMITATORI:
+            LIMITATORI[nome] = LimitatoreToken(tasso, capacita)
+        return LIMITATORI[nome]
+
+def installa_limitatori(limitatori):
+    """Registra limitatori creati altrove (es. proxy condivisi tra processi): vanno installati
+    prima di importare i moduli che chiamano ottieni_limitatore a livello di modulo."""
+    with _lock_registro:
+        LIMITATORI.update(limitatori)
+
+def con_ritentativi(funzione, e_ritentabile, tentativi=5, attesa_base=2.0, limitatore=None):
+    """Esegue funzione() riprovando con backoff esponenziale (e jitter) sugli errori ritentabili."""
+    for tentativo in range(tentativi):
+        if limitatore is not None:
+            limitatore.acquisisci()
+        try:
+            return funzione()
+        except Exception as e:
+            if tentativo == tentativi - 1 or not e_ritentabile(e):
+                raise
+            attesa = attesa_base * (2 ** tentativo) + random.uniform(0, attesa_base)
+            servizio = next((n for n, l in LIMITATORI.items() if l is limitatore), "generico")
+            incrementa(f"ritentativi.{servizio}")
+            print(f"[THROTTLING] {e} -> nuovo tentativo tra {attesa:.1f}s ({tentativo + 1}/{tentativi - 1})")
+            if limitatore is not None:
+                # Il secchio in debito fa attendere tutti i thread, incluso questo
+                limitatore.penalizza(attesa)
+            else:
+                time.sleep(attesa)
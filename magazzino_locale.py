@@ -0,0 +1,144 @@
+import os
+import json
+import hashlib
+import time
+import sqlite3
+from contextlib import closing
+# pandas solo alle letture in DataFrame (dashboard, ricostruzione del modello di carico)
+from limitatore import con_ritentativi
+from scrittura_sheets import limitatore_sheets, e_quota_sheets
+from aggregati import aggiorna_aggregati, azzera_aggregati
+from carico_allenamento import ModelloCarico
+
+FILE_MAGAZZINO = os.path.join("stato_locale", "magazzino.sqlite")
+FOGLI_MIRROR = ("Sonno", "Attivita", "Bilancia")
+# Colonna indicizzata per foglio (filtri e ordinamenti temporali della dashboard)
+INDICI = {"Sonno": "Data", "Attivita": "Data_Ora"}
+# Righe finali rilette a ogni sync: intercettano gli upsert sulle attività più recenti
+RIGHE_RILETTURA = 25
+# Le righe più vecchie si controllano con l'impronta della colonna chiave (righe tolte, inserite
+# o spostate) e con una risincronizzazione completa periodica (valori modificati sul posto)
+INTERVALLO_RISINCRONIZZAZIONE = 24 * 3600
+
+def apri_magazzino(percorso=FILE_MAGAZZINO):
+    os.makedirs(os.path.dirname(percorso), exist_ok=True)
+    conn = sqlite3.connect(percorso, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS _stato_sync (
+        foglio TEXT PRIMARY KEY, intestazione TEXT, ultima_riga INTEGER, aggiornato REAL)""")
+    # Magazzini creati prima dei controlli sulle righe vecchie
+    colonne = {riga[1] for riga in conn.execute("PRAGMA table_info(_stato_sync)")}
+    for colonna, tipo in (("impronta", "TEXT"), ("completo", "REAL")):
+        if colonna not in colonne:
+            conn.execute(f"ALTER TABLE _stato_sync ADD COLUMN {colonna} {tipo}")
+    return conn
+
+def _impronta(chiavi):
+    return hashlib.sha1(json.dumps([str(c) for c in chiavi]).encode("utf-8")).hexdigest()
+
+def _q(nome):
+    return '"' + str(nome).replace('"', '""') + '"'
+
+def _ricrea_tabella(conn, nome, intestazione):
+    conn.execute(f"DROP TABLE IF EXISTS {_q(nome)}")
+    colonne = ", ".join(_q(c) for c in intestazione)
+    conn.execute(f"CREATE TABLE {_q(nome)} (riga INTEGER PRIMARY KEY, {colonne})")
+    if INDICI.get(nome) in intestazione:
+        conn.execute(f"CREATE INDEX {_q('idx_' + nome)} ON {_q(nome)} ({_q(INDICI[nome])})")
+
+def sincronizza_foglio(conn, foglio):
+    """Porta il mirror locale del foglio allineato al remoto scaricando solo le righe in coda
+    (più la colonna chiave, per accorgersi dei cambiamenti nelle righe vecchie)."""
+    from gspread.utils import numericise_all
+    nome = foglio.title
+    stato = conn.execute("SELECT intestazione, ultima_riga, impronta, completo FROM _stato_sync WHERE foglio = ?",
+                         (nome,)).fetchone()
+    intestazione_nota = json.loads(stato[0]) if stato else None
+    ultima_nota = stato[1] if stato else 1
+    impronta_nota, ultimo_completo = (stato[2], stato[3] or 0) if stato else (None, 0)
+    prima = max(2, ultima_nota - RIGHE_RILETTURA + 1)
+
+    intestazione, righe, chiavi = con_ritentativi(
+        lambda: foglio.batch_get(["1:1", f"A{prima}:ZZ", "A2:A"]), e_quota_sheets, limitatore=limitatore_sheets)
+    intestazione = list(intestazione[0]) if intestazione else []
+    if not intestazione:
+        return 0
+    righe = [list(r) for r in righe]
+    chiavi = [r[0] if r else "" for r in chiavi]
+    ultima_remota = prima + len(righe) - 1
+
+    # Intestazione cambiata, foglio accorciato, righe vecchie tolte o spostate, oppure risincronizzazione
+    # periodica scaduta: il mirror non è più affidabile, si riparte da zero
+    completo = (intestazione != intestazione_nota or ultima_remota < ultima_nota
+                or _impronta(chiavi[:prima - 2]) != impronta_nota
+                or time.time() - ultimo_completo > INTERVALLO_RISINCRONIZZAZIONE)
+    if completo:
+        if intestazione_nota is not None:
+            print(f"[MAGAZZINO] Risincronizzazione completa del foglio {nome}.")
+        _ricrea_tabella(conn, nome, intestazione)
+        azzera_aggregati(conn, nome)
+        if prima > 2:
+            righe = [list(r) for r in con_ritentativi(
+                lambda: foglio.get("A2:ZZ"), e_quota_sheets, limitatore=limitatore_sheets)]
+            prima = 2
+            ultima_remota = prima + len(righe) - 1
+        ultimo_completo = time.time()
+
+    n = len(intestazione)
+    valori = [[prima + i] + numericise_all((r + [""] * n)[:n]) for i, r in enumerate(righe)]
+    segnaposto = ", ".join("?" * (n + 1))
+    conn.executemany(f"INSERT OR REPLACE INTO {_q(nome)} VALUES ({segnaposto})", valori)
+    # Impronta delle sole righe che il prossimo sync non rileggerà
+    prossima_prima = max(2, ultima_remota - RIGHE_RILETTURA + 1)
+    conn.execute("INSERT OR REPLACE INTO _stato_sync VALUES (?, ?, ?, ?, ?, ?)",
+                 (nome, json.dumps(intestazione), max(ultima_remota, 1), time.time(),
+                  _impronta(chiavi[:prossima_prima - 2]), ultimo_completo))
+    conn.commit()
+    # Aggregati aggiornati solo con le righe appena scaricate (quelle invariate non li toccano)
+    aggiorna_aggregati(conn, nome, (dict(zip(intestazione, v[1:])) for v in valori))
+    if nome == "Attivita":
+        _allinea_carico(conn, nome, [dict(zip(intestazione, v[1:])) for v in valori], completo)
+    return max(0, ultima_remota - ultima_nota)
+
+def _allinea_carico(conn, nome, record, completo):
+    """Modello ATL/CTL allineato al mirror come gli aggregati, così esiste ovunque giri il sync
+    e non solo dove gira il caricatore. Senza modello o dopo una risincronizzazione si ricostruisce
+    da tutte le righe; altrimenti bastano quelle rilette."""
+    import pandas as pd
+    modello = ModelloCarico()
+    if completo or not modello.registro:
+        righe = pd.read_sql_query(f"SELECT * FROM {_q(nome)} ORDER BY riga", conn).drop(columns=["riga"])
+        modificate = modello.ricostruisci(righe.to_dict("records"))
+    else:
+        modificate = modello.aggiorna(record)
+    if modificate or completo:
+        modello.salva()
+
+def sincronizza(db, fogli=FOGLI_MIRROR, percorso=FILE_MAGAZZINO):
+    """Sync incrementale di tutti i fogli mirrorati. Ritorna {foglio: nuove righe}."""
+    # gspread solo quando si sincronizza davvero: la dashboard legge il mirror senza importarlo
+    import gspread
+    nuove = {}
+    with closing(apri_magazzino(percorso)) as conn:
+        for nome in fogli:
+            try:
+                foglio = db.worksheet(nome)
+            except gspread.exceptions.WorksheetNotFound:
+                continue  # foglio non ancora creato (es. Bilancia prima della prima pesata)
+            nuove[nome] = sincronizza_foglio(conn, foglio)
+    return nuove
+
+def ultimo_sync(nome, percorso=FILE_MAGAZZINO):
+    """Timestamp dell'ultimo sync riuscito del foglio nel mirror (0 se mai sincronizzato)."""
+    with closing(apri_magazzino(percorso)) as conn:
+        stato = conn.execute("SELECT aggiornato FROM _stato_sync WHERE foglio = ?", (nome,)).fetchone()
+    return stato[0] if stato else 0
+
+def leggi_foglio(nome, percorso=FILE_MAGAZZINO):
+    """Legge dal mirror locale un foglio come DataFrame, nello stesso ordine del remoto."""
+    import pandas as pd
+    with closing(apri_magazzino(percorso)) as conn:
+        esiste = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (nome,)).fetchone()
+        if not esiste:
+            return pd.DataFrame()
+        return pd.read_sql_query(f"SELECT * FROM {_q(nome)} ORDER BY riga", conn).drop(columns=["riga"])
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import datetime
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+CARTELLA_METRICHE = os.path.join("stato_locale", "metriche")
+
+# Host HTTP -> servizio esterno, per le metriche raccolte dagli hook delle sessioni requests
+SERVIZI_HTTP = {
+    "sheets.googleapis.com": "sheets",
+    "www.googleapis.com": "sheets",
+    "oauth2.googleapis.com": "sheets",
+    "api.telegram.org": "telegram",
+    "connectapi.garmin.com": "garmin",
+    "connect.garmin.com": "garmin",
+}
+
+
+class Metriche:
+    """Raccoglitore thread-safe delle metriche di un'esecuzione: tempi (per categoria/nome),
+    contatori e byte trasferiti per servizio."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.azzera()
+
+    def azzera(self):
+        with self.lock:
+            self.inizio = time.time()
+            self.tempi = {}
+            self.contatori = {}
+            self.byte = {}
+
+    def registra_durata(self, categoria, nome, secondi, esito="ok"):
+        with self.lock:
+            voce = self.tempi.setdefault(f"{categoria}.{nome}", {"chiamate": 0, "errori": 0, "totale_s": 0.0, "max_s": 0.0})
+            voce["chiamate"] += 1
+            voce["errori"] += esito != "ok"
+            voce["totale_s"] += secondi
+            voce["max_s"] = max(voce["max_s"], secondi)
+
+    def incrementa(self, contatore, n=1):
+        with self.lock:
+            self.contatori[contatore] = self.contatori.get(contatore, 0) + n
+
+    def aggiungi_byte(self, servizio, inviati=0, ricevuti=0):
+        with self.lock:
+            voce = self.byte.setdefault(servizio, {"inviati": 0, "ricevuti": 0})
+            voce["inviati"] += inviati
+            voce["ricevuti"] += ricevuti
+
+    def istantanea(self):
+        with self.lock:
+            return {
+                "inizio": datetime.datetime.fromtimestamp(self.inizio).isoformat(timespec="seconds"),
+                "durata_s": round(time.time() - self.inizio, 3),
+                "tempi": {k: {**v, "totale_s": round(v["totale_s"], 3), "max_s": round(v["max_s"], 3)}
+                          for k, v in sorted(self.tempi.items())},
+                "contatori": dict(sorted(self.contatori.items())),
+                "byte": dict(sorted(self.byte.items())),
+            }
+
+
+# Raccoglitore di processo: ogni modulo registra qui senza doverselo passare
+METRICHE = Metriche()
+
+@contextmanager
+def misura(categoria, nome):
+    """Cronometra il blocco; un'eccezione viene contata come errore e rilanciata."""
+    inizio = time.perf_counter()
+    esito = "ok"
+    try:
+        yield
+    except BaseException:
+        esito = "errore"
+        raise
+    finally:
+        METRICHE.registra_durata(categoria, nome, time.perf_counter() - inizio, esito)
+
+def incrementa(contatore, n=1):
+    METRICHE.incrementa(contatore, n)
+
+def aggiungi_byte(servizio, inviati=0, ricevuti=0):
+    METRICHE.aggiungi_byte(servizio, inviati, ricevuti)
+
+def _hook_risposta(risposta, *args, **kwargs):
+    """Hook 'response' di requests: una richiesta HTTP = una chiamata misurata con i suoi byte."""
+    host = urlparse(risposta.url).hostname or "sconosciuto"
+    servizio = SERVIZI_HTTP.get(host, host)
+    richiesta = risposta.request
+    corpo = richiesta.body if richiesta is not None else None
+    METRICHE.registra_durata("http", f"{servizio}.{richiesta.method if richiesta is not None else 'GET'}",
+                             risposta.elapsed.total_seconds(), "ok" if risposta.ok else "errore")
+    incrementa(f"richieste.{servizio}")
+    aggiungi_byte(servizio, inviati=len(corpo) if corpo else 0, ricevuti=len(risposta.content or b""))
+    return risposta
+
+def strumenta_sessione(sessione):
+    """Aggancia la raccolta metriche a una requests.Session (idempotente)."""
+    if _hook_risposta not in sessione.hooks.setdefault("response", []):
+        sessione.hooks["response"].append(_hook_risposta)
+    return sessione
+
+def scrivi_rapporto(cartella=CARTELLA_METRICHE, extra=None):
+    """Salva le metriche dell'esecuzione in un file JSON con timestamp e ne ritorna il percorso."""
+    rapporto = {**METRICHE.istantanea(), **(extra or {})}
+    os.makedirs(cartella, exist_ok=True)
+    percorso = os.path.join(cartella, f"metriche_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(percorso, 'w', encoding='utf-8') as f:
+        json.dump(rapporto, f, ensure_ascii=False, indent=2)
+    return percorso
+
+def stampa_riepilogo():
+    """Tabella testuale di tempi, contatori e byte per il log dell'esecuzione."""
+    dati = METRICHE.istantanea()
+    print(f"\n=== METRICHE ESECUZIONE ({dati['durata_s']:.2f}s) ===")
+    print(f"{'Operazione':<40}{'Chiamate':>9}{'Errori':>8}{'Totale s':>10}{'Max s':>9}")
+    for nome, voce in dati["tempi"].items():
+        print(f"{nome:<40}{voce['chiamate']:>9}{voce['errori']:>8}{voce['totale_s']:>10.2f}{voce['max_s']:>9.2f}")
+    if dati["contatori"]:
+        print("--- Contatori ---")
+        for nome, valore in dati["contatori"].items():
+            print(f"{nome:<40}{valore:>9}")
+    if dati["byte"]:
+        print("--- Byte trasferiti ---")
+        for servizio, voce in dati["byte"].items():
+            print(f"{servizio:<40}{'inviati':>9} {voce['inviati']:>10}   ricevuti {voce['ricevuti']:>10}")
@@ -1,20 +1,90 @@
-import subprocess
-import time
+import sys
 import datetime
+from pipeline import Pipeline
+from impronte import ArchivioImpronte
+from metriche import stampa_riepilogo, scrivi_rapporto
 
-def esegui_modulo(nome_script):
-    print(f"\n---> Esecuzione Modulo: {nome_script} <---")
-    # Lancia lo script come se lo scrivessi tu nel terminale
-    risultato = subprocess.run(["python", nome_script], capture_output=True, text=True)
-    
-    # Stampa a schermo l'output del modulo
-    print(risultato.stdout)
-    
-    if risultato.returncode != 0:
-        print(f"[ERRORE CRITICO] Il modulo {nome_script} ha fallito:")
-        print(risultato.stderr)
-        return False
-    return True
+def costruisci_pipeline(giorno, forza=False, includi_coach=True, osservatore=None):
+    """Grafo ETL + AI: le fasi girano nello stesso processo e si passano i dati in memoria.
+    Le fasi a valle dell'estrazione si saltano se i loro input non sono cambiati (salvo forza=True).
+    Senza coach il grafo si ferma al caricamento (sincronizzazione dalla dashboard)."""
+    # Import differiti: i moduli leggono ambiente e limitatori al caricamento, e nei worker
+    # multi-atleta (spawn) devono farlo solo dopo che l'atleta è stato configurato
+    import servizi
+    from estrattore import estrai_dati, salva_dati_grezzi, scarica_dettagli_attivita
+    from trasformatore import trasforma_payload, trasforma_analisi
+    from caricatore import carica_su_sheets, carica_analisi, attivita_analizzate
+    from stream_attivita import stream_presenti
+    from cervello import routine_mattutina
+
+    def login():
+        client = servizi.ottieni("garmin")
+        if client is None:
+            raise RuntimeError("login Garmin non riuscito")
+        return client
+
+    def estrazione(login):
+        return estrai_dati(login, giorno)
+
+    def salvataggio_grezzi(estrazione):
+        salva_dati_grezzi(estrazione, giorno)
+
+    def trasformazione(estrazione):
+        return trasforma_payload(estrazione, giorno)
+
+    def id_attivita(estrazione):
+        return sorted({str(act["activityId"]) for act in estrazione.get("attivita") or [] if act.get("activityId")})
+
+    def dettagli(id_attivita):
+        # Solo le attività non ancora analizzate sul foglio né archiviate in locale: sul runner
+        # la cartella degli stream è vuota a ogni giro, il foglio no. Con gli stessi ID del giro
+        # precedente la fase è saltata e il foglio non viene letto.
+        # Un errore qui blocca solo l'analisi, non il caricamento dei dati giornalieri, e lascia
+        # l'impronta invariata: le attività mancanti si ritentano al giro successivo.
+        try:
+            gia_analizzate = attivita_analizzate()
+        except Exception as e:
+            print(f"[ATTENZIONE] Elenco delle attività analizzate non disponibile: {e}")
+            gia_analizzate = set()
+        scaricate = scarica_dettagli_attivita(login(), [{"activityId": i} for i in id_attivita], gia_analizzate)
+        mancanti = set(id_attivita) - stream_presenti() - {str(i) for i in gia_analizzate}
+        if mancanti:
+            raise RuntimeError(f"stream non scaricati per {len(mancanti)} attività")
+        return sorted(scaricate)
+
+    def analisi(id_attivita, dettagli):
+        return trasforma_analisi(id_attivita)
+
+    def caricamento(trasformazione):
+        kpi, attivita = trasformazione
+        if not carica_su_sheets(kpi, attivita):
+            raise RuntimeError("caricamento su Google Sheets non riuscito")
+
+    def caricamento_analisi(analisi):
+        # Upsert separato: le righe di analisi vengono da file locali effimeri e non devono
+        # cambiare l'impronta del caricamento giornaliero (che accoda la riga Sonno)
+        if analisi and not carica_analisi(analisi):
+            raise RuntimeError("caricamento delle analisi su Google Sheets non riuscito")
+
+    def coach(caricamento, trasformazione):
+        # I KPI appena caricati arrivano in memoria: niente rilettura dal foglio
+        kpi, _ = trasformazione
+        return routine_mattutina(kpi)
+
+    pipeline = Pipeline(impronte=ArchivioImpronte(), forza=forza, osservatore=osservatore)
+    pipeline.fase("login", login)
+    pipeline.fase("estrazione", estrazione, dipende_da=["login"])
+    # Scrittura staging e trasformazione sono indipendenti: girano in parallelo
+    pipeline.fase("salvataggio_grezzi", salvataggio_grezzi, dipende_da=["estrazione"], memorizza=True)
+    pipeline.fase("trasformazione", trasformazione, dipende_da=["estrazione"], memorizza=True)
+    pipeline.fase("id_attivita", id_attivita, dipende_da=["estrazione"])
+    pipeline.fase("dettagli", dettagli, dipende_da=["id_attivita"], memorizza=True)
+    pipeline.fase("analisi", analisi, dipende_da=["id_attivita", "dettagli"], memorizza=True)
+    pipeline.fase("caricamento", caricamento, dipende_da=["trasformazione"], memorizza=True)
+    pipeline.fase("caricamento_analisi", caricamento_analisi, dipende_da=["analisi"], memorizza=True)
+    if includi_coach:
+        pipeline.fase("coach", coach, dipende_da=["caricamento", "trasformazione"], memorizza=True)
+    return pipeline
 
 if __name__ == "__main__":
     oggi = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -23,21 +93,30 @@ if __name__ == "__main__":
     print(f" TIMESTAMP: {oggi}")
     print(f"==================================================")
 
-    # La sequenza esatta del nostro processo ETL + AI
-    moduli = [
-        "estrattore.py",     # Extract
-        "trasformatore.py",  # Transform
-        "caricatore.py",     # Load
-        "cervello.py"        # AI & Delivery
-    ]
-
-    for modulo in moduli:
-        successo = esegui_modulo(modulo)
-        if not successo:
-            print("\n[BLOCCO SISTEMA] Interruzione catena per errore.")
-            break
-        time.sleep(2) # Pausa tattica di 2 secondi tra un processo e l'altro
+    # La sequenza del nostro processo ETL + AI, ora come DAG in-process
+    # --force: riesegue tutte le fasi anche se gli input non sono cambiati
+    forza = "--force" in sys.argv[1:]
+
+    # --atleti roster.json [--workers N]: una pipeline isolata per atleta su un pool di processi
+    if "--atleti" in sys.argv[1:]:
+        from squadra import leggi_roster, esegui_squadra
+        argomenti = sys.argv[1:]
+        workers = int(argomenti[argomenti.index("--workers") + 1]) if "--workers" in argomenti else 4
+        esiti = esegui_squadra(leggi_roster(argomenti[argomenti.index("--atleti") + 1]), workers, forza=forza)
+        falliti = [id_atleta for id_atleta, errori in esiti.items() if errori]
+        print(f"\n[SQUADRA] {len(esiti) - len(falliti)}/{len(esiti)} atleti completati" + (f", errori: {', '.join(falliti)}" if falliti else ""))
+        raise SystemExit(1 if falliti else 0)
+
+    _, errori = costruisci_pipeline(datetime.date.today(), forza=forza).esegui()
+
+    # Rapporto strutturato dell'esecuzione: tempi per fase e per chiamata esterna, contatori, byte
+    stampa_riepilogo()
+    print(f"Metriche salvate in {scrivi_rapporto(extra={'errori': {f: str(e) for f, e in errori.items()}})}")
+
+    if errori:
+        print("\n[BLOCCO SISTEMA] Interruzione catena per errore nelle fasi: " + ", ".join(errori))
+        raise SystemExit(1)
 
     print(f"\n==================================================")
     print(f" CICLO BATCH COMPLETATO CON SUCCESSO")
-    print(f"==================================================")
\ No newline at end of file
+    print(f"==================================================")
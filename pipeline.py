@@ -0,0 +1,96 @@
+import time
+from metriche import misura, incrementa
+from impronte import calcola_impronta
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class Pipeline:
+    """Motore DAG in-process: esegue le fasi come funzioni nello stesso interprete,
+    passando i risultati in memoria e sovrapponendo le fasi indipendenti."""
+
+    def __init__(self, max_workers=4, impronte=None, forza=False, osservatore=None):
+        self.max_workers = max_workers
+        self.fasi = {}
+        # Callback opzionale osservatore(fase, stato) per il monitoraggio dell'avanzamento
+        self.osservatore = osservatore
+        # Archivio delle impronte: le fasi 'memorizza' con input invariati non vengono rieseguite
+        self.impronte = impronte
+        self.forza = forza
+
+    def fase(self, nome, funzione, dipende_da=(), memorizza=False):
+        """Registra una fase. La funzione riceve i risultati delle dipendenze come argomenti nominati.
+        Con memorizza=True il risultato (serializzabile in JSON) viene riusato se gli input non cambiano."""
+        for dipendenza in dipende_da:
+            if dipendenza not in self.fasi:
+                raise ValueError(f"La fase '{nome}' dipende da '{dipendenza}' che non è registrata.")
+        self.fasi[nome] = {"funzione": funzione, "dipende_da": tuple(dipende_da), "memorizza": memorizza}
+        return self
+
+    def _notifica(self, nome, stato):
+        if self.osservatore is not None:
+            try:
+                self.osservatore(nome, stato)
+            except Exception as e:
+                print(f"[AVVISO] Osservatore pipeline in errore: {e}")
+
+    def _esegui_fase(self, nome, argomenti):
+        impronta = None
+        if self.fasi[nome]["memorizza"] and self.impronte is not None:
+            impronta = calcola_impronta(nome, argomenti)
+            trovata, risultato = self.impronte.cerca(nome, impronta)
+            if trovata and not self.forza:
+                print(f"\n---> Fase {nome}: input invariati, esecuzione saltata <---")
+                self._notifica(nome, "invariata")
+                incrementa("fasi.invariate")
+                return risultato
+
+        print(f"\n---> Esecuzione Fase: {nome} <---")
+        self._notifica(nome, "in_corso")
+        inizio = time.perf_counter()
+        with misura("fase", nome):
+            risultato = self.fasi[nome]["funzione"](**argomenti)
+        print(f"<--- Fase {nome} completata in {time.perf_counter() - inizio:.2f}s")
+
+        # L'impronta si registra solo a fase riuscita: un errore forza la riesecuzione
+        if impronta is not None:
+            self.impronte.registra(nome, impronta, risultato)
+        self._notifica(nome, "completata")
+        return risultato
+
+    def esegui(self):
+        """Esegue il DAG. Ritorna (risultati, errori): una fase fallita blocca solo i suoi discendenti."""
+        risultati = {}
+        errori = {}
+        in_attesa = dict(self.fasi)
+        in_corso = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while in_attesa or in_corso:
+                # Le fasi con un antenato fallito non verranno mai eseguite
+                for nome, fase in list(in_attesa.items()):
+                    bloccanti = [d for d in fase["dipende_da"] if d in errori]
+                    if bloccanti:
+                        errori[nome] = RuntimeError(f"saltata per errore in {', '.join(bloccanti)}")
+                        del in_attesa[nome]
+                        self._notifica(nome, "saltata")
+
+                for nome, fase in list(in_attesa.items()):
+                    if all(d in risultati for d in fase["dipende_da"]):
+                        argomenti = {d: risultati[d] for d in fase["dipende_da"]}
+                        in_corso[executor.submit(self._esegui_fase, nome, argomenti)] = nome
+                        del in_attesa[nome]
+
+                if not in_corso:
+                    break
+
+                completati, _ = wait(in_corso, return_when=FIRST_COMPLETED)
+                for future in completati:
+                    nome = in_corso.pop(future)
+                    try:
+                        risultati[nome] = future.result()
+                    except Exception as e:
+                        print(f"[ERRORE CRITICO] La fase {nome} ha fallito: {e}")
+                        errori[nome] = e
+                        self._notifica(nome, "fallita")
+
+        return risultati, errori
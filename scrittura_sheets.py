@@ -0,0 +1,68 @@
+import math
+import numbers
+from limitatore import ottieni_limitatore, con_ritentativi
+from metriche import misura
+
+# Quota Sheets: 60 richieste/minuto per utente. Condiviso da tutte le scritture del processo.
+limitatore_sheets = ottieni_limitatore("sheets", tasso=1.0, capacita=10)
+
+def e_quota_sheets(errore):
+    """Errori ritentabili di Sheets: quota superata (429) o indisponibilità temporanea (5xx)."""
+    stato = getattr(getattr(errore, "response", None), "status_code", None)
+    return stato in (429, 500, 503) or "RESOURCE_EXHAUSTED" in str(errore)
+
+def _cella(valore):
+    """Valore Python -> CellData dell'API Sheets (equivalente a value_input_option RAW)."""
+    if valore is None or valore == "":
+        return {}
+    if isinstance(valore, bool):
+        return {"userEnteredValue": {"boolValue": valore}}
+    if isinstance(valore, numbers.Real):
+        # float() copre anche i NaN numpy (es. float32) che non sono float di Python
+        if math.isnan(float(valore)):
+            return {}
+        return {"userEnteredValue": {"numberValue": valore if isinstance(valore, (int, float)) else float(valore)}}
+    return {"userEnteredValue": {"stringValue": str(valore)}}
+
+def _righe(valori):
+    return [{"values": [_cella(v) for v in riga]} for riga in valori]
+
+
+class PianoScrittura:
+    """Raccoglie le mutazioni pendenti su più fogli dello stesso spreadsheet
+    e le invia in un'unica spreadsheets.batchUpdate, sotto il limitatore di quota."""
+
+    def __init__(self, db):
+        self.db = db
+        self.richieste = []
+
+    def accoda_righe(self, foglio, righe):
+        """Append in coda ai dati esistenti (appendCells estende la griglia se serve)."""
+        if righe:
+            self.richieste.append({"appendCells": {
+                "sheetId": foglio.id, "rows": _righe(righe), "fields": "userEnteredValue"}})
+        return self
+
+    def aggiorna_intervallo(self, foglio, riga, colonna, valori):
+        """Sovrascrive un blocco a partire da (riga, colonna), entrambe 1-based come in gspread."""
+        if valori:
+            self.richieste.append({"updateCells": {
+                "start": {"sheetId": foglio.id, "rowIndex": riga - 1, "columnIndex": colonna - 1},
+                "rows": _righe(valori), "fields": "userEnteredValue"}})
+        return self
+
+    def rinomina(self, foglio, titolo):
+        self.richieste.append({"updateSheetProperties": {
+            "properties": {"sheetId": foglio.id, "title": titolo}, "fields": "title"}})
+        return self
+
+    def esegui(self):
+        """Invia tutte le mutazioni in una sola richiesta. Ritorna il numero di operazioni inviate."""
+        if not self.richieste:
+            return 0
+        corpo = {"requests": self.richieste}
+        with misura("sheets", "batch_update"):
+            con_ritentativi(lambda: self.db.batch_update(corpo), e_quota_sheets, limitatore=limitatore_sheets)
+        inviate = len(self.richieste)
+        self.richieste = []
+        return inviate
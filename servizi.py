@@ -0,0 +1,62 @@
+import threading
+
+# Registro dei servizi costosi (client Gemini, Google Sheets, Garmin): ogni modulo registra
+# una fabbrica, l'istanza viene costruita solo al primo utilizzo e poi riusata nel processo
+_fabbriche = {}
+_istanze = {}
+# Il lock globale protegge solo i dizionari; la costruzione avviene sotto il lock del servizio,
+# così un login Garmin lento non blocca chi chiede Sheets o Gemini
+_lock = threading.RLock()
+_lock_servizi = {}
+
+def _lock_servizio(nome):
+    with _lock:
+        return _lock_servizi.setdefault(nome, threading.Lock())
+
+def registra(nome, fabbrica, predefinita=False, riusa=True):
+    """Associa una fabbrica al servizio. Con predefinita=True non sovrascrive una fabbrica
+    già registrata (es. un finto servizio installato dai benchmark prima dell'import).
+    Con riusa=False ogni ottieni() richiama la fabbrica (es. sessioni che scadono)."""
+    with _lock:
+        if predefinita and nome in _fabbriche:
+            return
+        _fabbriche[nome] = (fabbrica, riusa)
+        _istanze.pop(nome, None)
+
+def sostituisci(nome, istanza):
+    """Installa direttamente un'istanza già pronta (ha la precedenza su qualsiasi fabbrica)."""
+    with _lock:
+        _fabbriche[nome] = (lambda: istanza, True)
+        _istanze[nome] = istanza
+
+def ottieni(nome):
+    """Istanza del servizio, costruita alla prima richiesta. Una fabbrica che ritorna None
+    (es. login fallito) non viene memorizzata: la richiesta successiva ritenta."""
+    with _lock:
+        if nome in _istanze:
+            return _istanze[nome]
+        if nome not in _fabbriche:
+            raise KeyError(f"Servizio non registrato: {nome}")
+
+    with _lock_servizio(nome):
+        # Doppio controllo: un altro thread può averla costruita mentre attendevamo
+        with _lock:
+            if nome in _istanze:
+                return _istanze[nome]
+            fabbrica, riusa = _fabbriche[nome]
+        istanza = fabbrica()
+        if istanza is None or not riusa:
+            return istanza
+        with _lock:
+            # Una sostituisci() arrivata durante la costruzione ha la precedenza
+            if _fabbriche.get(nome, (None,))[0] is fabbrica:
+                _istanze[nome] = istanza
+            return _istanze.get(nome, istanza)
+
+def dimentica(nome=None):
+    """Scarta l'istanza (o tutte): verrà ricostruita al prossimo utilizzo."""
+    with _lock:
+        if nome is None:
+            _istanze.clear()
+        else:
+            _istanze.pop(nome, None)
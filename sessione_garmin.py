@@ -0,0 +1,74 @@
+import os
+import json
+import base64
+
+FILE_SESSIONE = os.path.join("stato_locale", "sessione_garmin.enc")
+ITERAZIONI_KDF = 200_000
+
+def _cifrario(segreto, sale):
+    """Fernet con chiave derivata (PBKDF2) da GARMIN_TOKEN_KEY o, in mancanza, dalla password Garmin."""
+    try:
+        from cryptography.fernet import Fernet
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    except ImportError:
+        return None
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=sale, iterations=ITERAZIONI_KDF)
+    return Fernet(base64.urlsafe_b64encode(kdf.derive(segreto.encode("utf-8"))))
+
+# garminconnect tratta come percorso di file un tokenstore sotto questa lunghezza
+LUNGHEZZA_MINIMA_TOKENSTORE = 513
+
+def _segreto(password):
+    return os.getenv("GARMIN_TOKEN_KEY") or password
+
+def salva_sessione(client, password):
+    """Cifra su disco i token di sessione (client.client.dumps() di garminconnect)."""
+    segreto = _segreto(password)
+    sale = os.urandom(16)
+    cifrario = _cifrario(segreto, sale) if segreto else None
+    if cifrario is None:
+        print("[CACHE SESSIONE] Libreria 'cryptography' o chiave assente: sessione non salvata.")
+        return False
+
+    try:
+        sessione = {"token": client.client.dumps()}
+        os.makedirs(os.path.dirname(FILE_SESSIONE), exist_ok=True)
+        temporaneo = FILE_SESSIONE + ".tmp"
+        with open(temporaneo, 'wb') as f:
+            f.write(sale + cifrario.encrypt(json.dumps(sessione).encode("utf-8")))
+        os.replace(temporaneo, FILE_SESSIONE)
+        return True
+    except Exception as e:
+        print(f"[CACHE SESSIONE] Impossibile salvare la sessione: {e}")
+        return False
+
+def carica_sessione(email, password):
+    """Ricostruisce un client Garmin autenticato dai token in cache tramite login(tokenstore=...):
+    la libreria rinnova da sé i token in scadenza e, se il rinnovo non riesce, ripiega sulle credenziali.
+    Ritorna None se la cache manca o non è decifrabile, o se anche il login fallisce."""
+    segreto = _segreto(password)
+    if not segreto or not os.path.exists(FILE_SESSIONE):
+        return None
+    try:
+        with open(FILE_SESSIONE, 'rb') as f:
+            contenuto = f.read()
+        cifrario = _cifrario(segreto, contenuto[:16])
+        if cifrario is None:
+            return None
+        token = json.loads(cifrario.decrypt(contenuto[16:]))["token"]
+    except Exception as e:
+        print(f"[CACHE SESSIONE] Sessione in cache non utilizzabile: {e}")
+        return None
+
+    try:
+        from garminconnect import Garmin
+        client = Garmin(email, password)
+        # Spazi in coda ammessi dal JSON: il token non viene scambiato per un percorso
+        client.login(tokenstore=token.ljust(LUNGHEZZA_MINIMA_TOKENSTORE))
+    except Exception as e:
+        print(f"[CACHE SESSIONE] Ripristino della sessione non riuscito: {e}")
+        return None
+    # Token eventualmente rinnovati (o nuovi dopo il ripiego sulle credenziali)
+    salva_sessione(client, password)
+    return client
@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+import datetime
+import multiprocessing
+from multiprocessing.managers import BaseManager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from limitatore import LimitatoreToken, installa_limitatori
+
+CARTELLA_ATLETI = "atleti"
+# Limiti condivisi da tutti gli atleti (stessi valori dei limitatori di processo in
+# estrattore, scrittura_sheets e cervello): la quota è dell'IP / del progetto, non dell'atleta
+LIMITI_CONDIVISI = {"garmin": (2.0, 4), "sheets": (1.0, 10), "gemini": (0.25, 2)}
+
+
+class GestoreLimitatori(BaseManager):
+    """Processo server che ospita i token bucket condivisi: i worker li usano tramite proxy."""
+
+GestoreLimitatori.register("LimitatoreToken", LimitatoreToken)
+
+def leggi_roster(percorso):
+    """Roster JSON: [{"id": "mario", "ambiente": {"GARMIN_EMAIL": "$MARIO_EMAIL", ...}}, ...].
+    I valori che iniziano con '$' sono letti dall'ambiente: i segreti restano fuori dal file."""
+    with open(percorso, 'r', encoding='utf-8') as f:
+        roster = json.load(f)
+    for atleta in roster:
+        atleta["ambiente"] = {
+            chiave: os.getenv(valore[1:], "") if isinstance(valore, str) and valore.startswith("$") else str(valore)
+            for chiave, valore in atleta.get("ambiente", {}).items()
+        }
+    return roster
+
+def esegui_atleta(atleta, limitatori, radice, giorno, forza):
+    """Corpo del worker (processo dedicato): ambiente e cartella dell'atleta, limitatori
+    condivisi, poi la pipeline completa. Ritorna (id, {fase: errore})."""
+    os.environ.update(atleta["ambiente"])
+    # Credenziali Google condivise salvo override nel roster
+    os.environ.setdefault("CREDENZIALI_GOOGLE", os.path.join(radice, "credenziali_google.json"))
+    cartella = os.path.join(radice, CARTELLA_ATLETI, atleta["id"])
+    os.makedirs(cartella, exist_ok=True)
+    # dati_grezzi/ e stato_locale/ sono percorsi relativi: ogni atleta ha i suoi
+    os.chdir(cartella)
+    installa_limitatori(limitatori)
+
+    # Import solo ora: i moduli leggono l'ambiente e i limitatori al caricamento
+    from orchestratore import costruisci_pipeline
+    from metriche import scrivi_rapporto
+    print(f"[ATLETA {atleta['id']}] Avvio pipeline in {cartella}")
+    _, errori = costruisci_pipeline(giorno, forza=forza).esegui()
+    errori = {fase: str(e) for fase, e in errori.items()}
+    scrivi_rapporto(extra={"atleta": atleta["id"], "errori": errori})
+    return atleta["id"], errori
+
+def esegui_squadra(roster, max_workers=4, giorno=None, forza=False):
+    """Pipeline per ogni atleta del roster su un pool di processi. Un atleta in errore
+    non ferma gli altri. Ritorna {id atleta: {fase: errore}} (vuoto se tutto ok)."""
+    giorno = giorno or datetime.date.today()
+    radice = os.path.abspath(os.getcwd())
+    # spawn + un solo task per processo: ambiente, cwd e singleton (client, sessioni) mai riusati tra atleti
+    contesto = multiprocessing.get_context("spawn")
+    esiti = {}
+    with GestoreLimitatori(ctx=contesto) as gestore:
+        limitatori = {nome: gestore.LimitatoreToken(tasso, capacita) for nome, (tasso, capacita) in LIMITI_CONDIVISI.items()}
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=contesto, max_tasks_per_child=1) as executor:
+            futures = {executor.submit(esegui_atleta, atleta, limitatori, radice, giorno, forza): atleta["id"]
+                       for atleta in roster}
+            for future in as_completed(futures):
+                id_atleta = futures[future]
+                try:
+                    _, errori = future.result()
+                except Exception as e:
+                    errori = {"processo": str(e)}
+                esiti[id_atleta] = errori
+                stato = "OK" if not errori else "ERRORE in " + ", ".join(errori)
+                print(f"[ATLETA {id_atleta}] {stato}")
+    return esiti
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python squadra.py roster.json [worker]")
+        sys.exit(1)
+    esiti = esegui_squadra(leggi_roster(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) > 2 else 4)
+    sys.exit(1 if any(esiti.values()) else 0)
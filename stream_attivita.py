@@ -0,0 +1,77 @@
+import os
+# numpy si importa nelle funzioni: all'avvio basta l'elenco dei file (stream_presenti)
+
+CARTELLA_STREAM = os.path.join("dati_grezzi", "stream")
+# Metriche dei dettagli Garmin (metricDescriptors) conservate e relativo nome locale
+METRICHE_STREAM = {
+    "directTimestamp": "timestamp",
+    "sumDuration": "tempo",
+    "sumDistance": "distanza",
+    "directHeartRate": "fc",
+    "directSpeed": "velocita",
+    "directRunCadence": "cadenza",
+    "directElevation": "quota",
+    "directLatitude": "lat",
+    "directLongitude": "lon",
+}
+# Campi dei giri (splits) conservati come array paralleli con prefisso 'giro_'
+CAMPI_GIRI = {"distance": "distanza", "duration": "durata", "averageHR": "fc", "averageSpeed": "velocita"}
+
+def percorso_stream(id_attivita):
+    return os.path.join(CARTELLA_STREAM, f"{id_attivita}.npz")
+
+def stream_presenti():
+    """ID delle attività con stream già archiviati (basta l'elenco dei file)."""
+    if not os.path.isdir(CARTELLA_STREAM):
+        return set()
+    return {nome[:-4] for nome in os.listdir(CARTELLA_STREAM) if nome.endswith(".npz")}
+
+def converti_dettagli(dettagli, giri=None):
+    """Payload JSON dei dettagli (campioni come liste di metriche) -> array tipizzati colonnari.
+    I valori mancanti diventano NaN; il timestamp resta a 64 bit, il resto a 32."""
+    import numpy as np
+    indici = {d["key"]: d["metricsIndex"] for d in (dettagli or {}).get("metricDescriptors", [])}
+    campioni = [c.get("metrics") or [] for c in (dettagli or {}).get("activityDetailMetrics", [])]
+    larghezza = max(indici.values(), default=-1) + 1
+    try:
+        # Caso normale: campioni tutti della stessa lunghezza, conversione in blocco (None -> NaN)
+        matrice = np.array(campioni, dtype=float).reshape(len(campioni), -1)[:, :larghezza]
+    except ValueError:
+        matrice = np.full((len(campioni), larghezza), np.nan)
+        for i, riga in enumerate(campioni):
+            valori = [np.nan if v is None else v for v in riga[:larghezza]]
+            matrice[i, :len(valori)] = valori
+    if matrice.shape[1] < larghezza:
+        matrice = np.pad(matrice, ((0, 0), (0, larghezza - matrice.shape[1])), constant_values=np.nan)
+
+    array = {}
+    for chiave, nome in METRICHE_STREAM.items():
+        if chiave in indici:
+            array[nome] = matrice[:, indici[chiave]].astype(np.float64 if nome == "timestamp" else np.float32)
+
+    laps = (giri or {}).get("lapDTOs") or []
+    for campo, nome in CAMPI_GIRI.items():
+        if laps:
+            array[f"giro_{nome}"] = np.array([np.nan if g.get(campo) is None else g[campo] for g in laps], dtype=np.float32)
+    return array
+
+def salva_stream(id_attivita, dettagli, giri=None):
+    """Archivia gli stream dell'attività in un .npz compresso (scrittura atomica)."""
+    import numpy as np
+    array = converti_dettagli(dettagli, giri)
+    os.makedirs(CARTELLA_STREAM, exist_ok=True)
+    percorso = percorso_stream(id_attivita)
+    temporaneo = percorso + ".tmp"
+    with open(temporaneo, 'wb') as f:
+        np.savez_compressed(f, **array)
+    os.replace(temporaneo, percorso)
+    return array
+
+def leggi_stream(id_attivita):
+    """Array dell'attività come dizionario {metrica: ndarray}, oppure None se non archiviata."""
+    import numpy as np
+    percorso = percorso_stream(id_attivita)
+    if not os.path.exists(percorso):
+        return None
+    with np.load(percorso) as dati:
+        return {nome: dati[nome] for nome in dati.files}
@@ -0,0 +1,17 @@
+import os
+import sys
+import pytest
+
+# I moduli del progetto sono al primo livello del repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from limitatore import LIMITATORI  # noqa: E402
+# Moduli che creano i limitatori all'import: devono esistere prima della fixture
+import cervello, estrattore, scrittura_sheets  # noqa: E402,F401
+
+
+@pytest.fixture(autouse=True)
+def limitatori_senza_attesa(monkeypatch):
+    """I servizi finti non hanno quote: i limitatori reali rallenterebbero solo i test."""
+    for limitatore in LIMITATORI.values():
+        monkeypatch.setattr(limitatore, "tasso", 1e9)
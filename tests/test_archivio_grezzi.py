@@ -0,0 +1,32 @@
+import os
+import datetime
+import pytest
+from archivio_grezzi import salva_grezzo, leggi_giorno, compatta, _percorso
+
+GIORNO = datetime.date(2024, 5, 10)
+
+
+@pytest.fixture(autouse=True)
+def cartella_temporanea(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+def test_versione_identica_non_si_riscrive():
+    assert salva_grezzo("sonno", GIORNO, {"v": 1})
+    assert not salva_grezzo("sonno", GIORNO, {"v": 1})
+    assert salva_grezzo("sonno", GIORNO, {"v": 2})
+    assert leggi_giorno("sonno", GIORNO) == {"v": 2}
+
+def test_cache_degli_hash_segue_il_file():
+    salva_grezzo("sonno", GIORNO, {"v": 1})
+    # Partizione rimossa o sostituita da un altro processo: la cache non deve far saltare il salvataggio
+    os.remove(_percorso("sonno", GIORNO))
+    assert salva_grezzo("sonno", GIORNO, {"v": 1})
+    assert leggi_giorno("sonno", GIORNO) == {"v": 1}
+
+def test_riferimento_a_hash_dopo_compattazione():
+    salva_grezzo("sonno", GIORNO, {"v": 1})
+    salva_grezzo("sonno", GIORNO, {"v": 2})
+    compatta("sonno")
+    # La versione 1 non è più nella partizione: va riscritta con il payload, non come riferimento
+    assert salva_grezzo("sonno", GIORNO, {"v": 1})
+    assert leggi_giorno("sonno", GIORNO) == {"v": 1}
@@ -0,0 +1,63 @@
+import os
+import json
+import datetime
+import pytest
+import backfill
+from benchmark.finti import FintoGarmin, Simulatore
+from backfill import esegui_backfill, genera_chunk, chiave_chunk, FILE_CHECKPOINT, FILE_CHECKPOINT_LEGACY
+
+DAL, AL = datetime.date(2024, 1, 25), datetime.date(2024, 2, 5)
+
+
+@pytest.fixture(autouse=True)
+def cartella_temporanea(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+def test_checkpoint_in_append_e_compattato_alla_fine(monkeypatch):
+    scritture = []
+    registra = backfill.registra_chunk
+    monkeypatch.setattr(backfill, "registra_chunk", lambda log, chunk: scritture.append(chunk) or registra(log, chunk))
+    assert esegui_backfill(DAL, AL, client=FintoGarmin())
+
+    attesi = sorted(chiave_chunk(c) for c in genera_chunk(DAL, AL))
+    assert len(scritture) == len(attesi)
+    with open(FILE_CHECKPOINT, 'r', encoding='utf-8') as f:
+        assert [json.loads(riga) for riga in f] == attesi
+
+def test_ripresa_da_log_troncato_e_checkpoint_legacy():
+    chunk = [chiave_chunk(c) for c in genera_chunk(DAL, AL)]
+    esegui_backfill(DAL, DAL, client=FintoGarmin())
+    # Interruzione a metà di una riga, più il checkpoint della versione precedente
+    with open(FILE_CHECKPOINT, 'a', encoding='utf-8') as f:
+        f.write('"body_battery:2024-01-2')
+    with open(FILE_CHECKPOINT_LEGACY, 'w', encoding='utf-8') as f:
+        json.dump({"completati": [c for c in chunk if c.startswith("sonno:")]}, f)
+
+    simulatore = Simulatore()
+    assert esegui_backfill(DAL, AL, client=FintoGarmin(simulatore))
+    # Riscaricati solo i chunk che nessuno dei due checkpoint dava per completati
+    assert simulatore.chiamate["sonno"] == 0
+    assert simulatore.chiamate["body_battery"] == (AL - DAL).days
+    primo = {chiave_chunk(c) for c in genera_chunk(DAL, DAL)}
+    with open(FILE_CHECKPOINT, 'r', encoding='utf-8') as f:
+        assert [json.loads(riga) for riga in f] == sorted(set(chunk) | primo)
+    assert not os.path.exists(FILE_CHECKPOINT_LEGACY)
+
+def test_interruzione_annulla_i_chunk_in_coda():
+    class GarminInterrotto(FintoGarmin):
+        def get_body_battery(self, inizio, fine=None):
+            if inizio == "2024-01-27":
+                raise KeyboardInterrupt
+            return super().get_body_battery(inizio, fine)
+
+    simulatore = Simulatore()
+    with pytest.raises(KeyboardInterrupt):
+        esegui_backfill(DAL, AL, max_workers=2, client=GarminInterrotto(simulatore))
+    # Scaricati solo i chunk già avviati, non tutta la coda
+    eseguiti = sum(simulatore.chiamate.values())
+    assert eseguiti < len(genera_chunk(DAL, AL)) - 1
+
+    # Alla ripresa si riscaricano solo i chunk non registrati
+    ripresa = Simulatore()
+    assert esegui_backfill(DAL, AL, client=FintoGarmin(ripresa))
+    assert sum(ripresa.chiamate.values()) == len(genera_chunk(DAL, AL)) - eseguiti
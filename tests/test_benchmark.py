@@ -0,0 +1,22 @@
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from benchmark.harness import esegui_scala, normalizza, confronta, FILE_RIFERIMENTO, FASE_CALIBRAZIONE
+
+
+def test_esegui_scala_1x_profilo_locale():
+    # esegui_scala installa limitatori e servizi finti: va isolata in un processo nuovo
+    contesto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=contesto) as executor:
+        esito = executor.submit(esegui_scala, 1, 0, "locale", 100.0, False).result()
+
+    errori = {fase: m["errori"] for fase, m in esito["fasi"].items() if m["errori"]}
+    assert not errori
+    assert esito["fasi"][FASE_CALIBRAZIONE]["min_ms"] > 0
+    assert all(sum(servizio["chiamate"].values()) for servizio in esito["servizi"].values())
+
+    # Il riferimento versionato è in unità di calibrazione e copre tutte le fasi
+    with open(FILE_RIFERIMENTO, 'r', encoding='utf-8') as f:
+        riferimento = json.load(f)
+    assert set(riferimento["locale:1x"]) == set(normalizza(esito))
+    assert isinstance(confronta({"locale:1x": esito}, riferimento), list)
@@ -0,0 +1,49 @@
+import datetime
+import pytest
+from benchmark.finti import FintoSpreadsheet
+from carico_allenamento import ModelloCarico, indicatori_carico
+from magazzino_locale import sincronizza
+from trasformatore import COLONNE_ATTIVITA
+
+
+def _attivita(n):
+    inizio = datetime.date(2024, 1, 1)
+    return [{"ID_Attivita": i, "Data_Ora": f"{inizio + datetime.timedelta(days=i)} 08:00", "Tipo": "running",
+             "Distanza_km": 10.0, "Durata_min": 60.0, "FC_Media": 150, "Calorie": 600} for i in range(n)]
+
+@pytest.fixture(autouse=True)
+def cartella_temporanea(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+def test_modifica_ricalcola_senza_errore():
+    modello = ModelloCarico()
+    attivita = _attivita(20)
+    modello.aggiorna(attivita)
+    atteso = dict(modello.stato)
+
+    # Carico ridotto e poi ripristinato: lo stato torna quello di partenza
+    modello.aggiorna([dict(attivita[3], FC_Media=60)])
+    assert modello.stato["atl"] < atteso["atl"]
+    modello.aggiorna([attivita[3]])
+    assert modello.stato == pytest.approx(atteso)
+
+def test_ricostruzione_indipendente_dall_ordine():
+    diretto, inverso = ModelloCarico(), ModelloCarico()
+    diretto.aggiorna(_attivita(30))
+    inverso.ricostruisci(list(reversed(_attivita(30))))
+    assert inverso.stato == pytest.approx(diretto.stato)
+
+def test_sync_del_magazzino_allinea_il_modello():
+    righe = [COLONNE_ATTIVITA] + [[a[c] for c in COLONNE_ATTIVITA] for a in _attivita(40)]
+    db = FintoSpreadsheet(fogli={"Attivita": righe})
+    sincronizza(db, fogli=("Attivita",))
+    atteso = ModelloCarico(percorso="atteso.json", percorso_registro="registro_atteso.json")
+    atteso.aggiorna(_attivita(40))
+    assert ModelloCarico().stato == pytest.approx(atteso.stato)
+
+    # Foglio accorciato con un'attività vecchia modificata: la risincronizzazione ricostruisce il modello
+    db.worksheet("Attivita").righe = righe[:3] + [righe[3][:5] + [100, 600]] + righe[4:-1]
+    sincronizza(db, fogli=("Attivita",))
+    atteso.ricostruisci([dict(a, FC_Media=100) if a["ID_Attivita"] == 2 else a for a in _attivita(39)])
+    assert ModelloCarico().stato == pytest.approx(atteso.stato)
+    assert indicatori_carico(datetime.date(2024, 2, 8))["Ultimo_Allenamento"] == "2024-02-08"
@@ -0,0 +1,34 @@
+import servizi
+from benchmark.finti import FintoSpreadsheet
+from cervello import recupera_ultima_attivita, recupera_ultimo_dato
+from connessione_sheets import piu_recente
+from magazzino_locale import sincronizza, leggi_foglio
+from trasformatore import COLONNE_ATTIVITA, COLONNE_KPI
+
+
+def _riga(colonne, **valori):
+    return [valori.get(c, "") for c in colonne]
+
+def test_ultimo_record_per_data_e_non_per_posizione(monkeypatch):
+    # Backfill: giornate vecchie accodate dopo quelle recenti
+    sonno = [COLONNE_KPI] + [_riga(COLONNE_KPI, Data=d, Voto_Sonno=v)
+                             for d, v in (("2024-03-01", 70), ("2024-03-02", 81), ("2024-01-15", 60))]
+    attivita = [COLONNE_ATTIVITA] + [_riga(COLONNE_ATTIVITA, ID_Attivita=i, Data_Ora=d)
+                                     for i, d in ((1, "2024-03-02 07:10:00"), (2, "2024-03-02 18:30:00"),
+                                                  (3, "2024-02-20 08:00:00"))]
+    db = FintoSpreadsheet(fogli={"Sonno": sonno, "Attivita": attivita})
+    monkeypatch.setattr(servizi, "ottieni", lambda nome: db)
+
+    assert recupera_ultimo_dato()["Voto_Sonno"] == 81
+    assert recupera_ultima_attivita()["ID_Attivita"] == 2
+
+def test_dashboard_ultima_giornata_con_coda_fuori_ordine(tmp_path, monkeypatch):
+    # Stessa selezione della dashboard, sul mirror locale con una giornata di backfill in coda
+    monkeypatch.chdir(tmp_path)
+    sonno = [COLONNE_KPI] + [_riga(COLONNE_KPI, Data=d, Voto_Sonno=v)
+                             for d, v in (("2024-03-01", 70), ("2024-03-03", 81), ("2024-03-02", 75),
+                                          ("2024-01-15", 60))]
+    sincronizza(FintoSpreadsheet(fogli={"Sonno": sonno}), fogli=("Sonno",))
+    df_sonno = leggi_foglio("Sonno")
+    assert df_sonno.iloc[-1]["Data"] == "2024-01-15"
+    assert piu_recente(df_sonno.to_dict("records"), "Data")["Voto_Sonno"] == 81
@@ -0,0 +1,28 @@
+import pytest
+from benchmark.finti import ServerTelegram, Simulatore
+from consegna_telegram import svuota_outbox, accoda_outbox, _leggi_outbox
+
+
+@pytest.fixture(autouse=True)
+def cartella_temporanea(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+@pytest.fixture
+def server():
+    server = ServerTelegram(Simulatore(prob_quota=1.0), retry_after=0.01).avvia()
+    yield server
+    server.ferma()
+
+def test_outbox_si_ferma_al_primo_errore_e_rispetta_il_tetto(server):
+    for i in range(5):
+        accoda_outbox(f"Messaggio {i}", 1)
+
+    # Telegram in 429: un solo messaggio ritentato, nessuno perso
+    assert svuota_outbox("finto", server.url) == 0
+    assert server.simulatore.chiamate["sendMessage"] == 2
+    assert len(_leggi_outbox()) == 5
+
+    server.simulatore.prob_quota = 0.0
+    assert svuota_outbox("finto", server.url, massimo=3) == 3
+    assert [m["text"] for m in server.messaggi] == ["Messaggio 0", "Messaggio 1", "Messaggio 2"]
+    assert [m["testo"] for m in _leggi_outbox()] == ["Messaggio 3", "Messaggio 4"]
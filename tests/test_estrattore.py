@@ -0,0 +1,30 @@
+import datetime
+import requests
+from benchmark.finti import FintoGarmin
+from estrattore import estrai_dati, scarica_dettagli_attivita, _strumenta_garmin
+from metriche import METRICHE, _hook_risposta
+
+GIORNO = datetime.date(2024, 3, 1)
+
+
+def test_chiamate_garmin_contate_alla_sorgente(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    METRICHE.azzera()
+    garmin = FintoGarmin(giorno_corrente=GIORNO)
+    dati = estrai_dati(garmin, GIORNO)
+    scaricate = scarica_dettagli_attivita(garmin, dati["attivita"][:2])
+    assert len(scaricate) == 2
+    # 3 endpoint giornalieri + dettagli e giri per ciascuna attività
+    assert METRICHE.istantanea()["contatori"]["chiamate.garmin"] == sum(garmin.simulatore.chiamate.values()) == 7
+
+def test_sessioni_garmin_03_strumentate():
+    class Interno:
+        def _fresh_api_session(self):
+            return requests.Session()
+
+    class Client:
+        client = Interno()
+
+    client = _strumenta_garmin(_strumenta_garmin(Client()))
+    sessione = client.client._fresh_api_session()
+    assert sessione.hooks["response"] == [_hook_risposta]
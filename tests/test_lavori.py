@@ -0,0 +1,45 @@
+import time
+from lavori import GestoreLavori
+
+
+class PipelineFinta:
+    fasi = {"carica": None}
+
+    def __init__(self, errori=None):
+        self.errori = errori or {}
+
+    def esegui(self):
+        return {}, self.errori
+
+def _attendi(gestore, id_lavoro):
+    while gestore.stato(id_lavoro)["stato"] in ("in_coda", "in_corso"):
+        time.sleep(0.01)
+    return gestore.stato(id_lavoro)
+
+def test_passo_finale_eseguito_una_volta_e_conservato():
+    chiamate = []
+    def debriefing_ai():
+        chiamate.append(1)
+        return "testo"
+    gestore = GestoreLavori()
+    id_lavoro = gestore.avvia(lambda osservatore: PipelineFinta(), al_termine=debriefing_ai)
+    stato = _attendi(gestore, id_lavoro)
+    # Le letture successive (i rerun della dashboard) non rieseguono il passo finale
+    assert gestore.stato(id_lavoro)["risultato"] == stato["risultato"] == "testo"
+    assert chiamate == [1]
+    assert stato["fasi"]["debriefing_ai"] == "completata"
+
+def test_passo_finale_saltato_se_la_pipeline_fallisce():
+    chiamate = []
+    gestore = GestoreLavori()
+    id_lavoro = gestore.avvia(lambda osservatore: PipelineFinta({"carica": "quota"}), al_termine=lambda: chiamate.append(1))
+    stato = _attendi(gestore, id_lavoro)
+    assert stato["stato"] == "fallito" and stato["risultato"] is None and chiamate == []
+
+def test_errore_del_passo_finale_non_invalida_la_pipeline():
+    def debriefing_ai():
+        raise RuntimeError("Gemini non disponibile")
+    gestore = GestoreLavori()
+    stato = _attendi(gestore, gestore.avvia(lambda osservatore: PipelineFinta(), al_termine=debriefing_ai))
+    assert stato["stato"] == "completato"
+    assert stato["errori"] == {"debriefing_ai": "Gemini non disponibile"}
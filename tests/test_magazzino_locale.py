@@ -0,0 +1,47 @@
+import pytest
+import magazzino_locale
+from benchmark.finti import FintoSpreadsheet
+from magazzino_locale import sincronizza, leggi_foglio
+from trasformatore import COLONNE_ATTIVITA
+
+
+def _righe(n):
+    return [COLONNE_ATTIVITA] + [[i, f"2024-01-01 {i % 24:02d}:00:00", "running", 10.0, 60.0, 150, 600]
+                                 for i in range(1, n + 1)]
+
+def _mirror_uguale(foglio):
+    mirror = leggi_foglio("Attivita")
+    assert mirror.values.tolist() == [list(r) for r in foglio.righe[1:]]
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = FintoSpreadsheet(fogli={"Attivita": _righe(100)})
+    sincronizza(db, fogli=("Attivita",))
+    return db
+
+def test_sync_incrementale_legge_solo_la_coda(db):
+    foglio = db.worksheet("Attivita")
+    foglio.righe.append([101, "2024-01-02 08:00:00", "cycling", 30.0, 90.0, 140, 900])
+    prima = db.simulatore.chiamate["values.get"]
+    assert sincronizza(db, fogli=("Attivita",)) == {"Attivita": 1}
+    assert db.simulatore.chiamate["values.get"] == prima
+    _mirror_uguale(foglio)
+
+def test_riga_vecchia_tolta_si_risincronizza(db):
+    foglio = db.worksheet("Attivita")
+    # Una riga vecchia in meno e una nuova in coda: stesso numero di righe, coda diversa
+    del foglio.righe[10]
+    foglio.righe.append([101, "2024-01-02 08:00:00", "cycling", 30.0, 90.0, 140, 900])
+    sincronizza(db, fogli=("Attivita",))
+    _mirror_uguale(foglio)
+
+def test_valore_vecchio_modificato_con_risincronizzazione_periodica(db, monkeypatch):
+    foglio = db.worksheet("Attivita")
+    foglio.righe[10][5] = 170
+    sincronizza(db, fogli=("Attivita",))
+    assert leggi_foglio("Attivita")["FC_Media"].iloc[9] == 150
+
+    monkeypatch.setattr(magazzino_locale, "INTERVALLO_RISINCRONIZZAZIONE", 0)
+    sincronizza(db, fogli=("Attivita",))
+    _mirror_uguale(foglio)
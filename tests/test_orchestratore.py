@@ -0,0 +1,35 @@
+import datetime
+import shutil
+import pytest
+import servizi
+from benchmark.finti import FintoGarmin, FintoSpreadsheet, storico_su_fogli
+from orchestratore import costruisci_pipeline
+
+GIORNO = datetime.date(2024, 3, 1)
+
+
+@pytest.fixture
+def finti(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    garmin = FintoGarmin(giorno_corrente=GIORNO)
+    db = FintoSpreadsheet(fogli=storico_su_fogli(fine=GIORNO - datetime.timedelta(days=1)))
+    registrati = {"garmin": garmin, "sheets_db": db}
+    monkeypatch.setattr(servizi, "ottieni", lambda nome: registrati[nome])
+    return garmin, db
+
+def test_rerun_stesso_giorno_senza_stream_non_duplica(finti):
+    garmin, db = finti
+    righe_sonno = len(db.worksheet("Sonno").righe)
+    _, errori = costruisci_pipeline(GIORNO, includi_coach=False).esegui()
+    assert not errori
+    assert len(db.worksheet("Sonno").righe) == righe_sonno + 1
+    assert len(db.worksheet("Analisi_Attivita").righe) > 1
+
+    for _ in range(2):
+        # Sul runner gli stream non sopravvivono al giro, le impronte sì
+        shutil.rmtree("dati_grezzi", ignore_errors=True)
+        chiamate_sheets = sum(db.simulatore.chiamate.values())
+        _, errori = costruisci_pipeline(GIORNO, includi_coach=False).esegui()
+        assert not errori
+        assert sum(db.simulatore.chiamate.values()) == chiamate_sheets
+        assert len(db.worksheet("Sonno").righe) == righe_sonno + 1
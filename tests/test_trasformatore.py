@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+import trasformatore
+from archivio_grezzi import salva_grezzo
+from benchmark import dati_sintetici
+from trasformatore import (trasforma_dati_sonno_batteria, trasforma_attivita, trasforma_sonno_colonnare,
+                           trasforma_attivita_colonnare, trasforma_intervallo, COLONNE_KPI, COLONNE_ATTIVITA)
+
+GIORNI = dati_sintetici.giorni_storico(scala=3)
+
+
+def _tipizzato(riga):
+    """Valori con il loro tipo Python: 0 e 0.0 (o 45 e 45.0) non devono risultare uguali."""
+    return [(type(v.item() if isinstance(v, np.generic) else v).__name__, v) for v in riga]
+
+def _casi_sonno():
+    sonno = [dati_sintetici.genera_sonno(g) for g in GIORNI]
+    batteria = [dati_sintetici.genera_body_battery(g) for g in GIORNI]
+    # Casi limite: payload assenti, DTO nullo, campi nulli, serie vuota o tutta nulla, un solo campione
+    sonno[1] = None
+    sonno[2] = {"dailySleepDTO": None}
+    sonno[3] = {"dailySleepDTO": {"sleepTimeSeconds": None, "sleepScores": {"overall": {"value": None}}}}
+    sonno[4] = {"dailySleepDTO": {}}
+    batteria[5] = None
+    batteria[6] = [{"bodyBatteryValuesArray": []}]
+    batteria[7] = [{"bodyBatteryValuesArray": [[1, None], [2, None]]}]
+    batteria[8] = [{"bodyBatteryValuesArray": [[batteria[8][0]["bodyBatteryValuesArray"][0][0], 42]]}]
+    batteria[9] = []
+    batteria[10][0]["bodyBatteryValuesArray"].reverse()
+    return sonno, batteria
+
+def _casi_attivita():
+    attivita = [act for g in GIORNI for act in dati_sintetici.genera_attivita_giorno(g)]
+    attivita[0] = {**attivita[0], "averageHR": None, "calories": None}
+    attivita[1] = {k: v for k, v in attivita[1].items() if k not in ("averageHR", "distance")}
+    attivita[2] = {**attivita[2], "distance": 0, "duration": None, "activityType": None}
+    attivita[3] = {"activityId": 1}
+    return attivita
+
+
+def test_sonno_colonnare_uguale_al_per_record():
+    sonno, batteria = _casi_sonno()
+    attese = [[kpi[c] for c in COLONNE_KPI] for kpi in
+              (trasforma_dati_sonno_batteria(s, b, g) for g, s, b in zip(GIORNI, sonno, batteria))]
+    ottenute = trasforma_sonno_colonnare(GIORNI, sonno, batteria).astype(object).to_numpy().tolist()
+    assert len(ottenute) == len(attese)
+    for giorno, atteso, ottenuto in zip(GIORNI, attese, ottenute):
+        assert _tipizzato(ottenuto) == _tipizzato(atteso), giorno
+
+def test_attivita_colonnare_pareggi_e_nulli():
+    """Distanze/durate che cadono sul mezzo centesimo (dove np.round diverge da round) e campi nulli."""
+    pareggi = [41465.0, 31265.0, 7095, 2675, 1005, 33509.1, 5831.7, 12477.3]
+    attivita = [{"activityId": i, "startTimeLocal": "2024-01-01 08:00:00", "activityType": {"typeKey": "running"},
+                 "distance": d, "duration": d / 10, "averageHR": 150, "calories": 600}
+                for i, d in enumerate(pareggi)]
+    attivita += [{"activityId": 90, "distance": None, "duration": None, "averageHR": None, "calories": None},
+                 {"activityId": 91, "distance": 0, "duration": 0.0, "activityType": None},
+                 {"activityId": 93}]
+    attese = [[act[c] for c in COLONNE_ATTIVITA] for act in trasforma_attivita(attivita)]
+    ottenute = trasforma_attivita_colonnare(attivita).astype(object).to_numpy().tolist()
+    assert [_tipizzato(r) for r in ottenute] == [_tipizzato(r) for r in attese]
+    # Senza la correzione dei pareggi np.round darebbe 41.46 e 31.26
+    assert [r[3] for r in ottenute[:3]] == [41.47, 31.27, 7.09]
+
+def test_valori_nulli_restano_nulli():
+    riga = trasforma_attivita_colonnare(_casi_attivita()[:1]).iloc[0]
+    assert riga["FC_Media"] is None and riga["Calorie"] is None
+
+@pytest.mark.parametrize("scala", [0.1, 1])
+def test_lotti_indipendenti_dalla_dimensione(scala):
+    """Lo stesso giorno dà la stessa riga da solo o dentro un lotto più grande."""
+    giorni = dati_sintetici.giorni_storico(scala)
+    sonno = [dati_sintetici.genera_sonno(g) for g in giorni]
+    batteria = [dati_sintetici.genera_body_battery(g) for g in giorni]
+    lotto = trasforma_sonno_colonnare(giorni, sonno, batteria)
+    singolo = trasforma_sonno_colonnare(giorni[-1:], sonno[-1:], batteria[-1:])
+    assert lotto.iloc[-1].tolist() == singolo.iloc[0].tolist()
+
+def test_intervallo_a_lotti_uguale_al_lotto_unico(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for giorno in GIORNI:
+        # Giornate mancanti nello staging: restano righe con valori N/D
+        if giorno.day % 9:
+            salva_grezzo("sonno", giorno, dati_sintetici.genera_sonno(giorno))
+            salva_grezzo("body_battery", giorno, dati_sintetici.genera_body_battery(giorno))
+        salva_grezzo("attivita", giorno, dati_sintetici.genera_attivita_recenti(giorno, n=5))
+
+    monkeypatch.setattr(trasformatore, "LOTTO_GIORNI", len(GIORNI))
+    kpi_unico, att_unico = trasforma_intervallo(GIORNI[0], GIORNI[-1])
+    monkeypatch.setattr(trasformatore, "LOTTO_GIORNI", 7)
+    kpi_lotti, att_lotti = trasforma_intervallo(GIORNI[0], GIORNI[-1])
+
+    assert len(kpi_lotti) == len(GIORNI)
+    assert [_tipizzato(r) for r in kpi_lotti.values.tolist()] == [_tipizzato(r) for r in kpi_unico.values.tolist()]
+    assert att_lotti.values.tolist() == att_unico.values.tolist()
@@ -1,6 +1,25 @@
 import json
 import os
 import datetime
+import functools
+from itertools import islice
+from archivio_grezzi import leggi_giorno, itera
+from stream_attivita import leggi_stream
+from carico_allenamento import fc_atleta
+# numpy e pandas si importano nelle funzioni che li usano: caricatore e orchestratore importano
+# il modulo all'avvio per costanti e fasi, pandas serve solo ai percorsi colonnari
+
+COLONNE_BB = ["BB_Max", "BB_Min", "BB_Ricarica_h", "BB_Scarica_h", "BB_Recupero_Notte", "BB_Serie"]
+COLONNE_KPI = ["Data", "Voto_Sonno", "Qualita_Sonno", "Ore_Totali", "Body_Battery"] + COLONNE_BB
+# Curva intraday: un punto ogni 15 minuti basta per il grafico e sta comodo in una cella
+PUNTI_SERIE_BB = 96
+# Giorni per lotto in trasforma_intervallo: in memoria restano al più i payload di un lotto
+LOTTO_GIORNI = 92
+COLONNE_ATTIVITA = ["ID_Attivita", "Data_Ora", "Tipo", "Distanza_km", "Durata_min", "FC_Media", "Calorie"]
+# Zone cardiache come frazione della FC massima: Z1 < 60%, Z2 60-70%, ... Z5 >= 90%
+SOGLIE_ZONE = [0.6, 0.7, 0.8, 0.9]
+COLONNE_ANALISI = ["ID_Attivita", "Z1_min", "Z2_min", "Z3_min", "Z4_min", "Z5_min",
+                   "Disaccoppiamento_pct", "Cadenza_Media", "Giri"]
 
 def leggi_json(percorso_file):
     try:
@@ -9,21 +28,101 @@ def leggi_json(percorso_file):
     except FileNotFoundError:
         return None
 
-def trasforma_dati_sonno_batteria(json_sonno, json_batteria):
+def _scarto_locale_ms(dati_bb):
+    """Differenza ora locale - GMT della giornata, dai timestamp testuali del payload."""
+    try:
+        locale = datetime.datetime.fromisoformat(dati_bb["startTimestampLocal"])
+        gmt = datetime.datetime.fromisoformat(dati_bb["startTimestampGMT"])
+        return (locale - gmt).total_seconds() * 1000
+    except Exception:
+        return 0
+
+def _finestra_sonno(json_sonno):
+    """(inizio, fine) GMT in ms della notte, oppure (None, None)."""
+    daily_sleep = json_sonno.get("dailySleepDTO", json_sonno) if isinstance(json_sonno, dict) else None
+    if not isinstance(daily_sleep, dict):
+        return None, None
+    return daily_sleep.get("sleepStartTimestampGMT"), daily_sleep.get("sleepEndTimestampGMT")
+
+def _velocita_h(delta, durate_ms):
+    """Punti/ora da somme esatte (delta interi, durate in ms intere): stesso risultato
+    qualunque sia l'ordine di somma, nel percorso per-record come in quello per lotti."""
+    return round(float(delta / (durate_ms / 3_600_000)), 2) if durate_ms > 0 else 0
+
+def _serie_testo(centri_locali, medie):
+    """Serie ridotta "HH:MM=valore;..." dai centri (datetime64[ms] locali) e dalle medie."""
+    import numpy as np
+    orari = np.datetime_as_string(centri_locali, unit="m")
+    return ";".join(f"{o[11:16]}={int(v)}" for o, v in zip(orari, np.rint(medie)))
+
+def analizza_body_battery(json_batteria, json_sonno=None, punti=PUNTI_SERIE_BB):
+    """Stage serie temporale della Body Battery: carica l'intero bodyBatteryValuesArray in NumPy,
+    calcola min/max, velocità di ricarica e scarica (punti/ora), recupero notturno
+    e una versione ridotta a 'punti' campioni ("HH:MM=valore;...") per il grafico intraday."""
+    import numpy as np
+    stat = {c: "N/D" for c in COLONNE_BB}
+    if not (json_batteria and isinstance(json_batteria, list) and isinstance(json_batteria[0], dict)):
+        return stat
+    try:
+        dati_bb = json_batteria[0]
+        grezzi = dati_bb.get("bodyBatteryValuesArray") or []
+        serie = np.array([(v[0], v[1]) for v in grezzi], dtype=float).reshape(-1, 2)
+        serie = serie[~np.isnan(serie).any(axis=1)]
+        serie = serie[np.argsort(serie[:, 0], kind="stable")]
+        if len(serie) == 0:
+            return stat
+        tempi, valori = serie[:, 0], serie[:, 1]
+
+        stat["BB_Max"] = int(valori.max())
+        stat["BB_Min"] = int(valori.min())
+
+        delta = np.diff(valori)
+        durate = np.diff(tempi)
+        salita, discesa = delta > 0, delta < 0
+        stat["BB_Ricarica_h"] = _velocita_h(delta[salita].sum(), durate[salita].sum())
+        stat["BB_Scarica_h"] = _velocita_h(-delta[discesa].sum(), durate[discesa].sum())
+
+        inizio, fine = _finestra_sonno(json_sonno)
+        if inizio and fine and tempi[0] <= fine and tempi[-1] >= inizio:
+            stat["BB_Recupero_Notte"] = int(round(float(np.interp(fine, tempi, valori) - np.interp(inizio, tempi, valori))))
+
+        # Riduzione a 'punti' intervalli di tempo uguali: media dei campioni in ciascun intervallo
+        bordi = np.linspace(tempi[0], tempi[-1] + 1, punti + 1)
+        secchi = np.clip(np.searchsorted(bordi, tempi, side="right") - 1, 0, punti - 1)
+        conteggi = np.bincount(secchi, minlength=punti)
+        pieni = conteggi > 0
+        medie = np.bincount(secchi, weights=valori, minlength=punti)[pieni] / conteggi[pieni]
+        centri = np.bincount(secchi, weights=tempi, minlength=punti)[pieni] / conteggi[pieni]
+        stat["BB_Serie"] = _serie_testo((centri + _scarto_locale_ms(dati_bb)).astype("datetime64[ms]"), medie)
+    except Exception as e:
+        print(f"Errore analisi serie body battery: {e}")
+    return stat
+
+def _campi_sonno(json_sonno):
+    """(Qualita_Sonno, Voto_Sonno, secondi di sonno) del payload; "N/D" dove la lettura non riesce."""
+    qualita = voto = secondi = "N/D"
+    if json_sonno:
+        try:
+            daily_sleep = json_sonno.get("dailySleepDTO", json_sonno)
+            qualita = daily_sleep.get("sleepScoreFeedback", "N/D")
+            voto = daily_sleep.get("sleepScores", {}).get("overall", {}).get("value", "N/D")
+            secondi = daily_sleep.get("sleepTimeSeconds", 0)
+        except Exception as e:
+            print(f"Errore parsing sonno: {e}")
+    return qualita, voto, secondi
+
+def _kpi_giornata(json_sonno, json_batteria, giorno=None):
+    """Campi scalari della giornata (sonno e ultimo valore Body Battery), senza la serie intraday."""
+    qualita, voto, secondi = _campi_sonno(json_sonno)
     kpi = {
-        "Data": str(datetime.date.today()),
-        "Voto_Sonno": "N/D",
-        "Qualita_Sonno": "N/D",
+        "Data": str(giorno or datetime.date.today()),
+        "Voto_Sonno": voto,
+        "Qualita_Sonno": qualita,
         "Ore_Totali": "N/D",
         "Body_Battery": "N/D"
     }
-    
-    if json_sonno:
+    if secondi != "N/D":
         try:
-            daily_sleep = json_sonno.get("dailySleepDTO", json_sonno)
-            kpi["Qualita_Sonno"] = daily_sleep.get("sleepScoreFeedback", "N/D")
-            kpi["Voto_Sonno"] = daily_sleep.get("sleepScores", {}).get("overall", {}).get("value", "N/D")
-            secondi = daily_sleep.get("sleepTimeSeconds", 0)
             kpi["Ore_Totali"] = round(secondi / 3600, 2) if secondi else 0
         except Exception as e:
             print(f"Errore parsing sonno: {e}")
@@ -40,19 +139,12 @@ def trasforma_dati_sonno_batteria(json_sonno, json_batteria):
                     kpi["Body_Battery"] = valori_validi[-1] 
         except Exception as e:
             print(f"Errore parsing body battery: {e}")
-            
     return kpi
 
-    # Estrazione Body Battery
-    if json_batteria and isinstance(json_batteria, list) and len(json_batteria) > 0:
-        try:
-            dati_bb = json_batteria[0]
-            if "stat" in dati_bb:
-                kpi["Body_Battery_Max"] = dati_bb["stat"].get("highestValue", "N/D")
-                kpi["Body_Battery_Min"] = dati_bb["stat"].get("lowestValue", "N/D")
-        except Exception as e:
-            print(f"Errore parsing body battery: {e}")
-            
+def trasforma_dati_sonno_batteria(json_sonno, json_batteria, giorno=None):
+    kpi = _kpi_giornata(json_sonno, json_batteria, giorno)
+    # Serie intraday completa: statistiche vettoriali e curva ridotta per i grafici
+    kpi.update(analizza_body_battery(json_batteria, json_sonno))
     return kpi
 
 def trasforma_attivita(json_attivita):
@@ -72,7 +164,7 @@ def trasforma_attivita(json_attivita):
             lista_pulita.append({
                 "ID_Attivita": act.get("activityId", "N/D"),
                 "Data_Ora": act.get("startTimeLocal", "N/D"),
-                "Tipo": act.get("activityType", {}).get("typeKey", "Sconosciuto"),
+                "Tipo": (act.get("activityType") or {}).get("typeKey", "Sconosciuto"),
                 "Distanza_km": km,
                 "Durata_min": minuti,
                 "FC_Media": act.get("averageHR", 0),
@@ -83,16 +175,305 @@ def trasforma_attivita(json_attivita):
         
     return lista_pulita
 
+def analizza_stream(id_attivita, stream, fc_max=None):
+    """Analisi vettoriale degli stream di un'attività: minuti per zona cardiaca e
+    disaccoppiamento aerobico (Pa:HR, calo % di velocità/FC tra prima e seconda metà)."""
+    import numpy as np
+    analisi = {c: "N/D" for c in COLONNE_ANALISI}
+    analisi["ID_Attivita"] = id_attivita
+    fc_max = fc_max or fc_atleta()[0]
+    fc = stream.get("fc")
+    tempo = stream.get("tempo")
+    if fc is None or tempo is None or len(fc) < 2:
+        return analisi
+
+    # Durata di ciascun campione: differenza tra istanti consecutivi (il primo vale 0)
+    durata = np.diff(tempo, prepend=tempo[0])
+    valido = np.isfinite(fc) & (fc > 0) & np.isfinite(durata) & (durata >= 0)
+    zona = np.digitize(fc[valido] / fc_max, SOGLIE_ZONE)
+    minuti = np.bincount(zona, weights=durata[valido], minlength=len(SOGLIE_ZONE) + 1) / 60
+    for i, valore in enumerate(minuti, start=1):
+        analisi[f"Z{i}_min"] = round(float(valore), 1)
+
+    velocita = stream.get("velocita")
+    if velocita is not None:
+        utile = valido & np.isfinite(velocita) & (velocita > 0)
+        if utile.sum() >= 2:
+            meta = tempo[utile][0] + (tempo[utile][-1] - tempo[utile][0]) / 2
+            prima = utile & (tempo <= meta)
+            seconda = utile & (tempo > meta)
+            if prima.any() and seconda.any():
+                def efficienza(maschera):
+                    # Medie pesate sul tempo: campionamento Garmin non uniforme
+                    pesi = durata[maschera] + 1e-9
+                    return np.average(velocita[maschera], weights=pesi) / np.average(fc[maschera], weights=pesi)
+                efficienza_1, efficienza_2 = efficienza(prima), efficienza(seconda)
+                analisi["Disaccoppiamento_pct"] = round(float((efficienza_1 - efficienza_2) / efficienza_1 * 100), 2)
+
+    cadenza = stream.get("cadenza")
+    if cadenza is not None and np.isfinite(cadenza).any() and np.nanmax(cadenza) > 0:
+        analisi["Cadenza_Media"] = round(float(np.nanmean(cadenza[cadenza > 0])), 1)
+    if "giro_distanza" in stream:
+        analisi["Giri"] = int(len(stream["giro_distanza"]))
+    return analisi
+
+def trasforma_analisi(id_attivita):
+    """Righe di analisi per le attività con stream archiviati (le altre vengono ignorate)."""
+    righe = []
+    for id_corrente in id_attivita:
+        try:
+            stream = leggi_stream(id_corrente)
+            if stream is not None:
+                righe.append(analizza_stream(id_corrente, stream))
+        except Exception as e:
+            print(f"Errore analisi stream attività {id_corrente}: {e}")
+    return righe
+
+METRICHE_GREZZE = ("sonno", "body_battery", "attivita")
+
+def leggi_dati_grezzi(giorno):
+    """Rilegge dallo staging i payload salvati dall'estrattore per la data indicata
+    (archivio compresso, con ripiego sui vecchi file JSON non ancora migrati)."""
+    return {
+        nome: leggi_giorno(nome, giorno) or leggi_json(os.path.join("dati_grezzi", f"{nome}_{giorno}.json"))
+        for nome in METRICHE_GREZZE
+    }
+
+def trasforma_payload(dati, giorno=None):
+    """Trasforma in memoria i payload grezzi in (kpi giornalieri, lista attività)."""
+    kpi = trasforma_dati_sonno_batteria(dati.get("sonno"), dati.get("body_battery"), giorno)
+    attivita = trasforma_attivita(dati.get("attivita"))
+    return kpi, attivita
+
+# --- PERCORSO COLONNARE (lotti di storico) ---
+# Le funzioni per-record sopra restano l'implementazione di riferimento: i due percorsi
+# producono gli stessi valori riga per riga (tests/test_trasformatore.py).
+
+def _arrotonda(valori, divisore):
+    """Colonna di `round(v / divisore, 2) if v else 0` (le conversioni del per-record) in numpy.
+    np.rint e round() divergono solo sui pareggi al centesimo: quelle righe si ricalcolano con round().
+    I valori falsy danno 0 intero come nel per-record; uno non numerico solleva ValueError/TypeError."""
+    import numpy as np
+    grezzi = np.array([v or 0 for v in valori], dtype=float)
+    x = grezzi / divisore
+    scalati = x * 100
+    risultato = (np.rint(scalati) / 100).tolist()
+    with np.errstate(invalid="ignore"):
+        pareggi = np.flatnonzero(np.abs(scalati - np.floor(scalati) - 0.5) < 1e-6)
+    for i in pareggi:
+        risultato[i] = round(float(x[i]), 2)
+    for i in np.flatnonzero(grezzi == 0):
+        risultato[i] = 0
+    return risultato
+
+@functools.lru_cache(maxsize=None)
+def _intestazione_attivita():
+    """Indice delle colonne attività, costruito una volta: con pandas 3 ogni Index di stringhe costa."""
+    import pandas as pd
+    return pd.Index(COLONNE_ATTIVITA)
+
+def trasforma_attivita_colonnare(json_attivita):
+    """Versione per lotti di trasforma_attivita -> DataFrame con gli stessi valori (e tipi) riga per riga.
+    Ogni colonna si estrae una volta e km/minuti si convertono in blocco; un payload anomalo
+    (campi non numerici o non dizionari) ripiega sul per-record, che ne gestisce gli errori."""
+    import pandas as pd
+    if not json_attivita:
+        return pd.DataFrame(columns=COLONNE_ATTIVITA)
+    try:
+        colonne = {
+            "ID_Attivita": [act.get("activityId", "N/D") for act in json_attivita],
+            "Data_Ora": [act.get("startTimeLocal", "N/D") for act in json_attivita],
+            "Tipo": [(act.get("activityType") or {}).get("typeKey", "Sconosciuto") for act in json_attivita],
+            "Distanza_km": _arrotonda([act.get("distance", 0) for act in json_attivita], 1000),
+            "Durata_min": _arrotonda([act.get("duration", 0) for act in json_attivita], 60),
+            "FC_Media": [act.get("averageHR", 0) for act in json_attivita],
+            "Calorie": [act.get("calories", 0) for act in json_attivita],
+        }
+    except (AttributeError, TypeError, ValueError):
+        return pd.DataFrame(trasforma_attivita(json_attivita), columns=COLONNE_ATTIVITA, dtype=object)
+    # Costruzione per righe: con dtype=object è più rapida di quella da dizionario di colonne
+    return pd.DataFrame(list(zip(*colonne.values())), columns=_intestazione_attivita(), dtype=object)
+
+def _campioni_bb(grezzi):
+    """bodyBatteryValuesArray -> matrice (tempo, valore) con None -> NaN, convertita in blocco."""
+    import numpy as np
+    try:
+        matrice = np.array(grezzi, dtype=float)
+        if matrice.ndim == 2 and matrice.shape[1] >= 2:
+            return matrice[:, :2]
+    except (TypeError, ValueError):
+        pass
+    # Campioni di lunghezza irregolare: conversione elemento per elemento
+    return np.array([(v[0], v[1]) for v in grezzi], dtype=float).reshape(-1, 2)
+
+def _blocchi_bb(lista_batteria):
+    """[(indice giornata, matrice campioni)] delle giornate con una serie Body Battery non vuota."""
+    validi = [i for i, b in enumerate(lista_batteria)
+              if b and isinstance(b, list) and isinstance(b[0], dict)]
+    blocchi = [(i, _campioni_bb(lista_batteria[i][0].get("bodyBatteryValuesArray") or [])) for i in validi]
+    return [(i, c) for i, c in blocchi if len(c)]
+
+def _ultimi_bb(lista_batteria, blocchi):
+    """Body_Battery come in _kpi_giornata (ultimo valore non nullo nell'ordine del payload, col suo
+    tipo originale): posizione trovata in blocco con reduceat, poi una lettura per giornata."""
+    import numpy as np
+    ultimi = ["N/D"] * len(lista_batteria)
+    if not blocchi:
+        return ultimi
+    valori = np.concatenate([c[:, 1] for _, c in blocchi])
+    inizi = np.r_[0, np.cumsum([len(c) for _, c in blocchi])[:-1]]
+    posizioni = np.maximum.reduceat(np.where(np.isnan(valori), -1, np.arange(len(valori))), inizi)
+    for (i, _), inizio, posizione in zip(blocchi, inizi, posizioni):
+        if posizione >= inizio:
+            ultimi[i] = lista_batteria[i][0]["bodyBatteryValuesArray"][posizione - inizio][1]
+    return ultimi
+
+def analizza_body_battery_lotto(lista_batteria, lista_sonno, punti=PUNTI_SERIE_BB, blocchi=None):
+    """Versione per lotti di analizza_body_battery: i campioni di tutte le giornate in un solo
+    array (giornata, tempo, valore) ordinato, statistiche per giornata con reduceat/bincount
+    e interpolazione del recupero notturno su una chiave composta giornata/tempo.
+    Ritorna una lista di dizionari COLONNE_BB, uno per giornata."""
+    import numpy as np
+    n = len(lista_batteria)
+    risultato = [{c: "N/D" for c in COLONNE_BB} for _ in range(n)]
+    blocchi = _blocchi_bb(lista_batteria) if blocchi is None else blocchi
+    if not blocchi:
+        return risultato
+
+    dati = np.column_stack([np.concatenate([np.full(len(c), i, dtype=float) for i, c in blocchi]),
+                            np.concatenate([c for _, c in blocchi])])
+    dati = dati[~np.isnan(dati).any(axis=1)]
+    # Ordine per giornata e, dentro la giornata, per tempo (lexsort è stabile come argsort "stable");
+    # i payload Garmin arrivano già ordinati e in quel caso l'ordinamento si salta
+    if not (np.all(np.diff(dati[:, 0]) >= 0) and np.all((np.diff(dati[:, 1]) >= 0) | (np.diff(dati[:, 0]) > 0))):
+        dati = dati[np.lexsort((dati[:, 1], dati[:, 0]))]
+    if len(dati) == 0:
+        return risultato
+    giornata, tempi, valori = dati[:, 0].astype(np.int64), dati[:, 1], dati[:, 2]
+    giornate, inizi = np.unique(giornata, return_index=True)
+    fini = np.r_[inizi[1:], len(giornata)]
+    segmento = np.repeat(np.arange(len(giornate)), fini - inizi)
+    primo, ultimo = tempi[inizi], tempi[fini - 1]
+
+    massimi = np.maximum.reduceat(valori, inizi)
+    minimi = np.minimum.reduceat(valori, inizi)
+
+    # Differenze consecutive solo dentro la stessa giornata
+    interne = segmento[1:] == segmento[:-1]
+    delta, durate, seg_delta = np.diff(valori)[interne], np.diff(tempi)[interne], segmento[1:][interne]
+    def somma(maschera, pesi):
+        return np.bincount(seg_delta[maschera], weights=pesi[maschera], minlength=len(giornate))
+    salita, discesa = delta > 0, delta < 0
+    su, ms_su = somma(salita, delta), somma(salita, durate)
+    giu, ms_giu = somma(discesa, -delta), somma(discesa, durate)
+
+    # Chiave composta esatta (interi < 2^53): np.interp su tutto il lotto in una chiamata
+    ampiezza = float((ultimo - primo).max() + 1)
+    chiave = segmento * ampiezza + (tempi - primo[segmento])
+    finestre = [_finestra_sonno(lista_sonno[g]) if g < len(lista_sonno) else (None, None) for g in giornate]
+    notti = [k for k, (inizio, fine) in enumerate(finestre)
+             if inizio and fine and primo[k] <= fine and ultimo[k] >= inizio]
+    if notti:
+        k = np.array(notti)
+        def interpola(estremi):
+            istanti = np.clip(np.array(estremi, dtype=float), primo[k], ultimo[k])
+            return np.interp(k * ampiezza + (istanti - primo[k]), chiave, valori)
+        recuperi = interpola([finestre[i][1] for i in notti]) - interpola([finestre[i][0] for i in notti])
+        recuperi = dict(zip(notti, recuperi))
+    else:
+        recuperi = {}
+
+    # Serie ridotta: bordi per giornata (linspace con estremi vettoriali). Intervallo = ultimo bordo <= t,
+    # stimato in aritmetica e corretto di un passo sui bordi veri (differiscono al più per arrotondamento)
+    bordi = np.linspace(primo, ultimo + 1, punti + 1, axis=1)
+    passo = (ultimo + 1 - primo) / punti
+    secchi = np.clip(np.floor((tempi - primo[segmento]) / passo[segmento]).astype(np.int64), 0, punti)
+    secchi -= bordi[segmento, secchi] > tempi
+    successivo = np.minimum(secchi + 1, punti)
+    secchi += (successivo > secchi) & (bordi[segmento, successivo] <= tempi)
+    cella = segmento * punti + np.clip(secchi, 0, punti - 1)
+    celle = len(giornate) * punti
+    conteggi = np.bincount(cella, minlength=celle).reshape(-1, punti)
+    somme_valori = np.bincount(cella, weights=valori, minlength=celle).reshape(-1, punti)
+    somme_tempi = np.bincount(cella, weights=tempi, minlength=celle).reshape(-1, punti)
+
+    for k, g in enumerate(giornate):
+        stat = risultato[g]
+        stat["BB_Max"], stat["BB_Min"] = int(massimi[k]), int(minimi[k])
+        stat["BB_Ricarica_h"] = _velocita_h(su[k], ms_su[k])
+        stat["BB_Scarica_h"] = _velocita_h(giu[k], ms_giu[k])
+        if k in recuperi:
+            stat["BB_Recupero_Notte"] = int(round(float(recuperi[k])))
+        pieni = conteggi[k] > 0
+        centri = somme_tempi[k][pieni] / conteggi[k][pieni]
+        centri_locali = (centri + _scarto_locale_ms(lista_batteria[g][0])).astype("datetime64[ms]")
+        stat["BB_Serie"] = _serie_testo(centri_locali, somme_valori[k][pieni] / conteggi[k][pieni])
+    return risultato
+
+def trasforma_sonno_colonnare(giorni, lista_sonno, lista_batteria):
+    """Versione per lotti di trasforma_dati_sonno_batteria -> DataFrame KPI, stessi valori
+    riga per riga. Dai payload si leggono solo i campi del sonno; ore, ultimo valore e statistiche
+    Body Battery si calcolano in blocco sui campioni di tutto il lotto. Un payload anomalo
+    ripiega sul per-record, che ne gestisce gli errori."""
+    import pandas as pd
+    try:
+        qualita, voti, secondi = zip(*map(_campi_sonno, lista_sonno)) if lista_sonno else ((), (), ())
+        ore = _arrotonda([0 if s == "N/D" else s for s in secondi], 3600)
+        for i, s in enumerate(secondi):
+            if s == "N/D":
+                ore[i] = "N/D"
+        blocchi = _blocchi_bb(lista_batteria)
+        colonne = {
+            "Data": [str(g or datetime.date.today()) for g in giorni],
+            "Voto_Sonno": list(voti),
+            "Qualita_Sonno": list(qualita),
+            "Ore_Totali": ore,
+            "Body_Battery": _ultimi_bb(lista_batteria, blocchi),
+        }
+        stat = analizza_body_battery_lotto(lista_batteria, lista_sonno, blocchi=blocchi)
+        colonne.update({c: [giornata[c] for giornata in stat] for c in COLONNE_BB})
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        righe = [trasforma_dati_sonno_batteria(s, b, g) for g, s, b in zip(giorni, lista_sonno, lista_batteria)]
+        return pd.DataFrame(righe, columns=COLONNE_KPI, dtype=object)
+    return pd.DataFrame(colonne, columns=COLONNE_KPI, dtype=object)
+
+def _per_giorno(giorni, coppie):
+    """Allinea un iteratore ordinato di (giorno, payload) all'elenco dei giorni: None dove manca."""
+    coppie = iter(coppie)
+    corrente = next(coppie, None)
+    for giorno in giorni:
+        while corrente is not None and corrente[0] < giorno:
+            corrente = next(coppie, None)
+        yield corrente[1] if corrente is not None and corrente[0] == giorno else None
+
+def trasforma_intervallo(dal, al):
+    """Trasforma in blocco lo staging di un intervallo di date (es. dopo un backfill).
+    Ritorna (DataFrame KPI giornalieri, DataFrame attività deduplicate)."""
+    import pandas as pd
+    giorni = [dal + datetime.timedelta(days=i) for i in range((al - dal).days + 1)]
+    # Lettura in streaming partizione per partizione, elaborata a lotti di LOTTO_GIORNI giorni
+    sonno = _per_giorno(giorni, itera("sonno", dal, al))
+    batteria = _per_giorno(giorni, itera("body_battery", dal, al))
+    attivita = _per_giorno(giorni, itera("attivita", dal, al))
+
+    blocchi_kpi, blocchi_att = [trasforma_sonno_colonnare([], [], [])], [trasforma_attivita_colonnare([])]
+    for inizio in range(0, len(giorni), LOTTO_GIORNI):
+        lotto = giorni[inizio:inizio + LOTTO_GIORNI]
+        blocchi_kpi.append(trasforma_sonno_colonnare(
+            lotto, list(islice(sonno, len(lotto))), list(islice(batteria, len(lotto)))))
+        # get_activities ripete le stesse attività per più giorni: si deduplica già nel lotto
+        lista = [act for giornata in islice(attivita, len(lotto)) for act in (giornata or [])]
+        blocchi_att.append(trasforma_attivita_colonnare(lista).drop_duplicates(subset="ID_Attivita", keep="first"))
+
+    df_kpi = pd.concat(blocchi_kpi, ignore_index=True)
+    df_att = pd.concat(blocchi_att, ignore_index=True).drop_duplicates(subset="ID_Attivita", keep="first")
+    return df_kpi, df_att.sort_values(by="Data_Ora").reset_index(drop=True)
+
 if __name__ == "__main__":
     oggi = datetime.date.today()
     print(f"--- Avvio Trasformazione per la data {oggi} ---")
     
-    f_sonno = os.path.join("dati_grezzi", f"sonno_{oggi}.json")
-    f_batt = os.path.join("dati_grezzi", f"body_battery_{oggi}.json")
-    f_att = os.path.join("dati_grezzi", f"attivita_{oggi}.json")
-    
-    kpi_giornalieri = trasforma_dati_sonno_batteria(leggi_json(f_sonno), leggi_json(f_batt))
-    attivita_pulite = trasforma_attivita(leggi_json(f_att))
+    kpi_giornalieri, attivita_pulite = trasforma_payload(leggi_dati_grezzi(oggi), oggi)
     
     print("\n[SUCCESSO] Dati Trasformati Correttamente!")
     print(f"KPI Generati: {kpi_giornalieri}")